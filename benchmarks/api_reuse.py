@@ -0,0 +1,70 @@
+# Library API benchmark: compiles many generated units to assembly in one process through
+# src/api.py and reports the throughput and the memory still allocated after every block of
+# units. That memory should stay flat, because no unit leaves state behind for the next one
+#
+#   python benchmarks/api_reuse.py --units 5000 --functions 5 --jobs 1 2
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.gen_program import generate_program
+from src.api import Compiler
+
+def units(count, functions, seeds):
+    # a few distinct programs over and over, so generating them doesn't dominate
+    programs = [generate_program(functions, seed) for seed in range(seeds)]
+    for i in range(count):
+        yield (f"unit{i}", programs[i % seeds])
+
+def measure(compiler, count, functions, jobs, executor, block):
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    samples = []
+    failed = 0
+    start = time.perf_counter()
+    for i, result in enumerate(compiler.compile_many(units(count, functions, 8), jobs=jobs, executor=executor), 1):
+        failed += not result.ok
+        if i % block == 0:
+            gc.collect()
+            samples.append(tracemalloc.get_traced_memory()[0] - baseline)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return {"jobs": jobs, "executor": executor, "units": count, "failed": failed, "seconds": elapsed,
+            "units_per_s": count / elapsed, "retained_bytes": samples}
+
+def main():
+    parser = argparse.ArgumentParser(description="Library API reuse benchmark")
+    parser.add_argument("--units", type=int, default=5000, help="Units to compile")
+    parser.add_argument("--functions", type=int, default=5, help="Functions per generated unit")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1], help="Worker counts to try")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread", help="Pool for more than one job")
+    parser.add_argument("--opt", type=int, default=2, help="Optimization level")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    compiler = Compiler(opt_level=args.opt)
+    block = max(1, args.units // 5)
+    results = []
+    print(f"{'jobs':>5} {'units/s':>9}  retained KiB after every {block} units")
+    for jobs in args.jobs:
+        r = measure(compiler, args.units, args.functions, jobs, args.executor, block)
+        results.append(r)
+        retained = " ".join(f"{b / 1024:.0f}" for b in r["retained_bytes"])
+        failed = f"  ({r['failed']} failed)" if r["failed"] else ""
+        print(f"{jobs:>5} {r['units_per_s']:>9.1f}  {retained}{failed}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"functions": args.functions, "opt": args.opt, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,60 @@
+# AST printing benchmark: `-p` on generated programs of increasing size. Parses each program
+# and streams its tree to a null device as text and as JSON, and reports how long printing
+# takes next to parsing. Per node the printers should cost the same at every size
+#
+#   python benchmarks/ast_print.py --sizes 100 1000 10000
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.compiler_throughput import best_of
+from benchmarks.gen_program import generate_program
+from src.instrument import count_nodes
+from src.lexer import tokenize
+from src.parser import Parser, ASTPrinter
+
+def measure(functions, seed, repeat):
+    tokens = tokenize(generate_program(functions, seed))
+    parse_s, ast = best_of(repeat, lambda: Parser(tokens).parse())
+    nodes = count_nodes(ast)
+    with open(os.devnull, "w") as null:
+        printer = ASTPrinter(null)
+        text_s = best_of(repeat, printer.print, ast)[0]
+        json_s = best_of(repeat, printer.print_json, ast)[0]
+    return {
+        "functions": functions,
+        "nodes": nodes,
+        "parse_s": parse_s,
+        "text_s": text_s,
+        "json_s": json_s,
+        "text_ns_per_node": 1e9 * text_s / nodes,
+        "json_ns_per_node": 1e9 * json_s / nodes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="AST printing benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Program sizes in functions")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the program generator")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"{'functions':>9} {'nodes':>8} {'parse ms':>9} {'text ms':>9} {'json ms':>9} {'text/parse':>10} {'ns/node':>8}")
+    results = []
+    for functions in args.sizes:
+        r = measure(functions, args.seed, args.repeat)
+        results.append(r)
+        print(f"{functions:>9} {r['nodes']:>8} {1000 * r['parse_s']:>9.1f} {1000 * r['text_s']:>9.1f} "
+              f"{1000 * r['json_s']:>9.1f} {r['text_s'] / r['parse_s']:>9.2f}x {r['text_ns_per_node']:>8.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"seed": args.seed, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
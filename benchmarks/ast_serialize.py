@@ -0,0 +1,63 @@
+# AST serialization benchmark: loading a Program from the binary format (src/serialize.py)
+# against lexing and parsing its source again and against pickle, for generated programs of
+# increasing size
+#
+#   python benchmarks/ast_serialize.py --sizes 10 100 1000
+
+import argparse
+import json
+import os
+import pickle
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.compiler_throughput import best_of
+from benchmarks.gen_program import generate_program
+from src.lexer import tokenize
+from src.parser import Parser
+from src.serialize import dumps, loads
+
+def measure(functions, seed, repeat):
+    source = generate_program(functions, seed)
+    parse_s, ast = best_of(repeat, lambda: Parser(tokenize(source)).parse())
+    dumps_s, blob = best_of(repeat, dumps, ast)
+    loads_s, _ = best_of(repeat, loads, blob)
+    pickle_dumps_s, pickled = best_of(repeat, pickle.dumps, ast)
+    pickle_loads_s, _ = best_of(repeat, pickle.loads, pickled)
+    return {
+        "functions": functions,
+        "source_bytes": len(source),
+        "binary_bytes": len(blob),
+        "pickle_bytes": len(pickled),
+        "lex_parse_s": parse_s,
+        "dumps_s": dumps_s,
+        "loads_s": loads_s,
+        "pickle_dumps_s": pickle_dumps_s,
+        "pickle_loads_s": pickle_loads_s,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="AST serialization benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Program sizes in functions")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the program generator")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"{'functions':>9} {'source':>9} {'binary':>9} {'pickle':>9} {'lex+parse':>10} {'loads':>9} {'pickle.loads':>12} {'vs parse':>9}")
+    results = []
+    for size in args.sizes:
+        r = measure(size, args.seed, args.repeat)
+        results.append(r)
+        print(f"{size:>9} {r['source_bytes']:>9} {r['binary_bytes']:>9} {r['pickle_bytes']:>9} "
+              f"{1000 * r['lex_parse_s']:>8.1f}ms {1000 * r['loads_s']:>7.1f}ms {1000 * r['pickle_loads_s']:>10.1f}ms "
+              f"{r['lex_parse_s'] / r['loads_s']:>8.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"seed": args.seed, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
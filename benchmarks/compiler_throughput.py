@@ -0,0 +1,121 @@
+# Compiler throughput benchmark over generated programs of increasing size
+#
+#   python benchmarks/compiler_throughput.py --sizes 1 10 100 1000 --output results.json
+#   python benchmarks/compiler_throughput.py --compare results.json --threshold 0.10
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.gen_program import generate_program
+from src.lexer import tokenize
+from src.parser import Parser
+from src.codegen import ASMGenerator
+from src.instrument import count_nodes, count_instructions
+
+# rate metrics compared against a baseline, higher is better
+RATES = ["tokens_per_s", "nodes_per_s", "instructions_per_s"]
+
+def best_of(repeat, fn, *args):
+    best, value = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+def generate(ast):
+    generator = ASMGenerator()
+    generator.generate(ast)
+    return generator
+
+def measure(functions, seed, repeat):
+    source = generate_program(functions, seed)
+    lex_s, tokens = best_of(repeat, tokenize, source)
+    parse_s, ast = best_of(repeat, lambda: Parser(tokens).parse())
+    codegen_s, generator = best_of(repeat, generate, ast)
+
+    nodes = count_nodes(ast)
+    instructions = count_instructions(generator.assembly)
+    return {
+        "functions": functions,
+        "bytes": len(source),
+        "tokens": len(tokens),
+        "nodes": nodes,
+        "instructions": instructions,
+        "lex_s": lex_s,
+        "parse_s": parse_s,
+        "codegen_s": codegen_s,
+        "tokens_per_s": len(tokens) / lex_s,
+        "nodes_per_s": nodes / parse_s,
+        "instructions_per_s": instructions / codegen_s,
+    }
+
+def compare(results, baseline, threshold):
+    regressions = []
+    baseline_by_size = {r["functions"]: r for r in baseline["results"]}
+    for result in results:
+        base = baseline_by_size.get(result["functions"])
+        if base is None:
+            continue
+        for metric in RATES:
+            change = (result[metric] - base[metric]) / base[metric]
+            flag = "REGRESSION" if change < -threshold else ""
+            print(f"{result['functions']:>8} {metric:<20} {base[metric]:>14.0f} -> {result[metric]:>14.0f}  {100 * change:+7.1f}%  {flag}")
+            if flag:
+                regressions.append((result["functions"], metric, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiler throughput benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000], help="Program sizes in functions (up to 100000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the program generator")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per phase, the fastest one counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against a stored results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    # the parser and printer recurse per nesting level, not per function, so this is only a safety margin
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    print(f"{'functions':>9} {'tokens':>9} {'nodes':>9} {'instrs':>9} {'tokens/s':>12} {'nodes/s':>12} {'instrs/s':>12}")
+    results = []
+    for size in args.sizes:
+        r = measure(size, args.seed, args.repeat)
+        results.append(r)
+        print(f"{r['functions']:>9} {r['tokens']:>9} {r['nodes']:>9} {r['instructions']:>9} "
+              f"{r['tokens_per_s']:>12.0f} {r['nodes_per_s']:>12.0f} {r['instructions_per_s']:>12.0f}")
+
+    data = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {100 * args.threshold:.0f}%")
+            sys.exit(1)
+
+if __name__=="__main__":
+    main()
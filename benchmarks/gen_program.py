@@ -0,0 +1,243 @@
+# Seeded random C program generator covering every construct the parser supports
+#
+#   python benchmarks/gen_program.py --functions 1000 --seed 1 > big.c
+
+import argparse
+import random
+
+BINARY_OPS = ["+", "-", "*", "/", "%", "&", "|", "^", "<<", ">>",
+              "&&", "||", "==", "!=", "<", "<=", ">", ">="]
+UNARY_OPS = ["-", "~", "!"]
+VECTOR_OPS = ["+", "-", "^", "&", "|"]
+ARRAY_SIZES = [1, 2, 4, 8, 16, 32] # powers of two, so `& (size - 1)` keeps indexes in bounds
+
+class ProgramGenerator:
+    def __init__(self, seed=0, max_depth=3):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.functions = []  # (name, parameter count) of everything callable so far
+        self.scopes = []
+        self.memory = {}     # array and pointer names -> how many ints they reach
+        self.pointers = set()
+        self.loop_depth = 0
+        self.counter = 0
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def variables(self):
+        # the ints in scope
+        return [name for scope in self.scopes for name in scope if name not in self.memory]
+
+    def arrays(self):
+        # arrays and pointers in scope, with their sizes; a pointer points into an array or
+        # at an int declared before it, so it never outlives its target
+        return [(name, self.memory[name]) for scope in self.scopes for name in scope if name in self.memory]
+
+    def real_arrays(self):
+        return [(name, size) for name, size in self.arrays() if name not in self.pointers]
+
+    def element(self, depth):
+        # an int in an array or behind a pointer, the index masked into bounds
+        name, size = self.random.choice(self.arrays())
+        if size == 1 and self.random.random() < 0.5:
+            return f"*{name}"
+        if size == 1:
+            return f"{name}[0]"
+        return f"{name}[({self.expression(depth + 1)}) & {size - 1}]"
+
+    def expression(self, depth=0):
+        r = self.random.random()
+        names = self.variables()
+        if depth >= self.max_depth or r < 0.25:
+            if self.arrays() and depth < self.max_depth and self.random.random() < 0.2:
+                return self.element(depth)
+            if names and self.random.random() < 0.6:
+                return self.random.choice(names)
+            return str(self.random.randint(0, 100))
+        if r < 0.55:
+            op = self.random.choice(BINARY_OPS)
+            right = self.expression(depth + 1)
+            if op in ("/", "%"):
+                right = str(self.random.randint(1, 9)) # keep divisors non-zero
+            elif op in ("<<", ">>"):
+                right = str(self.random.randint(0, 7))
+            return f"{self.expression(depth + 1)} {op} {right}"
+        if r < 0.65:
+            return f"{self.random.choice(UNARY_OPS)}{self.atom(depth + 1)}"
+        if r < 0.75:
+            return f"({self.expression(depth + 1)})"
+        if r < 0.85 and self.functions:
+            name, params = self.random.choice(self.functions)
+            args = ", ".join(self.expression(depth + 1) for _ in range(params))
+            return f"{name}({args})"
+        return f"{self.atom(depth + 1)} ? {self.expression(depth + 1)} : {self.atom(depth + 1)}"
+
+    def atom(self, depth):
+        names = self.variables()
+        if names and self.random.random() < 0.5:
+            return self.random.choice(names)
+        if depth < self.max_depth and self.random.random() < 0.3:
+            return f"({self.expression(depth + 1)})"
+        return str(self.random.randint(0, 100))
+
+    def declaration(self):
+        name = self.fresh("v")
+        if self.random.random() < 0.8:
+            text = f"int {name} = {self.expression()};"
+        else:
+            text = f"int {name};"
+        self.scopes[-1].append(name)
+        return text
+
+    def array(self, pad):
+        # filled right away, reading an element before it's written would be undefined
+        name, i = self.fresh("a"), self.fresh("i")
+        size = self.random.choice(ARRAY_SIZES)
+        text = (f"int {name}[{size}];\n"
+                f"{pad}for (int {i} = 0; {i} < {size}; {i} = {i} + 1) {name}[{i}] = {i} * {self.random.randint(1, 9)} + ({self.expression()});")
+        self.scopes[-1].append(name)
+        self.memory[name] = size
+        return text
+
+    def pointer(self):
+        # int *p = &v, = a or = &a[k]
+        name = self.fresh("q")
+        targets = self.variables()
+        arrays = self.real_arrays()
+        if arrays and (not targets or self.random.random() < 0.6):
+            array, size = self.random.choice(arrays)
+            if self.random.random() < 0.5:
+                text, size = f"int *{name} = {array};", size
+            else:
+                text, size = f"int *{name} = &{array}[{self.random.randrange(size)}];", 1
+        else:
+            text, size = f"int *{name} = &{self.random.choice(targets)};", 1
+        self.scopes[-1].append(name)
+        self.memory[name] = size
+        self.pointers.add(name)
+        return text
+
+    def vector_loop(self, pad):
+        # elementwise over arrays of one size, the loops -O2 vectorizes
+        sizes = {}
+        for name, size in self.real_arrays():
+            sizes.setdefault(size, []).append(name)
+        size = self.random.choice(list(sizes))
+        target, a, b = (self.random.choice(sizes[size]) for _ in range(3))
+        i = self.fresh("i")
+        value = f"{a}[{i}] {self.random.choice(VECTOR_OPS)} {self.random.choice([f'{b}[{i}]', str(self.random.randint(0, 100))])}"
+        return f"{pad}for (int {i} = 0; {i} < {size}; {i} = {i} + 1) {target}[{i}] = {value};"
+
+    def block(self, indent, depth):
+        self.scopes.append([])
+        pad = "    " * indent
+        lines = [self.statement(indent + 1, depth + 1) for _ in range(self.random.randint(1, 4))]
+        self.scopes.pop()
+        return "{\n" + "\n".join(lines) + "\n" + pad + "}"
+
+    def statement(self, indent, depth):
+        pad = "    " * indent
+        names = self.variables()
+        choices = ["declaration", "assign", "expression", "return", "array", "pointer"]
+        if self.real_arrays():
+            choices += ["store", "vector_loop"]
+        if depth < self.max_depth:
+            choices += ["if", "if_else", "for", "for_empty", "while", "do", "block", "switch"]
+        if self.loop_depth:
+            choices += ["break", "continue"]
+        kind = self.random.choice(choices)
+
+        if kind == "declaration" or (kind == "assign" and not names):
+            return pad + self.declaration()
+        if kind == "array":
+            return pad + self.array(pad)
+        if kind == "pointer" and (names or self.arrays()):
+            return pad + self.pointer()
+        if kind == "pointer":
+            return pad + self.declaration()
+        if kind == "store":
+            return f"{pad}{self.element(0)} = {self.expression()};"
+        if kind == "vector_loop":
+            return self.vector_loop(pad)
+        if kind == "assign":
+            return f"{pad}{self.random.choice(names)} = {self.expression()};"
+        if kind == "expression":
+            return f"{pad}{self.expression()};"
+        if kind == "return":
+            return f"{pad}return {self.expression()};"
+        if kind == "break":
+            return f"{pad}break;"
+        if kind == "continue":
+            return f"{pad}continue;"
+        if kind == "if":
+            return f"{pad}if ({self.expression()}) {self.block(indent, depth)}"
+        if kind == "if_else":
+            return f"{pad}if ({self.expression()}) {self.block(indent, depth)} else {self.block(indent, depth)}"
+        if kind == "block":
+            return pad + self.block(indent, depth)
+        if kind == "switch":
+            return self.switch(indent, depth)
+
+        self.loop_depth += 1
+        if kind == "for":
+            self.scopes.append([])
+            init = self.declaration()
+            i = self.scopes[-1][-1]
+            text = f"{pad}for ({init} {i} < {self.random.randint(1, 50)}; {i} = {i} + 1) {self.block(indent, depth)}"
+            self.scopes.pop()
+        elif kind == "for_empty":
+            text = f"{pad}for (;;) {self.block(indent, depth)}"
+        elif kind == "while":
+            text = f"{pad}while ({self.expression()}) {self.block(indent, depth)}"
+        else:
+            text = f"{pad}do {self.block(indent, depth)} while ({self.expression()});"
+        self.loop_depth -= 1
+        return text
+
+    def switch(self, indent, depth):
+        # dense or sparse case values, some cases fall through to the next one
+        pad = "    " * indent
+        count = self.random.randint(1, 8)
+        step = self.random.choice([1, 1, 7, 100])
+        values = self.random.sample(range(-count, count * 2), count)
+        lines = [f"{pad}switch ({self.expression()}) {{"]
+        for value in values:
+            lines.append(f"{pad}    case {value * step}: {self.block(indent + 1, depth)}")
+            if self.random.random() < 0.7:
+                lines.append(f"{pad}    break;")
+        if self.random.random() < 0.5:
+            lines.append(f"{pad}    default: {self.block(indent + 1, depth)}")
+        lines.append(pad + "}")
+        return "\n".join(lines)
+
+    def function(self, name, params):
+        param_names = [self.fresh("p") for _ in range(params)]
+        self.scopes = [list(param_names)]
+        # declared before the body so the function can call itself
+        self.functions.append((name, params))
+        body = [self.statement(1, 1) for _ in range(self.random.randint(1, 6))]
+        body.append(f"    return {self.expression()};")
+        signature = ", ".join(f"int {p}" for p in param_names)
+        return f"int {name}({signature}) {{\n" + "\n".join(body) + "\n}\n"
+
+    def generate(self, functions):
+        parts = []
+        for i in range(functions - 1):
+            name, params = f"f{i}", self.random.randint(0, 4)
+            if self.random.random() < 0.1:
+                parts.append(f"int {name}({', '.join(f'int a{k}' for k in range(params))});\n")
+            parts.append(self.function(name, params))
+        parts.append(self.function("main", 0))
+        return "\n".join(parts)
+
+def generate_program(functions, seed=0):
+    return ProgramGenerator(seed).generate(functions)
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Generate a random C program for pycc")
+    parser.add_argument("--functions", type=int, default=100, help="Number of functions, including main")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    print(generate_program(args.functions, args.seed))
@@ -0,0 +1,177 @@
+# If-conversion benchmark: loops whose conditions depend on the data, built with pycc at -O2
+# without the if-convert pass, with it, and with it deciding by a profile of a training run.
+# Every kernel runs over random data (the branches mispredict often) and over the same data
+# sorted (the branches are predictable). The array is long enough that the predictor can't
+# learn the random sequence. First, conditionals whose condition has side effects are built
+# at -O0 and -O2 and run in the VM, and all of them have to return the expected value (the
+# arms must not be computed before such a condition)
+#
+#   python benchmarks/if_convert.py --length 100000 --iterations 500
+#   python benchmarks/if_convert.py --check-only
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.runtime import build_pycc, build_gcc, run
+
+# kernel name -> the loop body over x = a[i]
+KERNELS = {
+    "max": "if (x > m) m = x;",
+    "abs-sum": "s = s + (x < 500 ? 500 - x : x - 500);",
+    "count": "if (x >= 500) c = c + 1;",
+    "clamp": "if (x > 750) { y = 750; } else { y = x; } s = s + y;",
+}
+
+# name -> (program, main's return value)
+SIDE_EFFECT_CHECKS = {
+    "assign-in-if": ("""int main() {
+    int y = 1;
+    int x = 0;
+    if ((y = 7) > 3) x = y; else x = 2;
+    return x;
+}
+""", 7),
+    "call-in-ternary": ("""int bump(int *p) {
+    *p = *p + 10;
+    return 1;
+}
+
+int main() {
+    int y = 1;
+    int x = 0;
+    x = bump(&y) ? y : 3;
+    return x;
+}
+""", 11),
+}
+
+def check_side_effects(tmp):
+    # the names of the checks that returned something else, with their builds
+    failures = []
+    for name, (program, expected) in SIDE_EFFECT_CHECKS.items():
+        source = os.path.join(tmp, f"{name}.c")
+        with open(source, "w") as f:
+            f.write(program)
+        statuses = {}
+        for level in ["-O0", "-O2"]:
+            exe = os.path.join(tmp, f"{name}{level}.exe")
+            build_pycc(source, [level], exe)
+            statuses[level] = run(exe, 1)[1]
+        statuses["--run"] = subprocess.run([sys.executable, "main.py", source, "--run"], cwd=ROOT,
+                                           capture_output=True).returncode
+        wrong = [build for build, status in statuses.items() if status != expected]
+        print(f"{name:<16} expected {expected}: " + ", ".join(f"{build} {status}" for build, status in statuses.items())
+              + ("  MISMATCH" if wrong else ""))
+        failures += [f"{name} {build}" for build in wrong]
+    return failures
+
+def kernel_program(body, length, iterations, data):
+    lines = [
+        "int main() {",
+        f"    int a[{length}];",
+        "    int seed = 12345;",
+        f"    for (int i = 0; i < {length}; i = i + 1) {{",
+        "        seed = (seed * 1103515245 + 12345) & 2147483647;",
+        "        a[i] = (seed >> 16) % 1000;",
+        "    }",
+    ]
+    if data == "sorted":
+        # counting sort, the values are below 1000
+        lines += [
+            "    int counts[1000];",
+            "    for (int v = 0; v < 1000; v = v + 1) counts[v] = 0;",
+            f"    for (int i = 0; i < {length}; i = i + 1) counts[a[i]] = counts[a[i]] + 1;",
+            "    int n = 0;",
+            "    for (int v = 0; v < 1000; v = v + 1) {",
+            "        for (int j = 0; j < counts[v]; j = j + 1) { a[n] = v; n = n + 1; }",
+            "    }",
+        ]
+    lines += [
+        "    int check = 0;",
+        f"    for (int r = 0; r < {iterations}; r = r + 1) {{",
+        "        int m = 0;",
+        "        int s = 0;",
+        "        int c = 0;",
+        "        int y = 0;",
+        f"        for (int i = 0; i < {length}; i = i + 1) {{",
+        "            int x = a[i] ^ (r & 1);",
+        f"            {body}",
+        "        }",
+        "        check = (check + m + s + c) % 65536;",
+        "    }",
+        "    return check % 256;",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="If-conversion benchmark")
+    parser.add_argument("--kernels", nargs="+", default=list(KERNELS), choices=list(KERNELS), help="Kernels to run")
+    parser.add_argument("--data", nargs="+", default=["random", "sorted"], choices=["random", "sorted"], help="Input orders")
+    parser.add_argument("--length", type=int, default=100000, help="Array length")
+    parser.add_argument("--iterations", type=int, default=500, help="Passes over the array per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per build, the median counts")
+    parser.add_argument("--check-only", action="store_true", help="Only run the side effect checks")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = check_side_effects(tmp)
+    if failures:
+        sys.exit(f"Miscompiled: {', '.join(failures)}")
+    if args.check_only:
+        return
+    print()
+
+    configs = [("branch", ["-O2", "-fno-if-convert"]), ("cmov", ["-O2"]), ("profile", None)]
+    print(f"{'kernel':<8} {'data':<7} {'build':<7} {'median ms':>10} {'speedup':>8}  exit")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for kernel in args.kernels:
+            for data in args.data:
+                source = os.path.join(tmp, f"{kernel}-{data}.c")
+                with open(source, "w") as f:
+                    f.write(kernel_program(KERNELS[kernel], args.length, args.iterations, data))
+                expected = None
+                if shutil.which("gcc"):
+                    build_gcc(source, ["-O0"], source[:-2] + ".gcc")
+                    expected = run(source[:-2] + ".gcc", 1)[1]
+
+                baseline = None
+                for label, flags in configs:
+                    exe = os.path.join(tmp, f"{kernel}-{data}-{label}.exe")
+                    if flags is None:
+                        # the profile's branch bias replaces the guessed misprediction rate
+                        profile = os.path.join(tmp, f"{kernel}-{data}.profile")
+                        build_pycc(source, ["-O2", "--profile-generate", profile], exe)
+                        subprocess.run([exe])
+                        flags = ["-O2", "--profile-use", profile]
+                    build_pycc(source, flags, exe)
+                    median, status = run(exe, args.repeat)
+                    expected = status if expected is None else expected
+                    baseline = median if baseline is None else baseline
+                    check = "" if status == expected else "  MISMATCH"
+                    print(f"{kernel:<8} {data:<7} {label:<7} {1000 * median:>10.2f} {baseline / median:>7.2f}x  {status}{check}")
+                    results.append({
+                        "kernel": kernel,
+                        "data": data,
+                        "build": label,
+                        "median_s": median,
+                        "speedup": baseline / median,
+                        "exit_status": status,
+                    })
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"length": args.length, "iterations": args.iterations, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
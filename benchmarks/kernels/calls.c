@@ -0,0 +1,19 @@
+int depth(int n, int acc) {
+    if (n == 0) {
+        return acc;
+    }
+    return depth(n - 1, acc + n % 3);
+}
+
+int leaf(int x) { return x + 1; }
+int mid(int x) { return leaf(x) * 2; }
+int top(int x) { return mid(x) - leaf(x); }
+
+int main() {
+    int total = 0;
+    for (int i = 0; i < 2000; i = i + 1) {
+        total = (total + depth(1000, i)) % 99991;
+        total = (total + top(i)) % 99991;
+    }
+    return total % 256;
+}
@@ -0,0 +1,7 @@
+int main() {
+    int s = 0;
+    for (int i = 1; i < 3000000; i = i + 1) {
+        s = (s + 1000003 / i + i % 7) % 1000000007;
+    }
+    return s % 256;
+}
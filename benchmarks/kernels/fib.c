@@ -0,0 +1,11 @@
+int fib(int n) {
+    if (n == 0 || n == 1) {
+        return n;
+    } else {
+        return fib(n - 1) + fib(n - 2);
+    }
+}
+
+int main() {
+    return fib(30) % 256;
+}
@@ -0,0 +1,10 @@
+int main() {
+    int h = 5381;
+    int i = 0;
+    while (i < 5000000) {
+        h = ((h << 5) + h + (i & 255)) & 16777215;
+        h = h ^ (h >> 7);
+        i = i + 1;
+    }
+    return h % 256;
+}
@@ -0,0 +1,9 @@
+int main() {
+    int sum = 0;
+    for (int i = 0; i < 2000; i = i + 1) {
+        for (int j = 0; j < 2000; j = j + 1) {
+            sum = sum + (i * j) % 7;
+        }
+    }
+    return sum % 256;
+}
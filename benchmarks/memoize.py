@@ -0,0 +1,92 @@
+# Memoization benchmark: exponentially recursive pure functions (fib and binomial
+# coefficients), built at -O2 with and without --memoize for a few memo table sizes. A
+# training run with --profile-generate records the hit rates, which the --profile-use build
+# reports
+#
+#   python benchmarks/memoize.py --n 32 --entries 64 4096
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.runtime import build_pycc, build_gcc, run
+
+def workload(n):
+    return f"""int fib(int n) {{
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}}
+
+int binom(int n, int k) {{
+    if (k == 0 || k == n) return 1;
+    return binom(n - 1, k - 1) + binom(n - 1, k);
+}}
+
+int main() {{
+    return (fib({n}) + binom({n - 6}, {(n - 6) // 2})) % 256;
+}}
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoization benchmark")
+    parser.add_argument("--n", type=int, default=32, help="Argument of fib, binom gets n - 6")
+    parser.add_argument("--entries", type=int, nargs="+", default=[64, 4096], help="Memo table sizes to try")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per build, the median counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "workload.c")
+        with open(source, "w") as f:
+            f.write(workload(args.n))
+
+        expected = None
+        if shutil.which("gcc"):
+            build_gcc(source, ["-O0"], os.path.join(tmp, "gcc.exe"))
+            expected = run(os.path.join(tmp, "gcc.exe"), 1)[1]
+
+        print(f"{'build':<16} {'median ms':>10} {'speedup':>8}  exit")
+        baseline = None
+        reports = []
+        for entries in [None] + args.entries:
+            label = "plain" if entries is None else f"memoize {entries}"
+            flags = ["-O2"] if entries is None else ["-O2", "--memoize", str(entries)]
+            exe = os.path.join(tmp, f"build{entries}.exe")
+            build_pycc(source, flags, exe)
+            median, status = run(exe, args.repeat)
+            expected = status if expected is None else expected
+            baseline = median if baseline is None else baseline
+            check = "" if status == expected else "  MISMATCH"
+            print(f"{label:<16} {1000 * median:>10.2f} {baseline / median:>7.2f}x  {status}{check}")
+            result = {"build": label, "median_s": median, "speedup": baseline / median, "exit_status": status}
+
+            if entries is not None:
+                # the hit rates of this table size, from a training run
+                profile = os.path.join(tmp, f"memo{entries}.profile")
+                build_pycc(source, flags + ["--profile-generate", profile], os.path.join(tmp, "instrumented.exe"))
+                subprocess.run([os.path.join(tmp, "instrumented.exe")])
+                out = subprocess.run([sys.executable, "main.py", source, *flags, "--profile-use", profile,
+                                      "--output-dir", tmp, "-o", "profiled.exe"],
+                                     cwd=ROOT, check=True, capture_output=True, text=True).stdout
+                report = out[out.index("Memoized"):].strip()
+                reports.append(report)
+                result["report"] = report
+            results.append(result)
+
+        print()
+        print("\n".join(reports))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"n": args.n, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,77 @@
+# Input benchmark: reading a large generated source into a str and lexing it against mapping
+# it and lexing the bytes in place (--mmap); every run is its own process, so peak RSS
+# is that of one mode
+#
+#   python benchmarks/mmap_input.py --functions 20000
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.gen_program import generate_program
+
+def lex_file(path, mode):
+    # runs in the child: read and lex like main.py does, values of names are read like the parser does
+    from src.lexer import tokenize, tokenize_bytes
+    from src.tokentype import TokenType
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "mmap":
+        import mmap
+        with open(path, "rb") as f:
+            tokens = tokenize_bytes(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    else:
+        with open(path, "r") as f:
+            tokens = tokenize(f.read())
+    values = sum(len(t.value) for t in tokens if t.type in (TokenType.IDENTIFIER, TokenType.NUMBER))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    print(json.dumps({"seconds": elapsed, "peak_kb": peak, "tokens": len(tokens), "values": values}))
+
+def main():
+    parser = argparse.ArgumentParser(description="str vs mmap input benchmark")
+    parser.add_argument("--functions", type=int, default=20000, help="Functions in the generated program")
+    parser.add_argument("--copies", type=int, default=1, help="Times the program is repeated in the file")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the program generator")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, the fastest one counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        lex_file(*args.child)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "input.c")
+        with open(source, "w") as f:
+            program = generate_program(args.functions, args.seed)
+            for _ in range(args.copies):
+                f.write(program)
+        size = os.path.getsize(source)
+        print(f"{size / 2**20:.1f} MiB of source")
+        print(f"{'mode':<5} {'best s':>8} {'peak MiB':>9} {'tokens':>10}")
+        for mode in ("str", "mmap"):
+            runs = []
+            for _ in range(args.repeat):
+                out = subprocess.run([sys.executable, __file__, "--child", source, mode], capture_output=True, text=True, check=True)
+                runs.append(json.loads(out.stdout))
+            best = min(runs, key=lambda r: r["seconds"])
+            peak = min(r["peak_kb"] for r in runs) / 1024
+            print(f"{mode:<5} {best['seconds']:>8.3f} {peak:>9.1f} {best['tokens']:>10}")
+            results.append({"mode": mode, "seconds": best["seconds"], "peak_mib": peak, "tokens": best["tokens"]})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"bytes": size, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,66 @@
+# Parallel lexing benchmark: lexes a large generated program sequentially and split over
+# 1..N processes, checks that every token (type, value, line, column) matches the
+# sequential lexer and reports the speedup for each number of jobs
+#
+#   python benchmarks/parallel_lex.py --functions 20000 --jobs 1 2 4 8
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.gen_program import generate_program
+from src.lexer import tokenize, tokenize_parallel
+
+def best_of(repeat, fn, *args):
+    best, value = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+def token_tuples(tokens):
+    return [(t.type, t.value, t.line, t.column) for t in tokens]
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Parallel lexing benchmark")
+    parser.add_argument("--functions", type=int, default=20000, help="Functions in the generated program")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the program generator")
+    parser.add_argument("--jobs", type=int, nargs="+", help="Numbers of processes to try (defaults to 1, 2, 4, ... up to the cores)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per setting, the fastest one counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    jobs = args.jobs or sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+
+    source = generate_program(args.functions, args.seed)
+    sequential_s, expected = best_of(args.repeat, tokenize, source)
+    expected = token_tuples(expected)
+    print(f"{len(source) / 2**20:.1f} MiB, {len(expected)} tokens, {cores} core(s)")
+    print(f"{'jobs':>5} {'best s':>8} {'speedup':>8}  tokens")
+    print(f"{'seq':>5} {sequential_s:>8.3f} {1:>7.2f}x  reference")
+
+    results = []
+    failed = False
+    for n in jobs:
+        elapsed, tokens = best_of(args.repeat, tokenize_parallel, source, n)
+        same = token_tuples(tokens) == expected
+        failed = failed or not same
+        print(f"{n:>5} {elapsed:>8.3f} {sequential_s / elapsed:>7.2f}x  {'identical' if same else 'MISMATCH'}")
+        results.append({"jobs": n, "seconds": elapsed, "speedup": sequential_s / elapsed, "identical": same})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"bytes": len(source), "tokens": len(expected), "cores": cores,
+                       "sequential_s": sequential_s, "results": results}, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,95 @@
+# Profile-guided optimization benchmark: a workload with heavily skewed branches and small
+# hot helpers, built at -O2 without a profile and with one recorded by an instrumented
+# training run
+#
+#   python benchmarks/pgo.py --iterations 2000000
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.runtime import build_pycc, build_gcc, run
+
+def workload(iterations):
+    return f"""int clamp(int x, int hi) {{
+    if (x > hi) return hi;
+    return x;
+}}
+
+int bucket(int x) {{
+    if (x % 251 == 0) {{
+        return x / 251 + 1000;
+    }} else {{
+        return x & 15;
+    }}
+}}
+
+int main() {{
+    int s = 0;
+    int seed = 1;
+    for (int i = 0; i < {iterations}; i = i + 1) {{
+        seed = (seed * 75 + 74) % 65537;
+        if (seed < 16) {{
+            s = s + seed * 3;
+        }}
+        s = (s + clamp(seed, 65000) + bucket(seed)) % 1000003;
+        int k = seed & 7;
+        while (k < 12) {{
+            k = k + 1;
+            s = s ^ k;
+        }}
+    }}
+    return s % 256;
+}}
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile-guided optimization benchmark")
+    parser.add_argument("--iterations", type=int, default=2000000, help="Iterations of the workload's main loop")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per build, the median counts")
+    parser.add_argument("--opt", default="-O2", help="pycc optimization level of both builds")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "workload.c")
+        with open(source, "w") as f:
+            f.write(workload(args.iterations))
+        profile = os.path.join(tmp, "workload.profile")
+
+        expected = None
+        if shutil.which("gcc"):
+            build_gcc(source, ["-O0"], os.path.join(tmp, "gcc.exe"))
+            expected = run(os.path.join(tmp, "gcc.exe"), 1)[1]
+
+        # the training run writes the profile the last build reads
+        build_pycc(source, [args.opt, "--profile-generate", profile], os.path.join(tmp, "instrumented.exe"))
+        subprocess.run([os.path.join(tmp, "instrumented.exe")])
+
+        print(f"{'build':<13} {'median ms':>10} {'speedup':>8}  exit")
+        baseline = None
+        for label, flags in (("plain", [args.opt]), ("instrumented", None), ("profile-use", [args.opt, "--profile-use", profile])):
+            exe = os.path.join(tmp, f"{label}.exe")
+            if flags is not None:
+                build_pycc(source, flags, exe)
+            median, status = run(exe, args.repeat)
+            expected = status if expected is None else expected
+            baseline = median if baseline is None else baseline
+            check = "" if status == expected else "  MISMATCH"
+            print(f"{label:<13} {1000 * median:>10.2f} {baseline / median:>7.2f}x  {status}{check}")
+            results.append({"build": label, "median_s": median, "speedup": baseline / median, "exit_status": status})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"iterations": args.iterations, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
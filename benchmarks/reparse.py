@@ -0,0 +1,79 @@
+# Incremental front end benchmark: latency of an edit to a Document against lexing and
+# parsing the whole file again, for growing files
+#
+#   python benchmarks/reparse.py --sizes 10 100 1000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.gen_program import generate_program
+from src.lexer import tokenize
+from src.parser import Parser
+from src.document import Document
+
+# edits in the middle of the file: a longer expression, a new line and a new function
+EDITS = {
+    "expression": lambda text, at: (text.index(";", at), 0, " + 1"),
+    "newline": lambda text, at: (text.index(";", at) + 1, 0, "\n"),
+    "function": lambda text, at: (text.index("\nint ", at) + 1, 0, "int added(int a) { return a * 2; }\n"),
+}
+
+def measure(functions, seed, repeat):
+    text = generate_program(functions, seed)
+    start = time.perf_counter()
+    Parser(tokenize(text)).parse()
+    full_s = time.perf_counter() - start
+
+    document = Document(text)
+    middle = text.index("return", len(text) // 2)
+    rows = []
+    for name, edit in EDITS.items():
+        offset, deleted, inserted = edit(document.text, middle)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            document.edit(offset, deleted, inserted)
+            document.program()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            relexed, reparsed = document.relexed, document.reparsed
+            document.edit(offset, len(inserted), "")    # undo
+        rows.append({
+            "functions": functions,
+            "edit": name,
+            "full_s": full_s,
+            "edit_s": best,
+            "relexed_tokens": relexed,
+            "reparsed_tokens": reparsed,
+            "speedup": full_s / best,
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental re-lex/re-parse benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Functions per generated file")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the generated programs")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per edit, the best counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"{'functions':>9} {'edit':<11} {'full ms':>9} {'edit ms':>9} {'relexed':>8} {'reparsed':>9} {'speedup':>8}")
+    results = []
+    for functions in args.sizes:
+        for row in measure(functions, args.seed, args.repeat):
+            results.append(row)
+            print(f"{row['functions']:>9} {row['edit']:<11} {1000 * row['full_s']:>9.2f} {1000 * row['edit_s']:>9.2f} "
+                  f"{row['relexed_tokens']:>8} {row['reparsed_tokens']:>9} {row['speedup']:>7.0f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"seed": args.seed, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
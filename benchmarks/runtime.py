@@ -0,0 +1,109 @@
+# Runtime benchmark of generated code: builds every kernel in benchmarks/kernels with pycc
+# and gcc, runs each build repeatedly and reports median runtime, instruction count
+# (with `perf stat`, when available) and code size
+#
+#   python benchmarks/runtime.py --repeat 5 --output runtime.json
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KERNELS = os.path.join(ROOT, "benchmarks", "kernels")
+
+# (label, extra flags) of every compiler configuration that gets benchmarked
+PYCC_CONFIGS = [("pycc -O0", ["-O0"]), ("pycc -O1", ["-O1"]), ("pycc -O2", ["-O2"])]
+GCC_CONFIGS = [("gcc -O0", ["-O0"]), ("gcc -O2", ["-O2"])]
+
+def build_pycc(source, flags, exe):
+    output_dir, name = os.path.split(exe)
+    subprocess.run([sys.executable, "main.py", source, "--output-dir", output_dir, "-o", name, *flags],
+                   cwd=ROOT, check=True, capture_output=True)
+    if not os.path.exists(exe):
+        raise RuntimeError(f"pycc did not produce {exe} (are nasm and gcc installed?)")
+
+def build_gcc(source, flags, exe):
+    subprocess.run(["gcc", "-w", *flags, source, "-o", exe], check=True, capture_output=True)
+
+def text_size(exe):
+    if shutil.which("size"):
+        out = subprocess.run(["size", "-A", exe], capture_output=True, text=True).stdout
+        for line in out.splitlines():
+            parts = line.split()
+            if parts and parts[0] == ".text":
+                return int(parts[1])
+    return os.path.getsize(exe)
+
+def instruction_count(exe):
+    if not shutil.which("perf"):
+        return None
+    proc = subprocess.run(["perf", "stat", "-x", ",", "-e", "instructions:u", exe], capture_output=True, text=True)
+    for line in proc.stderr.splitlines():
+        fields = line.split(",")
+        if len(fields) > 2 and fields[2].startswith("instructions") and fields[0].isdigit():
+            return int(fields[0])
+    return None
+
+def run(exe, repeat):
+    times, status = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status = subprocess.run([exe]).returncode
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), status
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime benchmark of pycc generated code")
+    parser.add_argument("--kernels", nargs="+", help="Kernel names to run (default: all in benchmarks/kernels)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per build, the median counts")
+    parser.add_argument("--no-gcc", action="store_true", help="Only benchmark pycc builds")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    kernels = args.kernels or sorted(os.path.splitext(f)[0] for f in os.listdir(KERNELS) if f.endswith(".c"))
+    configs = [(label, flags, build_pycc) for label, flags in PYCC_CONFIGS]
+    if not args.no_gcc:
+        configs += [(label, flags, build_gcc) for label, flags in GCC_CONFIGS]
+
+    print(f"{'kernel':<10} {'compiler':<12} {'median ms':>10} {'instructions':>14} {'.text bytes':>12}  exit")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for kernel in kernels:
+            source = os.path.join(KERNELS, kernel + ".c")
+            expected = None
+            for i, (label, flags, build) in enumerate(configs):
+                exe = os.path.join(tmp, f"{kernel}-{i}.exe")
+                try:
+                    build(source, flags, exe)
+                except (subprocess.CalledProcessError, RuntimeError) as e:
+                    print(f"{kernel:<10} {label:<12} build failed: {e}")
+                    continue
+
+                median, status = run(exe, args.repeat)
+                instructions = instruction_count(exe)
+                size = text_size(exe)
+                # every build of a kernel has to agree on its exit status
+                expected = status if expected is None else expected
+                check = "" if status == expected else "  MISMATCH"
+                print(f"{kernel:<10} {label:<12} {1000 * median:>10.2f} {instructions if instructions is not None else '-':>14} {size:>12}  {status}{check}")
+                results.append({
+                    "kernel": kernel,
+                    "compiler": label,
+                    "median_s": median,
+                    "instructions": instructions,
+                    "text_bytes": size,
+                    "exit_status": status,
+                })
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
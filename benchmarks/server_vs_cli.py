@@ -0,0 +1,89 @@
+# Compares compiling many tiny files with the cold-start CLI against the warm compile server
+#
+#   python benchmarks/server_vs_cli.py --files 50 --clients 4
+#
+# Without --assemble both sides stop after code generation, so nasm/gcc are not needed.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROGRAM = """int square(int x) {{
+    return x * x;
+}}
+
+int main() {{
+    int n = {n};
+    return square(n) % 256;
+}}
+"""
+
+def write_sources(directory, count):
+    files = []
+    for i in range(count):
+        path = os.path.join(directory, f"unit{i}.c")
+        with open(path, "w") as f:
+            f.write(PROGRAM.format(n=i))
+        files.append(path)
+    return files
+
+def run(cmd):
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, cwd=ROOT)
+
+def cold_cli(files, output_dir, assemble):
+    for path in files:
+        if assemble:
+            run([sys.executable, "main.py", path, "--output-dir", output_dir])
+        else:
+            run([sys.executable, "main.py", "-cg", path])
+
+def warm_client(files, output_dir, assemble, socket_path, clients):
+    def compile_one(path):
+        cmd = [sys.executable, "client.py", "--socket", socket_path, "--output-dir", output_dir, path]
+        if not assemble:
+            cmd.append("-S")
+        run(cmd)
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(compile_one, files))
+
+def timed(label, count, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f}s  {1000 * elapsed / count:8.2f} ms/file")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start CLI vs. warm compile server")
+    parser.add_argument("--files", type=int, default=50, help="Number of tiny source files")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients talking to the server")
+    parser.add_argument("--assemble", action="store_true", help="Also run nasm/gcc on every unit")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_sources(tmp, args.files)
+        output_dir = os.path.join(tmp, "out")
+        socket_path = os.path.join(tmp, "pycc.sock")
+
+        server = subprocess.Popen([sys.executable, "main.py", "--serve", socket_path], cwd=ROOT, stdout=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+
+            cold = timed("cold CLI", args.files, cold_cli, files, output_dir, args.assemble)
+            warm = timed("server, 1 client", args.files, warm_client, files, output_dir, args.assemble, socket_path, 1)
+            concurrent = timed(f"server, {args.clients} clients", args.files, warm_client,
+                               files, output_dir, args.assemble, socket_path, args.clients)
+        finally:
+            run([sys.executable, "client.py", "--socket", socket_path, "--stop"])
+            server.wait()
+
+    print(f"speedup: {cold / warm:.2f}x (1 client), {cold / concurrent:.2f}x ({args.clients} clients)")
+
+if __name__=="__main__":
+    main()
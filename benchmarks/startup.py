@@ -0,0 +1,76 @@
+# Startup regression check: runs the CLI under `python -X importtime` and fails when
+# a cold start imports more than it should or takes longer than the budget
+#
+#   python benchmarks/startup.py --budget-ms 50
+
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (arguments, modules that must not be imported)
+SCENARIOS = [
+    (["--help"], ["src", "src.lexer", "src.parser", "src.codegen"]),
+    (["--lex", "main.c"], ["src.parser", "src.codegen"]),
+    (["--parse", "main.c"], ["src.codegen"]),
+    (["--codegen", "main.c"], ["src.batch", "src.server", "src.incremental", "src.passes", "concurrent.futures"]),
+]
+
+def parse_importtime(stderr):
+    # lines look like "import time:   self [us] | cumulative | imported package"
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # only top level imports, nested ones are in their cumulative time
+            total += int(cumulative)
+        modules[name.strip()] = int(cumulative)
+    return modules, total
+
+def measure(args, repeat):
+    best_wall, best_imports, modules = None, None, {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "main.py", *args],
+                              cwd=ROOT, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        modules, total = parse_importtime(proc.stderr)
+        if best_wall is None or wall < best_wall:
+            best_wall = wall
+        if best_imports is None or total < best_imports:
+            best_imports = total
+    return best_wall, best_imports, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI cold start regression check")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Maximum import time per scenario")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario, the fastest one counts")
+    args = parser.parse_args()
+
+    # an installed compiler starts from bytecode; with a stale __pycache__ (edited sources
+    # under PYTHONDONTWRITEBYTECODE, a read-only checkout) every run would compile them again
+    compileall.compile_dir(os.path.join(ROOT, "src"), quiet=1)
+
+    failures = []
+    for cli_args, forbidden in SCENARIOS:
+        wall, imports, modules = measure(cli_args, args.repeat)
+        label = " ".join(cli_args)
+        print(f"{label:<20} wall {1000 * wall:7.1f} ms   imports {imports / 1000:7.1f} ms")
+        if imports / 1000 > args.budget_ms:
+            failures.append(f"`{label}` spent {imports / 1000:.1f} ms importing (budget {args.budget_ms} ms)")
+        for name in forbidden:
+            if name in modules:
+                failures.append(f"`{label}` imported {name}")
+
+    for failure in failures:
+        print(f"[FAIL]: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,102 @@
+# Dispatch benchmark: the same classifier written as a `switch` and as an if/else chain,
+# over dense and sparse case values, called with pseudo-random values in a hot loop
+#
+#   python benchmarks/switch_dispatch.py --cases 4 16 64 256 --iterations 1000000
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.runtime import build_pycc, build_gcc, run
+from src.codegen import switch_lowering
+
+def case_value(pattern, i):
+    # dense values fill a range, sparse ones grow quadratically
+    return i if pattern == "dense" else 37 * i * i + i
+
+def case_expression(pattern):
+    return "k" if pattern == "dense" else "37 * k * k + k"
+
+def dispatch_program(cases, pattern, style, iterations):
+    lines = ["int classify(int x) {"]
+    if style == "switch":
+        lines.append("    switch (x) {")
+        for i in range(cases):
+            lines.append(f"        case {case_value(pattern, i)}: return {(7 * i + 3) % 97};")
+        lines.append("    }")
+    else:
+        for i in range(cases):
+            keyword = "if" if i == 0 else "else if"
+            lines.append(f"    {keyword} (x == {case_value(pattern, i)}) return {(7 * i + 3) % 97};")
+    lines += [
+        "    return 1;",
+        "}",
+        "",
+        "int main() {",
+        "    int s = 0;",
+        "    int seed = 1;",
+        f"    for (int i = 0; i < {iterations}; i = i + 1) {{",
+        "        seed = (seed * 75 + 74) % 65537;",
+        # about one in five calls misses every case and takes the default path
+        f"        int k = seed % {cases + cases // 4 + 1};",
+        f"        s = (s + classify({case_expression(pattern)})) % 65536;",
+        "    }",
+        "    return s % 256;",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="switch vs if/else dispatch benchmark")
+    parser.add_argument("--cases", type=int, nargs="+", default=[4, 16, 64, 256], help="Number of cases")
+    parser.add_argument("--iterations", type=int, default=1000000, help="Calls of the classifier per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per build, the median counts")
+    parser.add_argument("--opt", default="-O2", help="pycc optimization level")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"{'cases':>6} {'pattern':<7} {'style':<8} {'lowering':<9} {'median ms':>10} {'speedup':>8}  exit")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for cases in args.cases:
+            for pattern in ("dense", "sparse"):
+                baseline, expected = None, None
+                for style in ("if-chain", "switch"):
+                    source = os.path.join(tmp, f"{pattern}-{cases}-{style}.c")
+                    with open(source, "w") as f:
+                        f.write(dispatch_program(cases, pattern, style, args.iterations))
+                    exe = source[:-2] + ".exe"
+                    build_pycc(source, [args.opt], exe)
+                    median, status = run(exe, args.repeat)
+
+                    if expected is None:
+                        expected = status
+                        if shutil.which("gcc"):
+                            build_gcc(source, ["-O0"], exe + ".gcc")
+                            expected = run(exe + ".gcc", 1)[1]
+                    baseline = median if baseline is None else baseline
+                    lowering = "linear" if style == "if-chain" else switch_lowering([case_value(pattern, i) for i in range(cases)])
+                    check = "" if status == expected else "  MISMATCH"
+                    print(f"{cases:>6} {pattern:<7} {style:<8} {lowering:<9} {1000 * median:>10.2f} {baseline / median:>7.2f}x  {status}{check}")
+                    results.append({
+                        "cases": cases,
+                        "pattern": pattern,
+                        "style": style,
+                        "lowering": lowering,
+                        "median_s": median,
+                        "speedup": baseline / median,
+                        "exit_status": status,
+                    })
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"iterations": args.iterations, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,98 @@
+# Auto-vectorization benchmark: array kernels built with pycc at -O2, with and without the
+# vectorize pass, over an odd array length so the scalar epilogue runs too
+#
+#   python benchmarks/vectorize.py --length 1001 --iterations 20000
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.runtime import build_pycc, build_gcc, run
+
+# kernel name -> the loop body over i, run `iterations` times over arrays a, b and d
+KERNELS = {
+    "add": "d[i] = a[i] + b[i] - k;",
+    "xor": "d[i] = (a[i] ^ b[i]) | k;",
+    "max": "d[i] = a[i] < b[i] ? b[i] : a[i];",
+    "sum": "s = s + a[i];",
+    "min-reduce": "s = b[i] < s ? b[i] : s;",
+}
+
+def kernel_program(body, length, iterations):
+    lines = [
+        "int main() {",
+        f"    int a[{length}];",
+        f"    int b[{length}];",
+        f"    int d[{length}];",
+        "    int seed = 1;",
+        f"    for (int i = 0; i < {length}; i = i + 1) {{",
+        "        seed = (seed * 75 + 74) % 65537;",
+        "        a[i] = seed % 1000;",
+        "        b[i] = seed % 777;",
+        "        d[i] = 0;",
+        "    }",
+        "    int k = 3;",
+        "    int s = 0;",
+        "    int check = 0;",
+        f"    for (int r = 0; r < {iterations}; r = r + 1) {{",
+        "        s = 1000;",
+        f"        for (int i = 0; i < {length}; i = i + 1) {body}",
+        "        check = (check + s + d[r % " + str(length) + "]) % 65536;",
+        "        a[r % " + str(length) + "] = check;",
+        "    }",
+        "    return check % 256;",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-vectorization benchmark")
+    parser.add_argument("--kernels", nargs="+", default=list(KERNELS), choices=list(KERNELS), help="Kernels to run")
+    parser.add_argument("--length", type=int, default=1001, help="Array length")
+    parser.add_argument("--iterations", type=int, default=20000, help="Passes over the arrays per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per build, the median counts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    configs = [("scalar", ["-O2", "-fno-vectorize"]), ("vector", ["-O2"])]
+    print(f"{'kernel':<11} {'build':<7} {'median ms':>10} {'speedup':>8}  exit")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for kernel in args.kernels:
+            source = os.path.join(tmp, f"{kernel}.c")
+            with open(source, "w") as f:
+                f.write(kernel_program(KERNELS[kernel], args.length, args.iterations))
+            expected = None
+            if shutil.which("gcc"):
+                build_gcc(source, ["-O0"], source[:-2] + ".gcc")
+                expected = run(source[:-2] + ".gcc", 1)[1]
+
+            baseline = None
+            for label, flags in configs:
+                exe = os.path.join(tmp, f"{kernel}-{label}.exe")
+                build_pycc(source, flags, exe)
+                median, status = run(exe, args.repeat)
+                expected = status if expected is None else expected
+                baseline = median if baseline is None else baseline
+                check = "" if status == expected else "  MISMATCH"
+                print(f"{kernel:<11} {label:<7} {1000 * median:>10.2f} {baseline / median:>7.2f}x  {status}{check}")
+                results.append({
+                    "kernel": kernel,
+                    "build": label,
+                    "median_s": median,
+                    "speedup": baseline / median,
+                    "exit_status": status,
+                })
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"length": args.length, "iterations": args.iterations, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,129 @@
+# Bytecode VM benchmark: runs the recursive fib of main.c in src/vm.py for a few n, reports
+# the time and calls per second, and checks every result against fib computed in Python and,
+# when nasm and gcc are installed, against the exit status of a native pycc build. Then every
+# program in benchmarks/kernels runs in the VM, without and with the -O2 passes, and has to
+# exit like its native pycc -O2 build
+#
+#   python benchmarks/vm.py --n 20 25 27
+#   python benchmarks/vm.py --n 20 --no-kernels
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.compiler_throughput import best_of
+from benchmarks.runtime import KERNELS, build_pycc, run
+from src.lexer import tokenize
+from src.parser import Parser
+from src.passes import default_pass_manager
+from src.vm import VM, RuntimeFault, compile_program, run_program
+
+SOURCE = os.path.join(ROOT, "main.c")
+
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+def fib_calls(n):
+    # calls made by the recursive fib for n, fib(n) itself included
+    return 2 * fib(n + 1) - 1
+
+def program(n):
+    with open(SOURCE) as f:
+        text = f.read().replace("int n = 40;", f"int n = {n};")
+    return Parser(tokenize(text)).parse(), text
+
+def run_vm(path, level):
+    # main's return value as an exit status, like a native run would give
+    with open(path) as f:
+        ast = Parser(tokenize(f.read())).parse()
+    try:
+        return run_program(ast, default_pass_manager(level) if level else None) & 0xFF
+    except RuntimeFault as e:
+        return e.status
+
+def check_kernels(tmp):
+    # whether the VM agrees with the native build on every kernel
+    print(f"{'kernel':<10} {'vm s':>8} {'vm -O2 s':>9}  native  vm  vm -O2")
+    results = []
+    for name in sorted(os.listdir(KERNELS)):
+        if not name.endswith(".c"):
+            continue
+        path = os.path.join(KERNELS, name)
+        start = time.perf_counter()
+        plain = run_vm(path, 0)
+        vm_s = time.perf_counter() - start
+        start = time.perf_counter()
+        optimized = run_vm(path, 2)
+        vm_o2_s = time.perf_counter() - start
+        exe = os.path.join(tmp, name[:-2])
+        build_pycc(path, ["-O2"], exe)
+        status = run(exe, 1)[1]
+        same = plain == status and optimized == status
+        print(f"{name[:-2]:<10} {vm_s:>8.3f} {vm_o2_s:>9.3f}  {status:>6} {plain:>3} {optimized:>7}  {'ok' if same else 'MISMATCH'}")
+        results.append({"kernel": name[:-2], "vm_s": vm_s, "vm_o2_s": vm_o2_s, "native": status,
+                        "vm": plain, "vm_o2": optimized, "ok": same})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytecode VM benchmark")
+    parser.add_argument("--n", type=int, nargs="+", default=[20, 25, 27], help="Arguments of fib")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one counts")
+    parser.add_argument("--native", action="store_true", help="Also build and time a native pycc -O2 executable")
+    parser.add_argument("--no-kernels", action="store_true", help="Skip checking the VM against native builds of benchmarks/kernels")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    toolchain = shutil.which("nasm") and shutil.which("gcc")
+    native = args.native and toolchain
+
+    print(f"{'n':>4} {'calls':>10} {'vm s':>8} {'calls/s':>10} {'native s':>9}  result")
+    results = []
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.n:
+            ast, text = program(n)
+            codes = compile_program(ast)
+            vm_s, value = best_of(args.repeat, lambda: VM(codes).run())
+            expected = fib(n) & 0xFFFFFFFF
+            expected -= (expected & 0x80000000) << 1
+            same = value == expected
+            native_s = None
+            if native:
+                source, exe = os.path.join(tmp, f"fib{n}.c"), os.path.join(tmp, f"fib{n}")
+                with open(source, "w") as f:
+                    f.write(text)
+                build_pycc(source, ["-O2"], exe)
+                native_s, status = run(exe, args.repeat)
+                same = same and status == value & 0xFF
+            failed = failed or not same
+            calls = fib_calls(n)
+            print(f"{n:>4} {calls:>10} {vm_s:>8.3f} {calls / vm_s:>10.0f} "
+                  f"{'-' if native_s is None else f'{native_s:.3f}':>9}  {'ok' if same else 'MISMATCH'}")
+            results.append({"n": n, "calls": calls, "vm_s": vm_s, "calls_per_s": calls / vm_s,
+                            "native_s": native_s, "result": value, "ok": same})
+
+        kernels = []
+        if not args.no_kernels and toolchain:
+            print()
+            kernels = check_kernels(tmp)
+            failed = failed or not all(k["ok"] for k in kernels)
+        elif not args.no_kernels:
+            print("\nnasm or gcc not found, the kernels aren't checked")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"repeat": args.repeat, "results": results, "kernels": kernels}, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,69 @@
+# Thin client for the pycc compile server (`python main.py --serve`)
+# Only uses the standard library, so it starts without importing the compiler
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+def default_socket_path():
+    return f"/tmp/pycc-{os.getuid()}.sock"
+
+def request(socket_path, message):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile("r") as stream:
+            for line in stream:
+                yield json.loads(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Client for the pycc compile server")
+    parser.add_argument("input_files", nargs="*", help="Input source files to compile")
+    parser.add_argument("-o", "--output", help="Name of the executable; links all inputs into it")
+    parser.add_argument("--output-dir", default="./bin", help="Directory for generated assembly, objects and executables")
+    parser.add_argument("-S", "--asm-only", action="store_true", help="Stop after writing the assembly")
+    parser.add_argument("-O", dest="opt_level", type=int, choices=[0, 1, 2], default=0, help="Optimization level")
+    parser.add_argument("-g", dest="debug", action="store_true", help="Emit DWARF line info")
+    parser.add_argument("--socket", default=default_socket_path(), help="Path of the server socket")
+    parser.add_argument("--stop", action="store_true", help="Stop the server")
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        message = {"shutdown": True}
+    else:
+        # the server has its own working directory, so send absolute paths
+        message = {
+            "files": [os.path.abspath(f) for f in args.input_files],
+            "output_dir": os.path.abspath(args.output_dir),
+            "output": args.output,
+            "assemble": not args.asm_only,
+            "optimize": [args.opt_level, [], []],
+            "debug": args.debug,
+        }
+
+    failed = False
+    try:
+        for reply in request(args.socket, message):
+            if reply.get("done"):
+                if reply.get("error"):
+                    print(f"[ERROR]: {reply['error']}")
+                    failed = True
+                if reply.get("exe"):
+                    print(f"Executable created: {reply['exe']}.")
+                if reply.get("summary"):
+                    print(reply["summary"])
+                break
+            if reply["error"]:
+                print(f"[ERROR]: {reply['file']}: {reply['error']}")
+                failed = True
+            else:
+                print(f"{reply['file']} -> {reply['exe'] or reply['object'] or reply['asm']}")
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"[ERROR]: No pycc server listening on {args.socket}. Start one with `python main.py --serve`.")
+        return 1
+    return 1 if failed else 0
+
+if __name__=="__main__":
+    sys.exit(main())
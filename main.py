@@ -1,46 +1,96 @@
-from src.lexer import *
-from src.parser import *
-from src.codegen import ASMGenerator
-
+# Compiler phases are imported only when a run needs them, so `--help` and `--lex`
+# don't pay for the parser and code generator
 import sys
 import argparse
 
-def process(file_path, args):
+WATCH_INTERVAL = 0.2 # seconds between checks of a watched file
+
+def expand_inputs(inputs):
+    import glob
+    import os
+
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files.extend(sorted(glob.glob(os.path.join(item, "**", "*.c"), recursive=True)))
+        elif glob.has_magic(item):
+            files.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            files.append(item)
+    # drop duplicates but keep the order the user gave
+    return list(dict.fromkeys(files))
+
+def process(file_path, args, report=None):
     try: 
-        with open(file_path, "r") as f:
-            text = f.read()
+        import os
+        from src.instrument import PhaseReport
+        report = report or PhaseReport(enabled=False)
+
+        with report.phase("read") as counts:
+            if args.mmap:
+                # lexed in place, the page cache holds the only copy of the text
+                import mmap
+                with open(file_path, "rb") as f:
+                    text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+            else:
+                with open(file_path, "r") as f:
+                    text = f.read()
+            counts["bytes"] = len(text)
 
         if args.all:
             args.lex = args.parse = args.codegen = True
     
-        tokens = tokenize(text)
-        if args.lex:
-            print()
-            print("---------- TOKENS ----------")
-            for token in tokens:
-                print(token)
-
-        parser = Parser(tokens)
-        ast = parser.parse()
+        cache = ast = None
+        if args.incremental and not args.lex:
+            # an unchanged file's AST comes from the cache instead of the lexer and parser
+            from src.serialize import ASTCache
+            cache = ASTCache(args.cache_dir)
+            with report.phase("load ast") as counts:
+                ast = cache.load(text)
 
-        printer = ASTPrinter()
-        if args.parse:
-            print()
-            print("---------- Abstract Syntax Tree ----------")
-            print(printer.print(ast))
-            print()
+        if ast is None:
+            from src.lexer import tokenize, tokenize_bytes, tokenize_parallel
+            with report.phase("lex") as counts:
+                if args.lex_jobs > 1:
+                    tokens = tokenize_parallel(text, args.lex_jobs)
+                else:
+                    tokens = tokenize_bytes(text) if args.mmap else tokenize(text)
+                counts["tokens"] = len(tokens)
+            if args.lex:
+                print()
+                print("---------- TOKENS ----------")
+                for token in tokens:
+                    print(token)
+                if not (args.parse or args.codegen):
+                    return
 
-        generator = ASMGenerator()
-        asm_code = generator.generate(ast)
+            from src.parser import Parser
+            with report.phase("parse") as counts:
+                parser = Parser(tokens)
+                ast = parser.parse()
+            if cache is not None:
+                cache.store(text, ast)
+        if report.enabled:
+            from src.instrument import count_nodes
+            counts["nodes"] = count_nodes(ast)
 
-        if args.codegen:
-            print()
-            print("---------- Assembly Generated ----------")
-            print(asm_code)
-            print()
+        if args.parse:
+            from src.parser import ASTPrinter
+            # streamed, a large tree is never one string
+            printer = ASTPrinter(sys.stdout)
+            if args.parse_format == "json":
+                printer.print_json(ast)
+            else:
+                print()
+                print("---------- Abstract Syntax Tree ----------")
+                printer.print(ast)
+                print()
+            if not args.codegen:
+                return
 
-        if not (args.lex or args.parse or args.codegen):
-            generator.emit()
+        status = build(ast, file_path, args, report)
+        if status is not None:
+            sys.exit(status & 0xFF) # the exit status the executable would have had
 
     except FileNotFoundError:
         print(f"[ERROR]: File `{file_path}` not found")
@@ -49,17 +99,226 @@ def process(file_path, args):
         print(f"Error during compilation: {str(e)}")
         sys.exit(1)
 
+def build(ast, file_path, args, report):
+    # optimizes the AST and generates, prints or assembles its code
+    passes = None
+    if args.opt_level or args.disabled_passes or args.enabled_passes:
+        from src.passes import default_pass_manager
+        passes = default_pass_manager(args.opt_level, args.disabled_passes, args.enabled_passes)
+
+    if args.incremental and not args.codegen:
+        if not (args.lex or args.parse):
+            from src.incremental import IncrementalCompiler
+            compiler = IncrementalCompiler(args.cache_dir, passes)
+            output_exe = compiler.build(ast, args.output or "out.exe", args.output_dir)
+            print(f"Regenerated {len(compiler.regenerated)} function(s), reused {len(compiler.reused)}.")
+            print(f"Executable created: {output_exe}.")
+        return
+
+    if args.run:
+        # the bytecode VM stands in for nasm, gcc and running the executable
+        from src.vm import run_program, RuntimeFault
+        try:
+            status = run_program(ast, passes)
+        except RuntimeFault as e:
+            # the program's fault, not the compiler's; exits like the native build would
+            print(f"[ERROR]: Runtime error: {e}")
+            return e.status
+        print(f"main returned {status}")
+        if passes and args.pass_stats:
+            print(passes.report())
+        return status
+
+    instrument = profile = None
+    if args.profile_generate:
+        from src.profile import Instrumentation
+        instrument = Instrumentation(args.profile_generate)
+    elif args.profile_use:
+        from src.profile import Profile
+        profile = Profile.load(args.profile_use)
+
+    memoize = None
+    if args.memoize is not None:
+        from src.purity import Memoization
+        memoize = Memoization(args.memoize)
+
+    import os
+    from src.codegen import ASMGenerator
+    source = os.path.abspath(file_path) if args.debug else None
+    generator = ASMGenerator(jobs=args.function_jobs, passes=passes, instrument=instrument, profile=profile, source=source, memoize=memoize)
+    if args.codegen:
+        with report.phase("codegen") as counts:
+            asm_code = generator.generate(ast)
+        if report.enabled:
+            from src.instrument import count_instructions
+            counts["instructions"] = count_instructions(generator.assembly)
+
+        print()
+        print("---------- Assembly Generated ----------")
+        print(asm_code)
+        print()
+
+    if not (args.lex or args.parse or args.codegen):
+        # stream the assembly into the output file instead of building it in memory
+        generator.emit(output_exe=args.output or "out.exe", output_dir=args.output_dir, report=report, program=ast)
+    if memoize is not None:
+        print(memoize.report(ast))
+    if passes and args.pass_stats:
+        print(passes.report())
+
+def watch(file_path, args):
+    # rebuilds the file whenever it's saved; the difference to the last version goes to the
+    # incremental front end, which lexes and parses only the functions it touches
+    import copy
+    import os
+    import time
+    from src.document import Document, text_edit
+
+    document, modified = None, None
+    try:
+        while True:
+            try:
+                mtime = os.stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime is not None and mtime != modified:
+                modified = mtime
+                with open(file_path, "r") as f:
+                    text = f.read()
+                if document is None:
+                    document = Document(text)
+                else:
+                    document.edit(*text_edit(document.text, text))
+                    print(f"Re-lexed {document.relexed} token(s), re-parsed {document.reparsed}.")
+                try:
+                    # passes rewrite the tree, the document keeps the original
+                    build(copy.deepcopy(document.program()), file_path, args, None)
+                except Exception as e:
+                    print(f"Error during compilation: {str(e)}")
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+
+def optimization(args):
+    # picklable optimization settings for worker processes
+    return (args.opt_level, tuple(args.disabled_passes), tuple(args.enabled_passes))
+
+def process_batch(files, args):
+    from src.batch import compile_batch
+    report = compile_batch(files, args.output_dir, args.jobs, args.output, optimization(args), args.debug)
+    for result in report.results:
+        if result.error:
+            print(f"[ERROR]: {result.file_path}: {result.error}")
+        elif result.output_exe:
+            print(f"{result.file_path} -> {result.output_exe}")
+    if report.linked:
+        print(f"Executable created: {report.linked}.")
+    print(report.summary())
+    if report.failed:
+        sys.exit(1)
+
 if __name__=="__main__":
     parser = argparse.ArgumentParser(
         description="Tiny C Compiler written in Python",
         formatter_class=argparse.RawTextHelpFormatter
     )
 
-    parser.add_argument("input_file", help="Input source file to compile")
+    parser.add_argument("input_files", nargs="*", help="Input source files, directories or globs to compile")
     parser.add_argument("-l", "--lex", action="store_true", help="Print tokens from lexical analysis")
     parser.add_argument("-p", "--parse", action="store_true", help="Show parsing completion status")
+    parser.add_argument("--parse-format", choices=["text", "json"], default="text", help="Format of the tree -p prints (json: one object per node, for tools)")
     parser.add_argument("-cg", "--codegen", action="store_true", help="Print generated assembly code")
     parser.add_argument("--all", action="store_true", help="Enable all output phases")
+    parser.add_argument("--function-jobs", type=int, default=1, help="Generate the functions of a file in parallel with this many processes")
+    parser.add_argument("-i", "--incremental", action="store_true", help="Only regenerate functions that changed since the last build")
+    parser.add_argument("--cache-dir", default="./bin/.cache", help="Directory for cached per-function fragments")
+    parser.add_argument("--mmap", action="store_true", help="Map the input file and lex its bytes in place instead of reading it into a string")
+    parser.add_argument("--lex-jobs", type=int, default=1, help="Lex a large file in this many processes, split between top-level functions")
+    parser.add_argument("--watch", action="store_true", help="Rebuild whenever the file is saved, re-parsing only the functions that changed")
+
+    parser.add_argument("--run", action="store_true", help="Run the program in the bytecode VM instead of building it, exit with main's return value")
+
+    parser.add_argument("-o", "--output", help="Name of the executable; links all inputs into it")
+    parser.add_argument("--output-dir", default="./bin", help="Directory for generated assembly, objects and executables")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (defaults to the number of cores)")
+
+    parser.add_argument("--time-report", action="store_true", help="Report wall and CPU time of every compiler phase")
+    parser.add_argument("--mem-report", action="store_true", help="Report peak traced memory of every compiler phase")
+    parser.add_argument("--report-format", choices=["text", "json", "chrome"], default="text", help="Format of the phase report (chrome: trace-event JSON)")
+    parser.add_argument("--report-file", help="Write the phase report to this file instead of stdout")
+
+    parser.add_argument("--serve", nargs="?", const="", metavar="SOCKET", help="Run a compile server on a Unix socket (see client.py)")
+
+    parser.add_argument("-O", dest="opt_level", type=int, choices=[0, 1, 2], default=0, help="Optimization level (-O0, -O1, -O2)")
+    parser.add_argument("--pass-stats", action="store_true", help="Print time and changes of every optimization pass")
+    parser.add_argument("-g", dest="debug", action="store_true", help="Emit DWARF line info, so debuggers and perf map the code to C lines")
+    parser.add_argument("--profile-generate", nargs="?", const="pycc.profile", metavar="FILE", help="Instrument the program to write an execution profile to FILE when main returns")
+    parser.add_argument("--profile-use", metavar="FILE", help="Lay out branches and loops and inline calls by a profile from --profile-generate")
+    parser.add_argument("--memoize", nargs="?", type=int, const=4096, metavar="ENTRIES", help="Cache the results of pure recursive functions in a memo table of ENTRIES slots each")
+
+    # -fno-<pass> / -f<pass> switch single optimization passes off or on
+    args, unknown = parser.parse_known_args()
+    args.disabled_passes, args.enabled_passes = [], []
+    for flag in unknown:
+        if flag.startswith("-fno-"):
+            args.disabled_passes.append(flag[len("-fno-"):])
+        elif flag.startswith("-f") and not flag.startswith("-f-"):
+            args.enabled_passes.append(flag[len("-f"):])
+        else:
+            parser.error(f"unrecognized arguments: {flag}")
+    if args.disabled_passes or args.enabled_passes:
+        from src.passes import PASS_NAMES
+        for name in args.disabled_passes + args.enabled_passes:
+            if name not in PASS_NAMES:
+                parser.error(f"unknown optimization pass `{name}` (available: {', '.join(PASS_NAMES)})")
+    if args.serve is not None:
+        from src.server import serve
+        try:
+            serve(args.serve or None)
+        except Exception as e:
+            print(f"[ERROR]: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    if not args.input_files:
+        parser.error("the following arguments are required: input_files")
 
-    args = parser.parse_args()
-    process(args.input_file, args)
+    files = expand_inputs(args.input_files)
+    if args.profile_generate or args.profile_use:
+        # a profile belongs to exactly one program
+        if args.profile_generate and args.profile_use:
+            parser.error("--profile-generate and --profile-use can't be combined")
+        if len(files) != 1 or args.jobs is not None or args.incremental:
+            parser.error("profiles need a single input file, without -j or --incremental")
+    if args.run and (len(files) != 1 or args.jobs is not None or args.incremental or args.debug
+                     or args.profile_generate or args.profile_use or args.codegen or args.all):
+        parser.error("--run needs a single input file, without -j, -i, -g, -cg, --all or profiles")
+    if args.memoize is not None and (len(files) != 1 or args.jobs is not None or args.incremental or args.run):
+        # purity is decided over the whole program
+        parser.error("--memoize needs a single input file, without -j, --incremental or --run")
+    if args.debug and args.incremental:
+        parser.error("-g can't be combined with --incremental")
+    if args.watch:
+        if len(files) != 1 or args.jobs is not None or args.lex or args.parse or args.codegen or args.all:
+            parser.error("--watch needs a single input file, without -j, -l, -p, -cg or --all")
+        watch(files[0], args)
+        sys.exit(0)
+    reporting = args.time_report or args.mem_report
+    if reporting or args.lex or args.parse or args.codegen or args.all or args.incremental:
+        reports = []
+        for file_path in files:
+            report = None
+            if reporting:
+                from src.instrument import PhaseReport
+                report = PhaseReport(file_path, timing=args.time_report, memory=args.mem_report)
+                reports.append(report)
+            process(file_path, args, report)
+        if reports:
+            from src.instrument import write_reports
+            write_reports(reports, args.report_format, args.report_file)
+    elif len(files) == 1 and args.jobs is None:
+        process(files[0], args)
+    else:
+        # batch workers compile a unit each with the default front end
+        if args.mmap or args.lex_jobs > 1 or args.function_jobs > 1:
+            parser.error("--mmap, --lex-jobs and --function-jobs need a single input file, without -j")
+        process_batch(files, args)
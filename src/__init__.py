@@ -1,6 +1,31 @@
-from .lexer import Token, tokenize
-from .parser import Parser, ASTPrinter
-from .codegen import ASMGenerator
-from .tokentype import TokenType 
+# Public names are resolved lazily so importing one phase doesn't import the others
+import importlib
 
-__all__ = ["Token", "tokenize", "Parser", "ASTPrinter", "ASMGenerator", "TokenType"]
+_exports = {
+    "Token": ".lexer",
+    "tokenize": ".lexer",
+    "tokenize_bytes": ".lexer",
+    "tokenize_parallel": ".lexer",
+    "Parser": ".parser",
+    "ASTPrinter": ".parser",
+    "ASMGenerator": ".codegen",
+    "Document": ".document",
+    "Compiler": ".api",
+    "CompileError": ".api",
+    "compile_string": ".api",
+    "compile_file": ".api",
+    "compile_many": ".api",
+    "VM": ".vm",
+    "run_program": ".vm",
+    "RuntimeFault": ".vm",
+    "TokenType": ".tokentype",
+}
+
+__all__ = ["Token", "tokenize", "tokenize_bytes", "tokenize_parallel", "Parser", "ASTPrinter", "ASMGenerator", "Document", "Compiler", "CompileError", "compile_string", "compile_file", "compile_many", "VM", "run_program", "RuntimeFault", "TokenType"]
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,234 @@
+# Library API for embedding pycc in other programs
+#
+#   from src.api import Compiler
+#   result = Compiler(opt_level=2).compile_string("int main() { return 42; }")
+#   result.assembly
+#
+# Every call lexes, parses, resolves and generates with objects of its own, and a Compiler
+# only holds settings. Nothing carries over from one unit to the next, one Compiler can be
+# shared by threads, and a long-lived process can compile any number of units. Nothing is
+# printed. A call returns a CompileResult; on failure, its `error` is a CompileError naming
+# the phase that failed. Files are only written where the caller asks for them. Intermediate
+# files that a later step needs go to a temporary directory, which is removed afterwards.
+
+import os
+import re
+import subprocess
+import tempfile
+import time
+
+PHASES = ("read", "lex", "parse", "codegen", "assemble", "link")
+STAGES = ("asm", "object", "exe")        # what compile_many produces for every unit
+DIAGNOSTIC = re.compile(r"(\d+):(\d+): (.*)")
+MANY_BACKLOG = 4                         # units in flight per worker in compile_many
+
+class CompileError(Exception):
+    # `phase` is one of PHASES, `diagnostics` the message's lines as (line, column, text),
+    # with 0 for lines without a position
+    def __init__(self, message, phase, unit=None):
+        super().__init__(message)
+        self.phase = phase
+        self.unit = unit
+        self.diagnostics = []
+        for line in message.splitlines():
+            match = DIAGNOSTIC.match(line)
+            self.diagnostics.append((int(match[1]), int(match[2]), match[3]) if match else (0, 0, line))
+
+    def __reduce__(self):
+        # results come back from worker processes pickled
+        return CompileError, (str(self), self.phase, self.unit)
+
+class CompileResult:
+    def __init__(self, unit):
+        self.unit = unit                # path or name of the source
+        self.assembly = None            # assembly text, when no file was asked for
+        self.asm_file = None            # files written at the caller's request
+        self.object_file = None
+        self.output_exe = None
+        self.lines = 0
+        self.tokens = 0
+        self.instructions = 0
+        self.memoized = []              # functions --memoize wrapped
+        self.seconds = 0.0
+        self.error = None               # CompileError
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def check(self):
+        # the result itself, or its error raised
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def __repr__(self):
+        state = "ok" if self.ok else f"{self.error.phase} failed"
+        return f"CompileResult({self.unit!r}, {state})"
+
+class Compiler:
+    def __init__(self, opt_level=0, disabled=(), enabled=(), debug=False, memoize=None):
+        from .passes import PASS_NAMES
+
+        if opt_level not in (0, 1, 2):
+            raise ValueError(f"Optimization level has to be 0, 1 or 2, not {opt_level!r}")
+        unknown = [name for name in (*disabled, *enabled) if name not in PASS_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown optimization pass(es): {', '.join(unknown)}")
+        self.opt_level = opt_level
+        self.disabled = tuple(disabled)
+        self.enabled = tuple(enabled)
+        self.debug = debug              # DWARF line info, for units with a file
+        self.memoize = memoize          # memo table entries, see purity.py
+
+    def compile_string(self, text, name="<string>", asm_file=None, object_file=None, output_exe=None):
+        # with none of the files the assembly comes back as text
+        return self.compile(text, name, None, asm_file, object_file, output_exe)
+
+    def compile_file(self, path, asm_file=None, object_file=None, output_exe=None):
+        start = time.perf_counter()
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            result = CompileResult(path)
+            result.error = CompileError(f"Can't read `{path}`: {e.strerror if isinstance(e, OSError) else e}", "read", path)
+            result.seconds = time.perf_counter() - start
+            return result
+        result = self.compile(text, path, os.path.abspath(path), asm_file, object_file, output_exe)
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def compile_many(self, units, output_dir=None, stage="asm", jobs=1, executor="thread"):
+        # compiles file paths and (name, text) pairs, yielding their results in order. Without
+        # an output_dir the assembly comes back as text. Units are read from `units` only as
+        # workers free up, so the iterable can be endless. Bad arguments raise right away, not
+        # on the first result.
+        if stage not in STAGES:
+            raise ValueError(f"Stage has to be one of {', '.join(STAGES)}, not {stage!r}")
+        if output_dir is None and stage != "asm":
+            raise ValueError(f"Stage `{stage}` needs an output_dir")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Executor has to be `thread` or `process`, not {executor!r}")
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+        return self._compile_many(units, output_dir, stage, jobs, executor)
+
+    def _compile_many(self, units, output_dir, stage, jobs, executor):
+        if jobs <= 1:
+            for index, unit in enumerate(units):
+                yield _compile_unit(self, index, unit, output_dir, stage)
+            return
+
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        with pool_class(max_workers=jobs) as pool:
+            pending = deque()
+            for index, unit in enumerate(units):
+                pending.append(pool.submit(_compile_unit, self, index, unit, output_dir, stage))
+                if len(pending) >= jobs * MANY_BACKLOG:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def compile(self, text, unit, source, asm_file, object_file, output_exe):
+        from .codegen import ASMGenerator, debug_flags
+        from .lexer import tokenize
+        from .parser import Parser
+
+        start = time.perf_counter()
+        result = CompileResult(unit)
+        result.lines = text.count("\n") + 1
+        source = (source or os.path.abspath(unit)) if self.debug else None
+        phase = "lex"
+        try:
+            tokens = tokenize(text)
+            result.tokens = len(tokens)
+            phase = "parse"
+            ast = Parser(tokens).parse()
+
+            phase = "codegen"
+            memoize = None
+            if self.memoize is not None:
+                from .purity import Memoization
+                memoize = Memoization(self.memoize)
+            generator = ASMGenerator(passes=self.pass_manager(), source=source, memoize=memoize)
+            if asm_file is None and object_file is None and output_exe is None:
+                from .instrument import count_instructions
+                result.assembly = generator.generate(ast)
+                result.instructions = count_instructions(generator.assembly)
+            else:
+                with tempfile.TemporaryDirectory(prefix="pycc-") as scratch:
+                    asm = asm_file or os.path.join(scratch, "unit.s")
+                    result.instructions = self.write_assembly(generator, ast, asm, source)
+                    if object_file is not None or output_exe is not None:
+                        phase = "assemble"
+                        obj = object_file or os.path.join(scratch, "unit.o")
+                        subprocess.run(["nasm", "-f", "elf64", *debug_flags(source), asm, "-o", obj],
+                                       check=True, capture_output=True)
+                        if output_exe is not None:
+                            phase = "link"
+                            subprocess.run(["gcc", "-no-pie", obj, "-o", output_exe], check=True, capture_output=True)
+                result.asm_file, result.object_file, result.output_exe = asm_file, object_file, output_exe
+            if memoize is not None:
+                result.memoized = list(memoize.functions)
+        except subprocess.CalledProcessError as e:
+            message = e.stderr.decode(errors="replace").strip() if e.stderr else f"exit status {e.returncode}"
+            result.error = CompileError(f"{e.cmd[0]} failed: {message}", phase, unit)
+        except FileNotFoundError as e:
+            result.error = CompileError(f"`{e.filename}` not found, make sure nasm and gcc are installed and in PATH", phase, unit)
+        except RecursionError:
+            result.error = CompileError("Nesting too deep", phase, unit)
+        except Exception as e:
+            result.error = CompileError(str(e), phase, unit)
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def pass_manager(self):
+        # a fresh one per unit, pass statistics are per unit too
+        if not (self.opt_level or self.disabled or self.enabled):
+            return None
+        from .passes import default_pass_manager
+        return default_pass_manager(self.opt_level, self.disabled, self.enabled)
+
+    def write_assembly(self, generator, ast, path, source):
+        from .asm import AsmWriter
+
+        # streamed into the file function by function, like the command line build
+        with open(path, "w") as f:
+            writer = AsmWriter(f, source=source)
+            generator.writer = writer
+            generator.generate(ast)
+            writer.close()
+        return writer.instructions
+
+def output_name(unit, index):
+    # the file name of a unit's outputs in compile_many's output_dir. Names alone can clash
+    # (`a/b` and `a_b`, a path given twice, two `<string>` units), the unit's index can't
+    if isinstance(unit, str):
+        stem = os.path.splitext(os.path.basename(unit))[0]
+    else:
+        stem = re.sub(r"[^\w.-]", "_", unit[0])
+    return f"{stem or 'unit'}-{index}"
+
+def _compile_unit(compiler, index, unit, output_dir, stage):
+    # one unit of compile_many; module level, so process pools can pickle it
+    files = {}
+    if output_dir is not None:
+        base = os.path.join(output_dir, output_name(unit, index))
+        key, suffix = {"asm": ("asm_file", ".s"), "object": ("object_file", ".o"), "exe": ("output_exe", ".exe")}[stage]
+        files[key] = base + suffix
+    if isinstance(unit, str):
+        return compiler.compile_file(unit, **files)
+    name, text = unit
+    return compiler.compile_string(text, name, **files)
+
+def compile_string(text, name="<string>", asm_file=None, object_file=None, output_exe=None, **options):
+    return Compiler(**options).compile_string(text, name, asm_file, object_file, output_exe)
+
+def compile_file(path, asm_file=None, object_file=None, output_exe=None, **options):
+    return Compiler(**options).compile_file(path, asm_file, object_file, output_exe)
+
+def compile_many(units, output_dir=None, stage="asm", jobs=1, executor="thread", **options):
+    return Compiler(**options).compile_many(units, output_dir, stage, jobs, executor)
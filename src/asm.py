@@ -0,0 +1,107 @@
+# Structured assembly records and a streaming writer for nasm source
+
+# the 32-bit halves of the general purpose registers pycc computes ints in
+DWORD_REGISTERS = {
+    "rax": "eax", "rbx": "ebx", "rcx": "ecx", "rdx": "edx",
+    "rdi": "edi", "rsi": "esi", "r8": "r8d", "r9": "r9d",
+}
+
+class Instruction:
+    __slots__ = ("opcode", "operands", "line")
+
+    def __init__(self, opcode, *operands, line=None):
+        self.opcode = opcode
+        self.operands = operands
+        self.line = line        # C source line with debug info, None if unknown
+
+    def __eq__(self, other):
+        return isinstance(other, Instruction) and self.opcode == other.opcode and self.operands == other.operands
+
+    def __hash__(self):
+        return hash((self.opcode, self.operands))
+
+    def __repr__(self):
+        return f"Instruction({self.opcode!r}, {', '.join(map(repr, self.operands))})"
+
+    def __str__(self):
+        if self.operands:
+            return f"    {self.opcode} {', '.join(self.operands)}"
+        return f"    {self.opcode}"
+
+    def mentions(self, text):
+        # e.g. whether any operand refers to a register, including memory operands
+        return any(text in operand for operand in self.operands)
+
+class Label:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Label) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f"Label({self.name!r})"
+
+    def __str__(self):
+        return f"{self.name}:"
+
+class Directive:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, Directive) and self.text == other.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __repr__(self):
+        return f"Directive({self.text!r})"
+
+    def __str__(self):
+        return self.text
+
+def format_assembly(records):
+    return "\n".join(str(record) for record in records)
+
+class AsmWriter:
+    # Buffers formatted lines and writes them out every `chunk_size` lines, so memory
+    # stays bounded by the chunk and not by the size of the program. Anything with the same
+    # write/close interface (e.g. a binary encoder) can be used as the code generator's sink.
+    # With a `source` file, a `%line` directive goes in front of every instruction that starts
+    # another C line; instructions the passes made up stay on the line before them.
+    def __init__(self, stream, chunk_size=4096, source=None):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.source = source
+        self.source_line = None
+        self.buffer = []
+        self.instructions = 0
+        self.lines = 0
+
+    def write(self, records):
+        for record in records:
+            if isinstance(record, Instruction):
+                self.instructions += 1
+                if self.source is not None and record.line and record.line != self.source_line:
+                    self.source_line = record.line
+                    self.buffer.append(f"%line {record.line}+0 {self.source}")
+            self.buffer.append(str(record))
+            if len(self.buffer) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write("\n".join(self.buffer) + "\n")
+            self.lines += len(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,118 @@
+# Compiles many translation units in parallel with a process pool
+
+import hashlib
+import os
+import subprocess
+import time
+
+def unit_name(file_path):
+    # the stem keeps names readable, the path hash keeps same-named files in different directories apart
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    digest = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:8]
+    return f"{stem}-{digest}"
+
+class UnitResult:
+    def __init__(self, file_path, object_file=None, output_exe=None, lines=0, tokens=0, seconds=0.0, error=None):
+        self.file_path = file_path
+        self.asm_file = None
+        self.object_file = object_file
+        self.output_exe = output_exe
+        self.lines = lines
+        self.tokens = tokens
+        self.seconds = seconds
+        self.error = error
+
+def compile_unit(file_path, output_dir="./bin", link=True, assemble=True, optimize=(0, (), ()), debug=False):
+    from .lexer import tokenize
+    from .parser import Parser
+    from .asm import AsmWriter
+    from .codegen import ASMGenerator, debug_flags
+    from .passes import default_pass_manager
+
+    start = time.perf_counter()
+    result = UnitResult(file_path)
+    try:
+        with open(file_path, "r") as f:
+            text = f.read()
+        result.lines = text.count("\n") + 1
+
+        tokens = tokenize(text)
+        result.tokens = len(tokens)
+        ast = Parser(tokens).parse()
+        level, disabled, enabled = optimize
+        passes = default_pass_manager(level, disabled, enabled) if any(optimize) else None
+
+        name = unit_name(file_path)
+        asm_file = os.path.join(output_dir, name + ".s")
+        source = os.path.abspath(file_path) if debug else None
+        with open(asm_file, "w") as f:
+            writer = AsmWriter(f, source=source)
+            ASMGenerator(passes=passes, writer=writer, source=source).generate(ast)
+            writer.close()
+
+        result.asm_file = asm_file
+        if not assemble:
+            return result
+
+        result.object_file = os.path.join(output_dir, name + ".o")
+        subprocess.run(["nasm", "-f", "elf64", *debug_flags(source), asm_file, "-o", result.object_file], check=True, capture_output=True)
+        if link:
+            result.output_exe = os.path.join(output_dir, name + ".exe")
+            subprocess.run(["gcc", "-no-pie", result.object_file, "-o", result.output_exe], check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        result.error = f"{e.cmd[0]} failed: {e.stderr.decode(errors='replace').strip()}"
+    except FileNotFoundError as e:
+        if e.filename == file_path:
+            result.error = f"File `{file_path}` not found"
+        else:
+            result.error = f"`{e.filename}` not found. Make sure nasm and gcc are installed and in your PATH."
+    except Exception as e:
+        result.error = str(e)
+    finally:
+        result.seconds = time.perf_counter() - start
+    return result
+
+def link_objects(object_files, output_exe):
+    subprocess.run(["gcc", "-no-pie", *object_files, "-o", output_exe], check=True)
+    return output_exe
+
+def compile_batch(files, output_dir="./bin", jobs=None, output_exe=None, optimize=(0, (), ()), debug=False):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files)))
+    # units are linked together at the end when a single executable is requested
+    link_units = output_exe is None
+
+    start = time.perf_counter()
+    if jobs == 1 or len(files) == 1:
+        results = [compile_unit(f, output_dir, link_units, True, optimize, debug) for f in files]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            n = len(files)
+            results = list(pool.map(compile_unit, files, [output_dir] * n, [link_units] * n, [True] * n, [optimize] * n, [debug] * n))
+
+    linked = None
+    if output_exe is not None and results and all(r.error is None for r in results):
+        linked = link_objects([r.object_file for r in results], os.path.join(output_dir, output_exe))
+    elapsed = time.perf_counter() - start
+    return BatchReport(results, elapsed, jobs, linked)
+
+class BatchReport:
+    def __init__(self, results, elapsed, jobs, linked=None):
+        self.results = results
+        self.elapsed = elapsed
+        self.jobs = jobs
+        self.linked = linked
+
+    @property
+    def failed(self):
+        return [r for r in self.results if r.error]
+
+    def summary(self):
+        units = len(self.results)
+        lines = sum(r.lines for r in self.results)
+        tokens = sum(r.tokens for r in self.results)
+        elapsed = max(self.elapsed, 1e-9)
+        return (f"Compiled {units - len(self.failed)}/{units} unit(s) in {self.elapsed:.3f}s "
+                f"with {self.jobs} worker(s): {units / elapsed:.1f} units/s, "
+                f"{lines / elapsed:.0f} lines/s, {tokens / elapsed:.0f} tokens/s")
@@ -1,146 +1,480 @@
 # Generates x86-64 Assembly from an AST
 
-import subprocess
-import os
-
-from .parser import *
+from .asm import Instruction, Label, Directive, AsmWriter, format_assembly, DWORD_REGISTERS
+from .parser import dispatch_table, Function, FunctionDeclaration, Declaration, Variable, Subscript, Dereference, Number, BinaryOps, Conditional
+from .resolve import Resolver, switch_statements, is_pointer, sizeof, wrap, SLOT_BYTES
+from .tokentype import TokenType
+
+# switch lowering: up to SWITCH_LINEAR_MAX cases compare one by one, case ranges at least
+# SWITCH_TABLE_DENSITY full (and at most SWITCH_TABLE_MAX long) get a jump table, anything
+# else a binary search over the sorted case values
+SWITCH_LINEAR_MAX = 3
+SWITCH_TABLE_DENSITY = 0.5
+SWITCH_TABLE_MAX = 4096
+
+# int operations use the 32-bit registers, which wrap around like C's int. The left operand
+# of a binary operation is in ebx, the right one (and the result) in eax
+UNARY_OPS = {
+    TokenType.MINUS: [("neg", "eax")],
+    TokenType.LOGICAL_NEGATION: [
+        ("cmp", "eax", "0"),
+        ("sete", "al"),
+        ("movzx", "eax", "al")
+    ],
+    TokenType.BITWISE_COMPLEMENT: [("not", "eax")]
+}
+BINARY_OPS = {
+    TokenType.PLUS: [("add", "eax", "ebx")],
+    TokenType.MINUS: [
+        ("sub", "ebx", "eax"),
+        ("mov", "eax", "ebx")
+    ],
+    TokenType.STAR: [("imul", "eax", "ebx")],
+    TokenType.SLASH: [
+        ("mov", "ecx", "eax"), # save divisor
+        ("mov", "eax", "ebx"), # move dividend to eax
+        ("cdq",),              # sign-extend eax into edx:eax
+        ("idiv", "ecx"),       # divide edx:eax by ecx
+    ],
+    TokenType.PERCENT:  [
+        ("mov", "ecx", "eax"), # save divisor
+        ("mov", "eax", "ebx"), # move dividend to eax
+        ("cdq",),              # sign-extend eax into edx:eax
+        ("idiv", "ecx"),       # divide edx:eax by ecx
+        ("mov", "eax", "edx")  # move remainder to eax
+    ],
+    TokenType.BITWISE_OR: [("or", "eax", "ebx")],
+    TokenType.BITWISE_AND: [("and", "eax", "ebx")],
+    TokenType.BITWISE_XOR: [("xor", "eax", "ebx")],
+    TokenType.BITWISE_SHIFT_LEFT: [
+        ("mov", "ecx", "eax"), # shift count
+        ("mov", "eax", "ebx"),
+        ("shl", "eax", "cl")
+    ],
+    TokenType.BITWISE_SHIFT_RIGHT:  [
+        ("mov", "ecx", "eax"), # shift count
+        ("mov", "eax", "ebx"),
+        ("sar", "eax", "cl")   # arithmetic shift, int is signed
+    ]
+}
+COMPARE_OPS = {
+    TokenType.EQUAL: "sete",
+    TokenType.NOT_EQUAL: "setne",
+    TokenType.LESS_THAN: "setl",
+    TokenType.LESS_THAN_OR_EQUAL: "setle",
+    TokenType.GREATER_THAN: "setg",
+    TokenType.GREATER_THAN_OR_EQUAL: "setge"
+}
+CONDITION_CODES = {op: setcc[len("set"):] for op, setcc in COMPARE_OPS.items()}
+
+# SSE2 lowering of the elementwise operators Vectorize accepts, on 32-bit lanes
+VECTOR_OPS = {
+    TokenType.PLUS: "paddd",
+    TokenType.MINUS: "psubd",
+    TokenType.BITWISE_XOR: "pxor",
+    TokenType.BITWISE_AND: "pand",
+    TokenType.BITWISE_OR: "por",
+}
+VECTOR_BYTES = 16
+VECTOR_BASES = ["r8", "r9", "r10", "r11"]           # array pointers of a vector loop
+VECTOR_TEMPS = [f"xmm{i}" for i in range(8)]        # intermediate values
+VECTOR_INVARIANTS = [f"xmm{i}" for i in range(8, 16)] # broadcast invariants and the accumulator
+
+# profile-guided layout: a branch taken at most PROFILE_COLD_RATIO of the time moves out of
+# line, loops whose body runs PROFILE_LOOP_TRIPS times per entry are rotated, and call sites
+# that called at least PROFILE_INLINE_CALLS times get callees of up to PROFILE_INLINE_NODES
+# AST nodes inlined
+PROFILE_COLD_RATIO = 0.01
+PROFILE_LOOP_TRIPS = 2
+PROFILE_INLINE_CALLS = 1000
+PROFILE_INLINE_NODES = 80
+
+def switch_lowering(values):
+    # "linear", "table" or "search" for a switch over the sorted case values
+    if len(values) <= SWITCH_LINEAR_MAX:
+        return "linear"
+    span = values[-1] - values[0] + 1
+    if span <= SWITCH_TABLE_MAX and len(values) >= SWITCH_TABLE_DENSITY * span:
+        return "table"
+    return "search"
 
 class ASMGenerator:
-    def __init__(self):
+    def __init__(self, jobs=1, passes=None, writer=None, instrument=None, profile=None, source=None, memoize=None):
+        self.jobs = jobs
+        self.passes = passes
+        self.writer = writer
+        self.instrument = instrument    # profile.Instrumentation with --profile-generate
+        self.profile = profile          # profile.Profile with --profile-use
+        self.source = source            # path of the C file, instructions get its line numbers
+        self.memoize = memoize          # purity.Memoization with --memoize
+        self.arg_registers = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
+        self.generators = dispatch_table(type(self), "generate", "generic_gen")
+        self.reset()
+
+    def reset(self):
+        # forgets the last program, so a generator can be reused for the next one
+        self.line = None
+        self.cold = []
+        self.frame_base = 0
+        self.inline_bytes = 0
+        self.inlining = False
         self.assembly = []
-        self.scopes = [{}]
+        self.resolver = None
         self.loop_stack = []
-        self.stack_index = 0
+        self.tables = []
         self.label_count = 0
-        self.arg_registers = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
-        self.external_functions = set()
         self.function_prototypes = {}
         self.defined_functions = set()
+        self.function_nodes = {}
     
-    def enter_scope(self): 
-        self.scopes.append({})
+    def ins(self, opcode, *operands):
+        self.assembly.append(Instruction(opcode, *operands, line=self.line))
 
-    def exit_scope(self):
-        scope = self.scopes.pop()
-        if scope:
-            self.stack_index -= 8 * len(scope) 
-            self.assembly.append(f"    add rsp, {8 * len(scope)}")
+    def label(self, name):
+        self.assembly.append(Label(name))
 
-    def enter_loop(self, start_label, end_label):
-        self.loop_stack.append((start_label, end_label))
+    def flush(self):
+        # hand finished records to the writer so they don't pile up in memory
+        if self.writer is not None:
+            self.writer.write(self.assembly)
+            self.assembly = []
+
+    def enter_loop(self, continue_label, end_label):
+        self.loop_stack.append((continue_label, end_label))
 
     def exit_loop(self):
         self.loop_stack.pop()
 
-    def find_variable(self, name):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-        raise Exception(f"Undefined Variable : {name}")
+    def offset(self, symbol):
+        # inlined functions have their slots below the caller's frame
+        return SLOT_BYTES * symbol.slot + self.frame_base
+
+    def frame_size(self, function):
+        # rounded up so rsp stays 16-byte aligned
+        return -(-SLOT_BYTES * function.frame_slots // 16) * 16
+
+    def size(self, ctype):
+        return sizeof(ctype)
+
+    def reg(self, register, ctype):
+        # ints are computed in the 32-bit half of a register, pointers in all of it
+        return DWORD_REGISTERS[register] if self.size(ctype) == 4 else register
+
+    def ctype(self, node):
+        # statements (and expressions the resolver didn't type) count as int
+        return getattr(node, "ctype", None) or "int"
+
+    def test(self, node):
+        # compare a condition's value in rax with 0
+        self.ins("cmp", self.reg("rax", self.ctype(node)), "0")
+
+    def convert(self, source, target):
+        # an int becomes a pointer sign-extended, as C converts it
+        if is_pointer(target) and not is_pointer(source):
+            self.ins("movsxd", "rax", "eax")
 
     def generate(self, node):
-        method_name = f"generate_{type(node).__name__}"
-        generator = getattr(self, method_name, self.generic_gen)
-        return generator(node)
+        generator = self.generators[type(node)]
+        if self.source is None or not getattr(node, "line", 0):
+            return generator(self, node)
+        # the node's instructions belong to its line, the rest of the parent's to the parent's
+        line, self.line = self.line, node.line
+        result = generator(self, node)
+        self.line = line
+        return result
 
     def generic_gen(self, node):
         raise NotImplementedError(f"Generation not implemented for {type(node).__name__}")
 
     def generate_Program(self, node):
+        self.reset()
+        self.declare_functions(node)
+        # bind all names first, so errors surface before anything is emitted
+        self.resolver.resolve_functions(node)
+        if self.instrument is not None:
+            self.instrument.prepare(node)
+        if self.memoize is not None:
+            self.memoize.prepare(node)
+        # the nodes carry the profile from here on
+        if self.profile is not None and not self.profile.annotate(node):
+            self.profile = None
         self.assembly.extend([
-            "default rel",
-            "section .text",
-            "global main",
+            Directive("default rel"),
+            Directive("section .text"),
         ])
 
+        # export every defined function so separately compiled units can call each other
+        functions = [f for f in node.function_list if isinstance(f, Function)]
+        for function in functions:
+            # typed as functions, so profilers attribute samples to them
+            self.assembly.append(Directive(f"global {function.name}:function"))
+
+        # declared functions that aren't defined here come from other units
+        for func in self.function_prototypes:
+            if func not in self.defined_functions:
+                self.assembly.append(Directive(f"extern {func}"))
+        self.flush()
+        
         # generate code for all functions
+        if self.jobs > 1 and len(functions) > 1:
+            for records, stats in generate_functions_parallel(node, self.jobs, self.passes, self.instrument, self.source, self.memoize):
+                self.assembly.extend(records)
+                if stats is not None:
+                    self.passes.merge_stats(stats)
+                self.flush()
+        else:
+            for function in functions:
+                self.generate(function)
+                self.flush()
+
+        if self.instrument is not None:
+            self.emit_profile_runtime()
+            self.flush()
+
+        if self.writer is None:
+            return format_assembly(self.assembly)
+    
+    def declare_functions(self, node):
+        self.resolver = Resolver()
+        self.resolver.declare_functions(node)
         for function in node.function_list:
             if isinstance(function, FunctionDeclaration):
                 self.function_prototypes[function.name] = len(function.params)
             elif isinstance(function, Function):
                 self.defined_functions.add(function.name)
+                self.function_nodes[function.name] = function
                 self.function_prototypes[function.name] = len(function.parameters)
-        
-        for function in node.function_list:
-            if isinstance(function, Function):
-                self.generate(function)
-
-        # remove defined functions from prototypes 
-        for func in self.defined_functions:
-            self.function_prototypes.pop(func, None)
 
-        # add external function declaratiions at the beginning, after the initial directives
-        extern_declarations = [f"extern {func}" for func in self.function_prototypes.keys()]
-        self.assembly = self.assembly[:3] + extern_declarations + self.assembly[3:] 
-        
-        return "\n".join(self.assembly)
-    
     def generate_FunctionDeclaration(self, node):
-        self.scopes[0][node.name] = "function"
+        pass
 
     def generate_Function(self, node):
-        self.scopes[0][node.name] = "function"
         if not node.body: return
 
+        if self.passes:
+            node = self.passes.run_ast(node)
+        # AST passes can drop declarations, which moves the slots of later ones
+        if self.passes or node.name not in self.resolver.resolved:
+            self.resolver.resolve_function(node)
+            self.resolver.check()
+        function_start = len(self.assembly)
+
+        # labels are numbered per function; nasm scopes `.label`s to the enclosing function 
+        # label, so a function's code only depends on the function itself
+        self.label_count = 0
+        self.tables = []
+        self.cold = []
+        self.inline_bytes = 0
+        self.function_node = node
         self.current_function = self.new_label("function_end") # function end label
-        self.assembly.extend([
-            f"{node.name}:",
-            "    push rbp",
-            "    mov rbp, rsp"
-        ])
-        
-        self.enter_scope()
-        
-        # handle function parameters 
+        # a memoized function's name is the entry that looks its arguments up first
+        memoized = self.memoized(node.name)
+        self.label(f"{node.name}.memo_body" if memoized else node.name)
+        self.ins("push", "rbp")
+        self.ins("mov", "rbp", "rsp")
+
+        # the Resolver packed every variable of the function into the frame, reserve all of it
+        # at once
+        frame = self.frame_size(node)
+        frame_record = len(self.assembly)
+        if frame:
+            self.ins("sub", "rsp", str(frame))
+
+        # spill the parameters to their slots
         for i, param in enumerate(node.parameters):
-            self.stack_index += 8 
-            self.scopes[-1][param.name.value] = self.stack_index 
+            slot = f"[rbp - {self.offset(param.symbol)}]"
             if i < len(self.arg_registers):
-                self.assembly.append(f"    mov [rbp - {self.stack_index}], {self.arg_registers[i]}")
+                self.ins("mov", slot, self.reg(self.arg_registers[i], param.symbol.type))
+            else:
+                # the 7th argument onwards is passed on the stack, above the return address
+                self.ins("mov", "rax", f"[rbp + {16 + 8 * (i - len(self.arg_registers))}]")
+                self.ins("mov", slot, self.reg("rax", param.symbol.type))
+        if not memoized:
+            self.count(node)
 
         self.generate_statements(node.body)
-        self.exit_scope()
 
         # Function epilogue
+        self.label(self.current_function)
+        if self.instrument is not None and node.name == "main":
+            self.ins("push", "rax")
+            self.ins("call", "__pycc_profile_dump")
+            self.ins("pop", "rax")
+        self.ins("mov", "rsp", "rbp")
+        self.ins("pop", "rbp")
+        self.ins("ret")
+        for block in self.cold:
+            self.assembly.extend(block)
+        self.emit_tables()
+
+        if self.inline_bytes:
+            # inlined callees need room below the function's own slots
+            reserve = Instruction("sub", "rsp", str(frame + self.inline_bytes))
+            if frame:
+                self.assembly[frame_record] = reserve
+            else:
+                self.assembly.insert(frame_record, reserve)
+
+        if self.passes:
+            self.assembly[function_start:] = self.passes.run_asm(self.assembly[function_start:])
+        if memoized:
+            self.emit_memo_entry(node)
+
+    def memoized(self, name):
+        return self.memoize is not None and name in self.memoize.functions
+
+    def emit_memo_entry(self, node):
+        # hashes the int arguments to a slot of the function's memo table and returns the
+        # slot's result if it holds the same arguments; a miss calls the body and overwrites
+        # the slot. Slots are the arguments, the result and a used flag, 4 bytes each
+        from .purity import MEMO_HASH, memo_slot_bytes
+
+        count = len(node.parameters)
+        args = [DWORD_REGISTERS[register] for register in self.arg_registers[:count]]
+        slot = memo_slot_bytes(count)
+        table = f"{node.name}.memo_table"
+        bits = self.memoize.entries.bit_length() - 1
+
+        self.label(node.name)
+        self.count(node)
+        self.ins("mov", "eax", args[0])
+        self.ins("imul", "eax", "eax", str(MEMO_HASH))
+        for arg in args[1:]:
+            self.ins("xor", "eax", arg)
+            self.ins("imul", "eax", "eax", str(MEMO_HASH))
+        # the top bits of the product are the best mixed (shifts only use 5 bits of the count)
+        if bits:
+            self.ins("shr", "eax", str(32 - bits))
+        else:
+            self.ins("xor", "eax", "eax")
+        self.ins("shl", "eax", str(slot.bit_length() - 1))
+        self.ins("lea", "r10", f"[rel {table}]")
+        self.ins("add", "r10", "rax")
+        self.ins("cmp", f"dword [r10 + {4 * (count + 1)}]", "0")
+        self.ins("je", ".memo_miss")
+        for i, arg in enumerate(args):
+            self.ins("cmp", f"[r10 + {4 * i}]", arg)
+            self.ins("jne", ".memo_miss")
+        self.count(node, 1)
+        self.ins("mov", "eax", f"[r10 + {4 * count}]")
+        self.ins("ret")
+
+        # the slot and the arguments survive the call on the stack, which stays 16-byte aligned
+        self.label(".memo_miss")
+        self.ins("push", "rbp")
+        self.ins("mov", "rbp", "rsp")
+        saved = ["r10"] + self.arg_registers[:count]
+        for register in saved:
+            self.ins("push", register)
+        if len(saved) % 2:
+            self.ins("sub", "rsp", "8")
+        self.ins("call", f"{node.name}.memo_body")
+        self.ins("mov", "r10", "[rbp - 8]")
+        for i in range(count):
+            self.ins("mov", "ecx", f"[rbp - {16 + 8 * i}]")
+            self.ins("mov", f"[r10 + {4 * i}]", "ecx")
+        self.ins("mov", f"[r10 + {4 * count}]", "eax")
+        self.ins("mov", f"dword [r10 + {4 * (count + 1)}]", "1")
+        self.ins("mov", "rsp", "rbp")
+        self.ins("pop", "rbp")
+        self.ins("ret")
+
         self.assembly.extend([
-            f"{self.current_function}:",
-            "    mov rsp, rbp",
-            "    pop rbp",
-            "    ret"
+            Directive("section .bss"),
+            Directive(f"alignb {slot}"),
+            Label(table),
+            Directive(f"resb {self.memoize.entries * slot}"),
+            Directive("section .text"),
         ])
 
     def generate_FunctionCall(self, node): 
         #param_count = self.function_prototypes.get(node.name.value, len(node.params))
         param_count = len(node.params)
 
+        callee = self.inline_callee(node)
+
         # evaluate and push arguments in reverse order 
         for arg in reversed(node.params):
             self.generate(arg)
-            self.assembly.append("    push rax")
+            self.ins("push", "rax")
 
         # pop arguments into the appropriate registers 
         for i in range(min(param_count, len(self.arg_registers))):
-            self.assembly.append(f"    pop {self.arg_registers[i]}")
+            self.ins("pop", self.arg_registers[i])
+
+        if callee is not None:
+            self.inline(callee)
+            return
+        self.count(node)
         
         # align stack to 16 bytes 
-        if param_count % 2 != 0:
-            self.assembly.append("    sub rsp, 8")
+        stack_args = max(0, param_count - len(self.arg_registers))
+        if param_count % 2 != 0 and not stack_args:
+            self.ins("sub", "rsp", "8")
 
         # call the function 
-        self.assembly.append(f"    call {node.name.value}")
+        self.ins("call", node.name.value)
 
         # restore stack alignment if adjusted
         #stack_cleanup = max(0, param_count - len(self.arg_registers)) * 8
         #if stack_cleanup > 0 or param_count % 2 == 1:
         #    cleanup_amount = stack_cleanup + (8 if param_count % 2 == 1 else 0)
         #    self.assembly.append(f"    add rsp, {cleanup_amount}")
-        if param_count % 2 != 0:
-            self.assembly.append("    add rsp, 8")
+        if param_count % 2 != 0 and not stack_args:
+            self.ins("add", "rsp", "8")
+        if stack_args:
+            self.ins("add", "rsp", str(8 * stack_args))
+
+    def inline_callee(self, node):
+        # the function to inline at a hot call site, if any: small, not the caller itself and
+        # taking its arguments in registers; bodies inlined once aren't inlined into again
+        profile = getattr(node, "profile", None)
+        callee = self.function_nodes.get(node.name.value)
+        if profile is None or profile[0] < PROFILE_INLINE_CALLS or callee is None or self.inlining:
+            return None
+        # inlining would skip the memo table
+        if self.memoized(callee.name):
+            return None
+        if callee is self.function_node or not callee.body or len(callee.parameters) > len(self.arg_registers):
+            return None
+        from .instrument import count_nodes
+        if count_nodes(callee.body) > PROFILE_INLINE_NODES:
+            return None
+        return callee
+
+    def inline(self, callee):
+        # the callee's body in place of the call, with the arguments in its registers already;
+        # its variables live below the caller's frame and its returns jump past the body
+        saved = (self.current_function, self.loop_stack, self.frame_base)
+        self.current_function = self.new_label("inline_end")
+        self.loop_stack = []
+        self.frame_base = self.frame_size(self.function_node)
+        self.inline_bytes = max(self.inline_bytes, self.frame_size(callee))
+        self.inlining = True
+        for i, param in enumerate(callee.parameters):
+            self.ins("mov", f"[rbp - {self.offset(param.symbol)}]", self.reg(self.arg_registers[i], param.symbol.type))
+        self.generate_statements(callee.body)
+        self.label(self.current_function)
+        self.inlining = False
+        self.current_function, self.loop_stack, self.frame_base = saved
+
+    def count(self, node, counter=0):
+        # bump one of the node's profile counters in an instrumented build
+        if self.instrument is not None and hasattr(node, "counters"):
+            self.ins("inc", f"qword [rel __pycc_counters + {8 * node.counters[counter]}]")
+
+    def out_of_line(self, stmt, return_label):
+        # generates a cold statement after the function's code, returns the label to jump to
+        label = self.new_label("cold")
+        hot, self.assembly = self.assembly, [Label(label)]
+        self.generate(stmt)
+        self.ins("jmp", return_label)
+        self.cold.append(self.assembly)
+        self.assembly = hot
+        return label
 
     def generate_Block(self, node):
-        self.enter_scope()
         self.generate_statements(node.statements)
-        self.exit_scope()
 
     def generate_statements(self, statements):
         if isinstance(statements, list):
@@ -153,263 +487,778 @@ class ASMGenerator:
         if node.expression:
             self.generate(node.expression)
         else:
-            self.assembly.append("    xor rax, rax") # return 0 if no expression
-        self.assembly.append(f"    jmp {self.current_function}")
+            self.ins("xor", "eax", "eax") # return 0 if no expression
+        self.ins("jmp", self.current_function)
 
     def generate_Number(self, node):
-        self.assembly.append(f"    mov rax, {node.value.value}")
+        # literals too large for an int wrap around like everything else
+        self.ins("mov", "eax", str(wrap(int(node.value.value))))
 
     def generate_UnaryOps(self, node):
         self.generate(node.right)
-        self.assembly.append("    pop rax")
-
-        op_map = {
-            TokenType.MINUS: "    neg rax",
-            TokenType.LOGICAL_NEGATION: [
-                "    cmp rax, 0",
-                "    sete al",
-                "    movzx rax, al"
-            ],
-            TokenType.BITWISE_COMPLEMENT: "    not rax"
-        }
-
-        op_asm = op_map.get(node.op.type)
+
+        op_asm = UNARY_OPS.get(node.op.type)
         if op_asm:
-            if isinstance(op_asm, list):
-                self.assembly.extend(op_asm)
-            else:
-                self.assembly.append(op_asm)
+            for instruction in op_asm:
+                self.ins(*instruction)
         else:
             raise NotImplementedError(f"Unary operation {node.op.type} not implemented.")
 
-        self.assembly.append("    push rax")
-
     def generate_BinaryOps(self, node):
-        if node.op.type in [TokenType.OR, TokenType.AND]:
+        if node.op.type in (TokenType.OR, TokenType.AND):
             end_label = self.new_label("logical_end")
             self.generate(node.left)
-            self.assembly.append("    pop rax")
-            self.assembly.append("    cmp rax, 0")
+            self.test(node.left)
 
             if node.op.type == TokenType.OR:
-                self.assembly.append(f"    jne {end_label}")
+                self.ins("jne", end_label)
             else:
-                self.assembly.append(f"    je {end_label}")
+                self.ins("je", end_label)
 
             self.generate(node.right)
-            self.assembly.append(f"{end_label}:")
+            self.test(node.right)
+            self.label(end_label)
+            self.ins("setne", "al") # normalize the result to 0 or 1
+            self.ins("movzx", "eax", "al")
             return
 
         self.generate(node.left)
-        self.assembly.append("    push rax") # save left operand result
+        self.ins("push", "rax") # save left operand result
         self.generate(node.right)
-        self.assembly.append("    pop rbx") # retrieve left operand result
-
-        op_map = {
-            TokenType.PLUS: "    add rax, rbx",
-            TokenType.MINUS: [
-                "    sub rbx, rax",
-                "    mov rax, rbx"
-            ],
-            TokenType.STAR: "    imul rbx",
-            TokenType.SLASH: [
-                "    mov rcx, rax", # save divisor
-                "    mov rax, rbx", # move dividend to rax 
-                "    cqo",          # sign-extend rax into rdx:rax
-                "    idiv rcx",     # divide rdx:rax by rcx
-            ],
-            TokenType.PERCENT:  [
-                "    mov rcx, rax", # save divisor
-                "    mov rax, rbx", # move dividend to rax 
-                "    cqo",          # sign-extend rax into rdx:rax 
-                "    idiv rcx",     # divide rdx:rax by rcx 
-                "    mov rax, rdx"  # move remainder to rax
-            ],
-            TokenType.BITWISE_OR: "    or rax, rbx",
-            TokenType.BITWISE_AND: "    and rax, rbx",
-            TokenType.BITWISE_XOR: "    xor rax, rbx",
-            TokenType.BITWISE_SHIFT_LEFT: [
-                "    mov rcx, rbx",
-                "    mov rax, rbx",
-                "    shl rax, cl"
-            ],
-            TokenType.BITWISE_SHIFT_RIGHT:  [
-                "    mov rcx, rbx",
-                "    mov rax, rbx",
-                "    shr rax, cl"
-            ]
-        }
-
-        compare_ops = {
-            TokenType.EQUAL: "sete",
-            TokenType.NOT_EQUAL: "setne",
-            TokenType.LESS_THAN: "setl",
-            TokenType.LESS_THAN_OR_EQUAL: "setle",
-            TokenType.GREATER_THAN: "setg",
-            TokenType.GREATER_THAN_OR_EQUAL: "setge"
-        }
-
-        if node.op.type in compare_ops:
-            self.assembly.extend([
-                "    cmp rax, rbx",
-                f"    {compare_ops[node.op.type]} al",
-                "    movzx rax, al"
-            ])
+        self.ins("pop", "rbx") # retrieve left operand result
+
+        left, right = self.ctype(node.left), self.ctype(node.right)
+        if is_pointer(left) or is_pointer(right):
+            self.pointer_operation(node, left, right)
+        elif node.op.type in COMPARE_OPS:
+            self.ins("cmp", "ebx", "eax") # left operand is in rbx
+            self.ins(COMPARE_OPS[node.op.type], "al")
+            self.ins("movzx", "eax", "al")
         else:
-            op_asm = op_map.get(node.op.type)
+            op_asm = BINARY_OPS.get(node.op.type)
             if op_asm:
-                if isinstance(op_asm, list):
-                    self.assembly.extend(op_asm)
-                else:
-                    self.assembly.append(op_asm)
+                for instruction in op_asm:
+                    self.ins(*instruction)
             else:
                 raise NotImplementedError(f"Binary operation {node.op.type} not implemented.")
 
+    def pointer_operation(self, node, left, right):
+        # 64-bit arithmetic with the left operand in rbx and the right one in rax; int operands
+        # are sign-extended first and pointer arithmetic counts in elements
+        if not is_pointer(left):
+            self.ins("movsxd", "rbx", "ebx")
+            if node.op.type == TokenType.PLUS:
+                self.ins("imul", "rbx", "rbx", str(self.size(right[:-1])))
+        if not is_pointer(right):
+            self.ins("movsxd", "rax", "eax")
+            if node.op.type in (TokenType.PLUS, TokenType.MINUS):
+                self.ins("imul", "rax", "rax", str(self.size(left[:-1])))
+
+        if node.op.type in COMPARE_OPS:
+            self.ins("cmp", "rbx", "rax")
+            self.ins(COMPARE_OPS[node.op.type], "al")
+            self.ins("movzx", "eax", "al")
+        elif node.op.type == TokenType.PLUS:
+            self.ins("add", "rax", "rbx")
+        elif node.op.type == TokenType.MINUS:
+            self.ins("sub", "rbx", "rax")
+            self.ins("mov", "rax", "rbx")
+            if is_pointer(right):
+                # the distance of two pointers in elements
+                self.ins("sar", "rax", str(self.size(left[:-1]).bit_length() - 1))
+        else:
+            raise NotImplementedError(f"Binary operation {node.op.type} not implemented for pointers.")
+
 
     def generate_Declaration(self, node):
-        self.stack_index += 8 
-        self.scopes[-1][node.name] = self.stack_index 
-        self.assembly.append(f"    sub rsp, 8")
+        # the slot is part of the frame already
+        self.initialize(node)
 
+    def initialize(self, node):
+        offset = self.offset(node.symbol)
+        if node.size is not None:
+            return # arrays start out uninitialized, as in C
         if node.exp:
             self.generate(node.exp)
-            self.assembly.append(f"    mov [rbp - {self.stack_index}], rax")
+            self.convert(self.ctype(node.exp), node.symbol.type)
+            self.ins("mov", f"[rbp - {offset}]", self.reg("rax", node.symbol.type))
         else:
-            self.assembly.append(f"    mov qword [rbp - {self.stack_index}], 0")
+            width = "dword" if self.size(node.symbol.type) == 4 else "qword"
+            self.ins("mov", f"{width} [rbp - {offset}]", "0")
 
     def generate_Assign(self, node):
         self.generate(node.exp)
-        offset = self.find_variable(node.name.value)
-        self.assembly.append(f"    mov [rbp - {offset}], rax")
+        self.convert(self.ctype(node.exp), node.symbol.type)
+        self.ins("mov", f"[rbp - {self.offset(node.symbol)}]", self.reg("rax", node.symbol.type))
 
     def generate_Variable(self, node):
-        offset = self.find_variable(node.name.value)
-        self.assembly.append(f"    mov rax, [rbp - {offset}]")
+        if node.symbol.size is not None:
+            # an array evaluates to the address of its first element
+            self.ins("lea", "rax", f"[rbp - {self.offset(node.symbol)}]")
+        else:
+            self.ins("mov", self.reg("rax", node.symbol.type), f"[rbp - {self.offset(node.symbol)}]")
+
+    def generate_Subscript(self, node):
+        self.address(node)
+        self.ins("mov", self.reg("rax", node.ctype), "[rax]")
+
+    def generate_Dereference(self, node):
+        self.generate(node.operand)
+        self.ins("mov", self.reg("rax", node.ctype), "[rax]")
+
+    def generate_AddressOf(self, node):
+        self.address(node.operand)
+
+    def generate_Store(self, node):
+        self.address(node.target)
+        self.ins("push", "rax")
+        self.generate(node.exp)
+        self.convert(self.ctype(node.exp), node.target.ctype)
+        self.ins("pop", "rcx")
+        self.ins("mov", "[rcx]", self.reg("rax", node.target.ctype))
+
+    def address(self, node):
+        # address of an lvalue into rax
+        if isinstance(node, Variable):
+            self.ins("lea", "rax", f"[rbp - {self.offset(node.symbol)}]")
+        elif isinstance(node, Subscript):
+            self.generate(node.index)
+            self.ins("movsxd", "rax", "eax")
+            self.ins("push", "rax")
+            self.generate(node.array)
+            self.ins("pop", "rcx")
+            self.ins("lea", "rax", f"[rax + rcx*{self.size(node.ctype)}]")
+        elif isinstance(node, Dereference):
+            self.generate(node.operand)
+        else:
+            raise Exception(f"Cannot take the address of {type(node).__name__}")
 
     def generate_Conditional(self, node):
+        # instrumented builds count both branches, so they keep them
+        plan = getattr(node, "select", None)
+        if plan is not None and self.instrument is None and self.selectable(plan):
+            self.generate_select(node, plan)
+            return
+
         end_label = self.new_label("end")
         else_label = self.new_label("else")
 
         self.generate(node.condition)
-        self.assembly.extend([
-            "    cmp rax, 0",
-            f"    je {else_label}"
-        ])
+        self.test(node.condition)
+
+        # with a profile the hot branch falls through and a cold one moves out of line; so
+        # does a mostly skipped if without else
+        taken, skipped = getattr(node, "profile", (0, 0))
+        cold = PROFILE_COLD_RATIO * (taken + skipped)
+        if skipped > taken:
+            if taken <= cold or not node.else_stmt:
+                taken = 0
+                self.ins("jne", self.out_of_line(node.if_stmt, end_label))
+            else:
+                then_label = self.new_label("then")
+                self.ins("jne", then_label)
+            if node.else_stmt:
+                self.generate(node.else_stmt)
+            if taken > cold:
+                self.ins("jmp", end_label)
+                self.label(then_label)
+                self.generate(node.if_stmt)
+            self.label(end_label)
+            return
+        if node.else_stmt and taken and skipped <= cold:
+            self.ins("je", self.out_of_line(node.else_stmt, end_label))
+            self.generate(node.if_stmt)
+            self.label(end_label)
+            return
 
+        self.ins("je", else_label)
+        self.count(node, 0)
         self.generate(node.if_stmt)
-        self.assembly.append(f"    jmp {end_label}")
+        self.ins("jmp", end_label)
 
-        self.assembly.append(f"{else_label}:")
+        self.label(else_label)
+        self.count(node, 1)
         if node.else_stmt:
             self.generate(node.else_stmt)
 
-        self.assembly.append(f"{end_label}:")
+        self.label(end_label)
+
+    def selectable(self, plan):
+        # IfConvert only matched the shape; cmov picks between ints and stores into an int
+        values = [plan.then] + ([plan.other] if plan.other is not None else [])
+        if any(self.ctype(value) != "int" for value in values):
+            return False
+        return plan.target is None or (plan.target.symbol.type == "int" and plan.target.symbol.size is None)
+
+    def generate_select(self, node, plan):
+        # both values go on the stack, the condition sets the flags and cmov picks
+        self.generate(plan.then)
+        self.ins("push", "rax")
+        if plan.other is not None:
+            self.generate(plan.other)
+        else:
+            self.ins("mov", "eax", f"[rbp - {self.offset(plan.target.symbol)}]")
+        self.ins("push", "rax")
+        condition = self.flags(node.condition)
+        self.ins("pop", "rcx")
+        self.ins("pop", "rdx")
+        self.ins("mov", "eax", "ecx")
+        self.ins(f"cmov{condition}", "eax", "edx")
+        if plan.target is not None:
+            self.ins("mov", f"[rbp - {self.offset(plan.target.symbol)}]", "eax")
+
+    def flags(self, node):
+        # sets the flags by a condition, returns the condition code under which it holds; int
+        # comparisons compare directly instead of materializing 0 or 1 first
+        if isinstance(node, BinaryOps) and node.op.type in CONDITION_CODES \
+                and self.ctype(node.left) == "int" and self.ctype(node.right) == "int":
+            self.generate(node.left)
+            self.ins("push", "rax")
+            self.generate(node.right)
+            self.ins("pop", "rbx")
+            self.ins("cmp", "ebx", "eax")
+            return CONDITION_CODES[node.op.type]
+        self.generate(node)
+        self.test(node)
+        return "ne"
+
+    def rotate(self, node):
+        # loops that usually run their body more than once test their condition at the bottom
+        entries, iterations = getattr(node, "profile", (0, 0))
+        return node.condition is not None and entries and iterations >= PROFILE_LOOP_TRIPS * entries
 
     def generate_For(self, node):
         loop_start = self.new_label("for_start")
+        loop_update = self.new_label("for_update")
         loop_end = self.new_label("for_end")
 
-        self.enter_loop(loop_start, loop_end)
         # Generate Initialization 
         if node.init:
             self.generate(node.init)
-        self.assembly.append(f"{loop_start}:")
+        self.count(node, 0)
+        # a vectorized loop runs as far as it can, the scalar loop below does the rest
+        plan = getattr(node, "vector", None)
+        if plan is not None and self.vectorizable(plan):
+            self.generate_vector_loop(plan)
+        self.enter_loop(loop_update, loop_end)
+        rotated = self.rotate(node)
+        if rotated:
+            loop_condition = self.new_label("for_condition")
+            self.ins("jmp", loop_condition)
+        self.label(loop_start)
 
         # Generate Condition 
-        if node.condition:
+        if node.condition and not rotated:
             self.generate(node.condition)
-            self.assembly.extend([
-                "    cmp rax, 0",
-                f"    je {loop_end}"
-            ])
+            self.test(node.condition)
+            self.ins("je", loop_end)
 
         # Generate loop body 
+        self.count(node, 1)
         self.generate(node.stmt)
 
         # Generate Update 
+        self.label(loop_update)
         if node.update:
             self.generate(node.update)
 
         # jump back to start 
-        self.assembly.append(f"    jmp {loop_start}")
+        if rotated:
+            self.label(loop_condition)
+            self.generate(node.condition)
+            self.test(node.condition)
+            self.ins("jne", loop_start)
+        else:
+            self.ins("jmp", loop_start)
         # end of loop
-        self.assembly.append(f"{loop_end}:")
+        self.label(loop_end)
         self.exit_loop()
 
     def generate_While(self, node):
         loop_start = self.new_label("while_start")
         loop_end = self.new_label("while_end")
 
+        self.count(node, 0)
+        if self.rotate(node):
+            loop_body = self.new_label("while_body")
+            self.enter_loop(loop_start, loop_end)
+            self.ins("jmp", loop_start)
+            self.label(loop_body)
+            self.generate(node.stmt)
+            self.label(loop_start) # the condition, at the bottom
+            self.generate(node.condition)
+            self.test(node.condition)
+            self.ins("jne", loop_body)
+            self.label(loop_end)
+            self.exit_loop()
+            return
+
         self.enter_loop(loop_start, loop_end)
-        self.assembly.append(f"{loop_start}:") # loop start
+        self.label(loop_start) # loop start
         # Generate Condition 
         if node.condition:
             self.generate(node.condition)
-            self.assembly.extend([
-                "    cmp rax, 0",
-                f"    je {loop_end}"
-            ])
+            self.test(node.condition)
+            self.ins("je", loop_end)
         # Generate loop body 
+        self.count(node, 1)
         self.generate(node.stmt)
         # jump back to start 
-        self.assembly.append(f"    jmp {loop_start}")
+        self.ins("jmp", loop_start)
         # end of loop 
-        self.assembly.append(f"{loop_end}:")
+        self.label(loop_end)
         self.exit_loop()
 
     def generate_Do(self, node):
         loop_start = self.new_label("do_start")
+        loop_condition = self.new_label("do_condition")
         loop_end = self.new_label("do_end")
 
-        self.enter_loop(loop_start, loop_end)
-        self.assembly.append(f"{loop_start}:") # loop start 
+        self.enter_loop(loop_condition, loop_end)
+        self.count(node, 0)
+        self.label(loop_start) # loop start 
+        self.count(node, 1)
         self.generate(node.stmt) # loop body
 
+        self.label(loop_condition)
         self.generate(node.exp) # while condition
+        self.test(node.exp)
+        self.ins("jne", loop_start) # jump back to start if condition is true
+        self.label(loop_end) # loop end
+        self.exit_loop()
+
+    def generate_Switch(self, node):
+        end_label = self.new_label("switch_end")
+        labels = {id(case): self.new_label("case") for case in node.cases}
+        default_label = end_label
+        if node.default is not None:
+            default_label = labels[id(node.default)] = self.new_label("switch_default")
+
+        self.generate(node.condition)
+        # break leaves the switch, continue still belongs to the enclosing loop
+        self.enter_loop(None, end_label)
+
+        # the Resolver gave every declaration in the body its own slot, so a case that skips a
+        # declaration can still use the variable
+        entries = switch_statements(node)
+        cases = sorted((case.constant, labels[id(case)]) for case in node.cases)
+        self.dispatch(cases, default_label)
+
+        for case_labels, stmt in entries:
+            for case in case_labels:
+                self.label(labels[id(case)])
+            if isinstance(stmt, Declaration):
+                self.initialize(stmt)
+            elif stmt is not None:
+                self.generate(stmt)
+
+        self.label(end_label)
+        self.exit_loop()
+
+    def dispatch(self, cases, default_label):
+        # jump to the label of the case matching rax, cases are sorted (value, label) pairs
+        lowering = switch_lowering([value for value, _ in cases])
+        if lowering == "linear":
+            self.linear_dispatch(cases, default_label)
+        elif lowering == "table":
+            self.table_dispatch(cases, default_label)
+        else:
+            self.search_dispatch(cases, default_label)
+
+    def linear_dispatch(self, cases, default_label):
+        for value, label in cases:
+            self.compare(value)
+            self.ins("je", label)
+        self.ins("jmp", default_label)
+
+    def search_dispatch(self, cases, default_label):
+        # balanced binary search, small ranges end in a linear chain
+        if len(cases) <= SWITCH_LINEAR_MAX:
+            self.linear_dispatch(cases, default_label)
+            return
+        mid = len(cases) // 2
+        value, label = cases[mid]
+        upper = self.new_label("switch_upper")
+        self.compare(value)
+        self.ins("je", label)
+        self.ins("jg", upper)
+        self.search_dispatch(cases[:mid], default_label)
+        self.label(upper)
+        self.search_dispatch(cases[mid + 1:], default_label)
+
+    def table_dispatch(self, cases, default_label):
+        low, high = cases[0][0], cases[-1][0]
+        if low != 0:
+            self.ins("sub", "eax", str(low))
+        # values below the lowest case wrap around to large unsigned numbers; writing eax
+        # cleared the upper half of rax for the table index
+        self.ins("cmp", "eax", str(high - low))
+        self.ins("ja", default_label)
+
+        targets = dict(cases)
+        table = self.new_label("switch_table")
+        self.tables.append((table, [targets.get(value, default_label) for value in range(low, high + 1)]))
+        self.ins("lea", "rcx", f"[rel {table}]")
+        self.ins("jmp", "[rcx + rax*8]")
+
+    def compare(self, value):
+        self.ins("cmp", "eax", str(value))
+
+    def emit_tables(self):
+        # jump tables of the function's switches go to read-only data after its code
+        if not self.tables:
+            return
+        self.assembly.extend([Directive("section .rodata"), Directive("align 8")])
+        for table, targets in self.tables:
+            self.label(table)
+            for i in range(0, len(targets), 8):
+                self.assembly.append(Directive(f"dq {', '.join(targets[i:i + 8])}"))
+        self.assembly.append(Directive("section .text"))
+
+    def emit_profile_runtime(self):
+        # __pycc_profile_dump writes the profile header and the counters with raw system calls,
+        # so instrumented programs need nothing but the kernel
+        from .profile import PROFILE_MAGIC
+
+        instrument = self.instrument
+        self.label("__pycc_profile_dump")
+        self.ins("mov", "eax", "2")                     # open(path, O_WRONLY | O_CREAT | O_TRUNC, 0644)
+        self.ins("lea", "rdi", "[rel __pycc_profile_path]")
+        self.ins("mov", "esi", "577")
+        self.ins("mov", "edx", "420")
+        self.ins("syscall")
+        self.ins("test", "eax", "eax")
+        self.ins("js", ".profile_done")
+        self.ins("mov", "edi", "eax")
+        self.ins("mov", "eax", "1")                     # write(fd, header and counters)
+        self.ins("lea", "rsi", "[rel __pycc_profile]")
+        self.ins("mov", "edx", str(8 * (3 + instrument.counters)))
+        self.ins("syscall")
+        self.ins("mov", "eax", "3")                     # close(fd)
+        self.ins("syscall")
+        self.label(".profile_done")
+        self.ins("ret")
+
+        path = ", ".join(str(byte) for byte in instrument.path.encode()) + ", 0"
         self.assembly.extend([
-            "    cmp rax, 0",
-            f"    jne {loop_start}" # jump back to start if condition is true
+            Directive("section .data"),
+            Directive("align 8"),
+            Label("__pycc_profile"),
+            Directive(f"dq {PROFILE_MAGIC:#x}, {instrument.fingerprint:#x}, {instrument.counters}"),
+            Label("__pycc_counters"),
+            Directive(f"times {instrument.counters} dq 0"),
+            Directive("section .rodata"),
+            Label("__pycc_profile_path"),
+            Directive(f"db {path}"),
+            Directive("section .text"),
         ])
-        self.assembly.append(f"{loop_end}:") # loop end
-        self.exit_loop()
+
+    def vectorizable(self, plan):
+        # Vectorize only matched the shape, the types and aliasing come from the symbols: the
+        # scalars have to be ints nothing takes the address of (a store through a pointer
+        # could change them otherwise) and every load an int element
+        leaves = []
+        self.vector_leaves(plan.expression, leaves)
+        scalars = [plan.limit] + [leaf for leaf in leaves if not isinstance(leaf, Subscript)]
+        if plan.kind == "reduce":
+            # the matcher's accumulator Variable is bound like the assignment it came from
+            plan.target.symbol = plan.statement.symbol
+            scalars.append(plan.target)
+        for leaf in scalars:
+            if isinstance(leaf, Variable) and (leaf.symbol.type != "int" or not leaf.symbol.register_candidate):
+                return False
+        loads = [leaf for leaf in leaves if isinstance(leaf, Subscript)]
+        if plan.kind == "map":
+            loads.append(plan.target)
+        if any(load.ctype != "int" for load in loads if isinstance(load, Subscript)):
+            return False
+        if plan.kind == "map" and plan.target.ctype != "int*":
+            return False
+        index = self.vector_index(loads)
+        if index is None or index.symbol.type != "int" or not index.symbol.register_candidate:
+            return False
+        invariants = {self.vector_key(leaf) for leaf in scalars[1:]}
+        return len(self.vector_bases(plan)) <= len(VECTOR_BASES) and len(invariants) <= len(VECTOR_INVARIANTS) \
+            and self.vector_registers(plan.expression) + (2 if plan.op in ("min", "max") else 0) <= len(VECTOR_TEMPS)
+
+    def vector_leaves(self, node, leaves):
+        if isinstance(node, BinaryOps):
+            self.vector_leaves(node.left, leaves)
+            self.vector_leaves(node.right, leaves)
+        elif isinstance(node, Conditional):
+            self.vector_leaves(node.condition.left, leaves)
+            self.vector_leaves(node.condition.right, leaves)
+        else:
+            leaves.append(node)
+
+    def vector_index(self, loads):
+        # the counter Variable as the resolver bound it, taken from any load
+        for load in loads:
+            if isinstance(load, Subscript):
+                return load.index
+        return None
+
+    def vector_key(self, leaf):
+        return int(leaf.value.value) if isinstance(leaf, Number) else leaf.name.value
+
+    def vector_bases(self, plan):
+        # every distinct array or pointer the loop reads or writes, with the Variable to load it
+        leaves = []
+        self.vector_leaves(plan.expression, leaves)
+        bases = {}
+        if plan.kind == "map":
+            bases[plan.target.name.value] = plan.target
+        for leaf in leaves:
+            if isinstance(leaf, Subscript):
+                bases.setdefault(leaf.array.name.value, leaf.array)
+        return bases
+
+    def vector_registers(self, node):
+        # temporaries needed to evaluate an expression, Sethi-Ullman style
+        if isinstance(node, BinaryOps):
+            left, right = self.vector_registers(node.left), self.vector_registers(node.right)
+            return max(left, right + 1)
+        if isinstance(node, Conditional):
+            left, right = self.vector_registers(node.condition.left), self.vector_registers(node.condition.right)
+            return max(left, right + 1) + 2
+        return 1
+
+    def generate_vector_loop(self, plan):
+        lanes = VECTOR_BYTES // self.size("int")
+        scale = self.size("int")
+        loop_start = self.new_label("vector_loop")
+        loop_end = self.new_label("vector_done")
+
+        # array pointers, broadcast invariants and the limit stay in registers for the whole loop
+        self.vector_registers_of = {}
+        bases = self.vector_bases(plan)
+        for name, register in zip(bases, VECTOR_BASES):
+            self.generate(bases[name])
+            self.ins("mov", register, "rax")
+            self.vector_registers_of[("base", name)] = register
+
+        invariants = iter(VECTOR_INVARIANTS)
+        leaves = []
+        self.vector_leaves(plan.expression, leaves)
+        for leaf in leaves:
+            if isinstance(leaf, Subscript):
+                continue
+            key = ("invariant", self.vector_key(leaf))
+            if key not in self.vector_registers_of:
+                self.vector_registers_of[key] = self.broadcast(leaf, next(invariants))
+
+        if plan.kind == "reduce":
+            accumulator = next(invariants)
+            if plan.op in (TokenType.PLUS, TokenType.BITWISE_XOR):
+                self.ins("pxor", accumulator, accumulator)
+            else:
+                # s & s, s | s, min(s, s) and max(s, s) are all s
+                self.broadcast(plan.target, accumulator)
+
+        # counter and limit are compared and used as indexes in 64 bits
+        self.generate(plan.limit)
+        self.ins("movsxd", "rdx", "eax")
+        counter = self.vector_index(leaves + ([plan.target] if plan.kind == "map" else []))
+        self.ins("movsxd", "rcx", f"dword [rbp - {self.offset(counter.symbol)}]")
+
+        if plan.kind == "map":
+            # a store that lands in a later element of one of the sources within the same
+            # vector would be read too early; that can only happen through pointers
+            target = bases[plan.target.name.value]
+            for name, variable in bases.items():
+                if name == plan.target.name.value or (target.symbol.size is not None and variable.symbol.size is not None):
+                    continue
+                self.ins("mov", "rax", self.vector_registers_of[("base", plan.target.name.value)])
+                self.ins("sub", "rax", self.vector_registers_of[("base", name)])
+                self.ins("sub", "rax", "1")
+                self.ins("cmp", "rax", str(VECTOR_BYTES - 1))
+                self.ins("jb", loop_end)
+
+        self.label(loop_start)
+        self.ins("lea", "rax", f"[rcx + {lanes}]")
+        self.ins("cmp", "rax", "rdx")
+        self.ins("jg", loop_end)
+        self.vector_free = list(VECTOR_TEMPS)
+        value = self.vector_expression(plan.expression)
+        if plan.kind == "map":
+            base = self.vector_registers_of[("base", plan.target.name.value)]
+            self.ins("movdqu", f"[{base} + rcx*{scale}]", value)
+        else:
+            self.vector_combine(plan.op, accumulator, value)
+        self.ins("add", "rcx", str(lanes))
+        self.ins("jmp", loop_start)
+        self.label(loop_end)
+        self.ins("mov", f"[rbp - {self.offset(counter.symbol)}]", "ecx")
+
+        if plan.kind == "reduce":
+            # fold the lanes pairwise, then the value the accumulator had before the loop
+            self.vector_free = list(VECTOR_TEMPS)
+            for shuffle in ("0x4E", "0xB1"):
+                upper = self.vector_temp()
+                self.ins("pshufd", upper, accumulator, shuffle)
+                self.vector_combine(plan.op, accumulator, upper)
+            self.ins("movd", "eax", accumulator)
+            offset = self.offset(plan.target.symbol)
+            if plan.op == TokenType.PLUS:
+                self.ins("add", "eax", f"[rbp - {offset}]")
+            elif plan.op == TokenType.BITWISE_XOR:
+                self.ins("xor", "eax", f"[rbp - {offset}]")
+            self.ins("mov", f"[rbp - {offset}]", "eax")
+
+    def broadcast(self, leaf, register):
+        self.generate(leaf)
+        self.ins("movd", register, "eax")
+        self.ins("pshufd", register, register, "0")
+        return register
+
+    def vector_temp(self):
+        return self.vector_free.pop(0)
+
+    def vector_release(self, register):
+        if register in VECTOR_TEMPS and register not in self.vector_free:
+            self.vector_free.insert(0, register)
+
+    def vector_expression(self, node):
+        # evaluates the elementwise expression for lanes i.. into an xmm register
+        if isinstance(node, Subscript):
+            register = self.vector_temp()
+            base = self.vector_registers_of[("base", node.array.name.value)]
+            self.ins("movdqu", register, f"[{base} + rcx*{self.size(node.ctype)}]")
+            return register
+        if isinstance(node, BinaryOps):
+            left = self.vector_expression(node.left)
+            right = self.vector_expression(node.right)
+            if left not in VECTOR_TEMPS:
+                # invariants are shared, work on a copy
+                copy = self.vector_temp()
+                self.ins("movdqa", copy, left)
+                left = copy
+            self.ins(VECTOR_OPS[node.op.type], left, right)
+            self.vector_release(right)
+            return left
+        if isinstance(node, Conditional):
+            left = self.vector_expression(node.condition.left)
+            right = self.vector_expression(node.condition.right)
+            return self.vector_select(node.selection, left, right)
+        return self.vector_registers_of[("invariant", self.vector_key(node))]
+
+    def vector_combine(self, op, accumulator, value):
+        if op in ("min", "max"):
+            result = self.vector_select(op, accumulator, value)
+            self.ins("movdqa", accumulator, result)
+            self.vector_release(result)
+        else:
+            self.ins(VECTOR_OPS[op], accumulator, value)
+            self.vector_release(value)
+
+    def vector_select(self, kind, a, b):
+        # SSE2 has no pminsd/pmaxsd, blend on the a > b mask instead: max picks a where it's
+        # set, min picks b there
+        mask, blend = self.vector_temp(), self.vector_temp()
+        self.ins("movdqa", mask, a)
+        self.ins("pcmpgtd", mask, b)
+        high, low = (a, b) if kind == "max" else (b, a)
+        self.ins("movdqa", blend, mask)
+        self.ins("pand", blend, high)
+        self.ins("pandn", mask, low)
+        self.ins("por", mask, blend)
+        self.vector_release(blend)
+        self.vector_release(a)
+        self.vector_release(b)
+        return mask
 
     def generate_Break(self, node):
         if not self.loop_stack:
-            raise Exception("Break statement outside of loop")
+            raise Exception("Break statement outside of loop or switch")
         _, end_label = self.loop_stack[-1]
-        self.assembly.append(f"    jmp {end_label}")
+        self.ins("jmp", end_label)
 
     def generate_Continue(self, node):
-        if not self.loop_stack:
+        # switches on the loop stack have no continue label of their own
+        loops = [loop for loop in self.loop_stack if loop[0] is not None]
+        if not loops:
             raise Exception("Continue statement outside of loop")
-        start_label, _ = self.loop_stack[-1]
-        self.assembly.append(f"    jmp {start_label}")
+        continue_label, _ = loops[-1]
+        self.ins("jmp", continue_label)
 
     def new_label(self, prefix):
         self.label_count += 1
         return f".{prefix}_{self.label_count}"
 
-    def emit(self, output_file="output.s", output_exe="out.exe"):
-        output_dir = "./bin"
+    def emit(self, output_file="output.s", output_exe="out.exe", output_dir="./bin", report=None, program=None):
+        # only needed when actually assembling, keep them off the import path
+        import os
+        import subprocess
+        from .instrument import PhaseReport
+
+        report = report or PhaseReport(enabled=False)
         os.makedirs(output_dir, exist_ok=True)
 
         output_file = os.path.join(output_dir, output_file)
         output_exe = os.path.join(output_dir, output_exe)
 
-        with open(output_file, "w") as f:
-            f.write("default rel\n")  # Important for position-independent code
-            f.write("\n".join(self.assembly) + "\n")
+        # with a program, code is generated straight into the file function by function
+        with report.phase("codegen" if program is not None else "write") as counts:
+            with open(output_file, "w") as f:
+                writer = AsmWriter(f, source=self.source)
+                if program is not None:
+                    self.writer = writer
+                    try:
+                        self.generate(program)
+                    finally:
+                        self.writer = None
+                else:
+                    writer.write(self.assembly)
+                writer.close()
+            counts["instructions"] = writer.instructions
+            counts["bytes"] = os.path.getsize(output_file)
 
         print(f"Assembly written to {output_file}.")
 
         try:
-            subprocess.run(["nasm", "-f", "elf64", output_file], check=True)
+            with report.phase("assemble"):
+                subprocess.run(["nasm", "-f", "elf64", *debug_flags(self.source), output_file], check=True)
 
             object_file = output_file.rsplit(".", 1)[0] + ".o"
-            subprocess.run(["gcc", "-no-pie", object_file, "-o", output_exe], check=True)
+            with report.phase("link"):
+                subprocess.run(["gcc", "-no-pie", object_file, "-o", output_exe], check=True)
             
             print(f"Executable created: {output_exe}.")
         except subprocess.CalledProcessError as e:
             print(f"Error during compilation or linking: {e}")
         except FileNotFoundError:
             print("Error: nasm or gcc not found. Make sure they are installed and in your PATH.")
+
+
+def debug_flags(source):
+    # nasm turns the `%line` directives into DWARF line info
+    return ["-g", "-F", "dwarf"] if source is not None else []
+
+# Per-function code generation in a process pool. Every function only depends on the
+# program's prototypes (labels are numbered per function), so each worker keeps one
+# generator and functions are merged back in source order.
+_worker_program = None
+_worker_generator = None
+
+def _init_worker(program, passes, instrument, source, memoize):
+    global _worker_program, _worker_generator
+    _worker_program = program
+    _worker_generator = ASMGenerator(passes=passes, instrument=instrument, source=source, memoize=memoize)
+    _worker_generator.declare_functions(program)
+
+def _generate_function(index):
+    generator = _worker_generator
+    generator.assembly = []
+    generator.generate(_worker_program.function_list[index])
+    # the worker's passes are a copy, so their stats go back to the parent with the records
+    stats = generator.passes.take_stats() if generator.passes is not None else None
+    return generator.assembly, stats
+
+def generate_functions_parallel(program, jobs, passes=None, instrument=None, source=None, memoize=None):
+    # yields every function's records and pass stats in source order as they come back
+    from concurrent.futures import ProcessPoolExecutor
+
+    indices = [i for i, f in enumerate(program.function_list) if isinstance(f, Function)]
+    chunksize = max(1, len(indices) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(program, passes, instrument, source, memoize)) as pool:
+        yield from pool.map(_generate_function, indices, chunksize=chunksize)
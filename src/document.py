@@ -0,0 +1,221 @@
+# Incremental front end for editors and --watch: keeps the tokens and AST of a source file
+# and after an edit lexes only the tokens around it and parses only the top-level functions
+# it touches
+#
+# The program is split into segments, one per top-level Function or FunctionDeclaration, each
+# holding its tokens, their offsets relative to the segment's start and the parsed node. An
+# edit re-lexes from the token in front of it until the new tokens line up with the old ones
+# again, then parses the tokens of the segments it touched; everything else is reused.
+# Later segments only have their start moved, and their line numbers are brought up to date
+# when the program is asked for. A function that lost its closing brace runs on into the
+# next segment, so that one is parsed with it, and tokens that don't parse stay in a
+# segment without a node until another edit fixes them.
+
+from .lexer import Token, TOKEN_PATTERN, GROUP_TYPES, LEXEMES
+from .parser import Parser, Program, ASTNode
+from .tokentype import TokenType
+
+class Segment:
+    def __init__(self, start, tokens, offsets, node, error=None):
+        self.start = start          # offset of the first token in the text
+        self.tokens = tokens
+        self.offsets = offsets      # of the tokens, relative to start
+        self.node = node            # Function or FunctionDeclaration, None if the tokens don't parse
+        self.error = error
+        self.line_shift = 0         # lines the segment moved since its positions were updated
+
+    @property
+    def end(self):
+        return self.start + self.offsets[-1] + len(self.tokens[-1].value)
+
+    def settle(self):
+        # moves the tokens and nodes to the lines the segment is on now
+        if self.line_shift:
+            for token in self.tokens:
+                token.line += self.line_shift
+            if self.node is not None:
+                shift_lines(self.node, self.line_shift)
+            self.line_shift = 0
+
+def shift_lines(node, shift):
+    seen = set()
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ASTNode):
+            if id(item) in seen:
+                continue # resolved switches also list their cases
+            seen.add(id(item))
+            if item.line:
+                item.line += shift
+            stack.extend(v for v in vars(item).values() if isinstance(v, (ASTNode, list)))
+        elif isinstance(item, list):
+            stack.extend(item)
+
+def text_edit(old, new):
+    # the single edit (offset, deleted, inserted) that turns old into new: everything between
+    # their common prefix and suffix
+    lo, hi = 0, min(len(old), len(new))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[:mid] == new[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    lo, hi = 0, min(len(old), len(new)) - prefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[len(old) - mid:] == new[len(new) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return prefix, len(old) - lo - prefix, new[prefix:len(new) - lo]
+
+class Document:
+    def __init__(self, text):
+        self.text = ""
+        self.segments = []
+        self.relexed = 0            # tokens the last edit lexed
+        self.reparsed = 0           # tokens the last edit parsed
+        self.edit(0, 0, text)
+
+    def edit(self, offset, deleted, inserted):
+        # replaces `deleted` characters at `offset` with the `inserted` text
+        end = offset + deleted
+        if offset < 0 or deleted < 0 or end > len(self.text):
+            raise Exception(f"Edit of {deleted} character(s) at {offset} is outside of the document")
+        old_text = self.text
+        text = old_text[:offset] + inserted + old_text[end:]
+        delta = len(inserted) - deleted
+        lines = inserted.count("\n") - old_text.count("\n", offset, end)
+
+        # the segments the edit touches, and those starting on the line it ends on, as their
+        # columns move
+        segments = self.segments
+        a = 0
+        while a < len(segments) and segments[a].end < offset:
+            a += 1
+        b = a
+        while b < len(segments) and (segments[b].start <= end or old_text.find("\n", end, segments[b].start) < 0):
+            b += 1
+        for segment in segments[max(a - 1, 0):b]:
+            segment.settle()
+        old = [(segment.start + o, t) for segment in segments[a:b] for o, t in zip(segment.offsets, segment.tokens)]
+        region_end = max(end, segments[b - 1].end) if a < b else end
+
+        # tokens ending before the edit stay, lexing starts at the one the edit is in or next to
+        keep = 0
+        while keep < len(old) and old[keep][0] + len(old[keep][1].value) < offset:
+            keep += 1
+        pos = min(offset, old[keep][0]) if keep < len(old) else offset
+        if keep:
+            anchor, token = old[keep - 1]
+        elif a:
+            anchor, token = segments[a - 1].start + segments[a - 1].offsets[-1], segments[a - 1].tokens[-1]
+        else:
+            anchor, token = 0, Token(TokenType.EOF, "", 1, 1)
+        line = token.line + old_text.count("\n", anchor, pos)
+        line_start = old_text.rfind("\n", 0, pos) + 1
+
+        # old tokens after the edit, where the new ones can line up with them again
+        after = keep
+        while after < len(old) and old[after][0] < end:
+            after += 1
+        tail = [(o + delta, t) for o, t in old[after:]]
+        tokens, offsets, resync = self.lex(text, pos, region_end + delta, line, line_start, tail)
+        self.relexed = len(tokens)
+        if resync is not None:
+            index, line, column = resync
+            first = tail[index][1]
+            old_line, column_shift, line_shift = first.line, column - first.column, line - first.line
+            for _, token in tail[index:]:
+                if token.line == old_line:
+                    token.column += column_shift
+                token.line += line_shift
+            tokens += [t for _, t in tail[index:]]
+            offsets += [o for o, _ in tail[index:]]
+            self.relexed += 1
+        tokens = [t for _, t in old[:keep]] + tokens
+        offsets = [o for o, _ in old[:keep]] + offsets
+
+        while True:
+            parsed, error, unclosed = self.parse(tokens, offsets)
+            if parsed is not None or not unclosed or b == len(segments):
+                break
+            # an unclosed function goes on in the next segment
+            segment = segments[b]
+            segment.line_shift += lines
+            segment.settle()
+            tokens += segment.tokens
+            offsets += [segment.start + delta + o for o in segment.offsets]
+            b += 1
+        if parsed is None:
+            parsed = [Segment(offsets[0], tokens, [o - offsets[0] for o in offsets], None, error)]
+        self.reparsed = len(tokens)
+
+        for segment in segments[b:]:
+            segment.start += delta
+            segment.line_shift += lines
+        segments[a:b] = parsed
+        self.text = text
+
+    def lex(self, text, pos, end, line, line_start, tail):
+        # the tokens of text[pos:end] and their offsets; stops at the first token that starts
+        # where one of the old `tail` tokens does with the same lexeme, the text after it is the
+        # same, and returns that token's index in `tail` with its new line and column
+        tokens, offsets = [], []
+        i = 0
+        for match in TOKEN_PATTERN.finditer(text, pos, end):
+            type = GROUP_TYPES[match.lastindex]
+            value = LEXEMES.get(type) or match.group()
+            start = match.start()
+            if type == TokenType.WHITESPACE:
+                if "\n" in value:
+                    line += value.count("\n")
+                    line_start = start + value.rindex("\n") + 1
+                continue
+            while i < len(tail) and tail[i][0] < start:
+                i += 1
+            if i < len(tail) and tail[i][0] == start and tail[i][1].value == value:
+                return tokens, offsets, (i, line, start - line_start + 1)
+            tokens.append(Token(type, value, line, start - line_start + 1))
+            offsets.append(start)
+        return tokens, offsets, None
+
+    def parse(self, tokens, offsets):
+        # the segments of the top-level items in `tokens`, or None with the error and whether the
+        # parser ran out of tokens, which the next segment could fix
+        last = tokens[-1] if tokens else Token(TokenType.EOF, "", 1, 1)
+        parser = Parser(tokens + [Token(TokenType.EOF, "EOF", last.line, last.column + len(last.value))])
+        segments = []
+        try:
+            while parser.check(TokenType.INT):
+                first = parser.current
+                node = parser.function()
+                start = offsets[first]
+                relative = [o - start for o in offsets[first:parser.current]]
+                segments.append(Segment(start, tokens[first:parser.current], relative, node))
+            if not parser.is_at_end():
+                raise parser.error("Expected a function definition or declaration.")
+        except Exception as e:
+            return None, e, parser.is_at_end()
+        return segments, None, False
+
+    def tokens(self):
+        tokens = []
+        for segment in self.segments:
+            segment.settle()
+            tokens += segment.tokens
+        lines = self.text.split("\n")
+        tokens.append(Token(TokenType.EOF, "EOF", len(lines), len(lines[-1]) + 1))
+        return tokens
+
+    def program(self):
+        # the AST; nodes of functions no edit touched are the same objects as before
+        for segment in self.segments:
+            segment.settle()
+            if segment.node is None:
+                # parsed again, so the error has the segment's current position
+                raise self.parse(segment.tokens, segment.offsets)[1]
+        return Program([segment.node for segment in self.segments])
@@ -0,0 +1,145 @@
+# Per-function incremental compilation: caches assembly and object fragments
+# for every function and only regenerates the ones whose AST (or callee prototypes) changed
+
+import hashlib
+import os
+import re
+import subprocess
+
+from .lexer import Token
+from .parser import *
+from .asm import Directive, format_assembly
+from .codegen import ASMGenerator
+from .resolve import resolve
+
+# bump whenever the code generator changes the code it emits
+CACHE_VERSION = "6"
+
+# fragments kept per function name, the most recently used ones; a few, so switching between
+# pass settings or between files with functions of the same name still hits the cache
+FRAGMENT_VERSIONS = 4
+FRAGMENT_FILE = re.compile(r"(\w+)-([0-9a-f]{32})\.(s|o)")
+
+# fields that only say where a node is in the source; moving code doesn't change its hash
+POSITION_FIELDS = ("line", "column")
+
+def fingerprint(node):
+    h = hashlib.sha256()
+    _feed(h, node)
+    return h.hexdigest()
+
+def _feed(h, value):
+    if isinstance(value, ASTNode):
+        h.update(type(value).__name__.encode() + b"(")
+        for key, field in vars(value).items():
+            if key in POSITION_FIELDS:
+                continue
+            h.update(key.encode() + b"=")
+            _feed(h, field)
+        h.update(b")")
+    elif isinstance(value, Token):
+        h.update(f"<{value.type.name}:{value.value}>".encode())
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for item in value:
+            _feed(h, item)
+        h.update(b"]")
+    else:
+        h.update(repr(value).encode() + b";")
+
+def called_functions(node, calls=None):
+    if calls is None:
+        calls = set()
+    if isinstance(node, FunctionCall):
+        calls.add(node.name.value)
+    if isinstance(node, ASTNode):
+        for field in vars(node).values():
+            called_functions(field, calls)
+    elif isinstance(node, (list, tuple)):
+        for item in node:
+            called_functions(item, calls)
+    return calls
+
+class IncrementalCompiler:
+    def __init__(self, cache_dir="./bin/.cache", passes=None):
+        self.cache_dir = cache_dir
+        self.passes = passes
+        self.regenerated = []
+        self.reused = []
+
+    def function_key(self, function, prototypes):
+        # a fragment depends on its own AST and the prototypes of the functions it calls
+        deps = sorted((name, prototypes.get(name)) for name in called_functions(function))
+        h = hashlib.sha256()
+        h.update(CACHE_VERSION.encode())
+        if self.passes:
+            h.update(self.passes.signature().encode())
+        h.update(fingerprint(function).encode())
+        h.update(repr(deps).encode())
+        return h.hexdigest()[:32]
+
+    def generate_fragment(self, function, program):
+        generator = ASMGenerator(passes=self.passes)
+        generator.declare_functions(program)
+        generator.generate(function)
+
+        externs = sorted(called_functions(function) - {function.name})
+        header = [Directive("default rel"), Directive("section .text"), Directive(f"global {function.name}:function")]
+        header += [Directive(f"extern {name}") for name in externs]
+        return format_assembly(header + generator.assembly) + "\n"
+
+    def build(self, program, output_exe="out.exe", output_dir="./bin"):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.regenerated, self.reused = [], []
+        resolve(program) # report name errors before touching the cache
+
+        prototypes = ASMGenerator()
+        prototypes.declare_functions(program)
+
+        objects = []
+        for function in program.function_list:
+            if not isinstance(function, Function):
+                continue
+            key = self.function_key(function, prototypes.function_prototypes)
+            asm_file = os.path.join(self.cache_dir, f"{function.name}-{key}.s")
+            object_file = asm_file.rsplit(".", 1)[0] + ".o"
+
+            if os.path.exists(object_file):
+                os.utime(object_file) # recently used, pruning keeps it
+                self.reused.append(function.name)
+            else:
+                with open(asm_file, "w") as f:
+                    f.write(self.generate_fragment(function, program))
+                subprocess.run(["nasm", "-f", "elf64", asm_file, "-o", object_file], check=True)
+                self.regenerated.append(function.name)
+            objects.append(object_file)
+
+        self.prune({os.path.basename(o)[:-len(".o")] for o in objects})
+
+        # relink every fragment into the executable
+        os.makedirs(output_dir, exist_ok=True)
+        output_exe = os.path.join(output_dir, output_exe)
+        subprocess.run(["gcc", "-no-pie", *objects, "-o", output_exe], check=True)
+        return output_exe
+
+    def prune(self, used):
+        # drops all but the FRAGMENT_VERSIONS most recently used fragments of every function
+        # this build compiled; `used` are the fragments it links, which always stay
+        names = {fragment.rsplit("-", 1)[0] for fragment in used}
+        versions = {}
+        for entry in os.scandir(self.cache_dir):
+            match = FRAGMENT_FILE.fullmatch(entry.name)
+            if match and match[1] in names:
+                fragments = versions.setdefault(match[1], {})
+                fragment = f"{match[1]}-{match[2]}"
+                fragments[fragment] = max(fragments.get(fragment, 0), entry.stat().st_mtime)
+        for fragments in versions.values():
+            by_use = sorted(fragments, key=fragments.get, reverse=True)
+            for fragment in by_use[FRAGMENT_VERSIONS:]:
+                if fragment in used:
+                    continue
+                for suffix in (".s", ".o"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, fragment + suffix))
+                    except FileNotFoundError:
+                        pass # removed by a concurrent build
@@ -0,0 +1,141 @@
+# Per-phase timing and memory instrumentation (`--time-report`, `--mem-report`)
+
+import os
+import time
+from contextlib import contextmanager
+
+def count_nodes(node):
+    from .parser import ASTNode
+
+    count = 0
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ASTNode):
+            count += 1
+            stack.extend(vars(item).values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return count
+
+def count_instructions(assembly):
+    # labels and directives don't count
+    from .asm import Instruction
+    return sum(1 for record in assembly if isinstance(record, Instruction))
+
+def _cpu_time():
+    # include child processes so nasm/gcc show up in the assemble/link phases
+    t = os.times()
+    return time.process_time() + t.children_user + t.children_system
+
+class PhaseReport:
+    def __init__(self, file_path=None, timing=True, memory=False, enabled=True):
+        self.file_path = file_path
+        self.timing = timing
+        self.memory = memory
+        self.enabled = enabled
+        self.phases = []
+        self.origin = None
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield {}
+            return
+
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        record = {"name": name, "counts": {}}
+        start_wall = time.perf_counter()
+        start_cpu = _cpu_time()
+        if self.origin is None:
+            self.origin = start_wall
+        try:
+            yield record["counts"]
+        finally:
+            record["start"] = start_wall - self.origin
+            record["wall"] = time.perf_counter() - start_wall
+            record["cpu"] = _cpu_time() - start_cpu
+            if self.memory:
+                import tracemalloc
+                record["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            self.phases.append(record)
+
+    def to_dict(self):
+        return {
+            "file": self.file_path,
+            "phases": self.phases,
+            "total": {
+                "wall": sum(p["wall"] for p in self.phases),
+                "cpu": sum(p["cpu"] for p in self.phases),
+            },
+        }
+
+    def to_chrome_trace(self):
+        # trace-event format, loadable in chrome://tracing and Perfetto
+        events = []
+        for p in self.phases:
+            args = dict(p["counts"], cpu_ms=1000 * p["cpu"])
+            if "peak_memory" in p:
+                args["peak_memory"] = p["peak_memory"]
+            events.append({
+                "name": p["name"],
+                "cat": "pycc",
+                "ph": "X",
+                "ts": 1e6 * p["start"],
+                "dur": 1e6 * p["wall"],
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": args,
+            })
+        return {"traceEvents": events, "otherData": {"file": self.file_path}}
+
+    def to_text(self):
+        lines = [f"---------- Compile Report: {self.file_path} ----------"]
+        header = f"{'phase':<10}"
+        if self.timing:
+            header += f" {'wall ms':>10} {'cpu ms':>10}"
+        if self.memory:
+            header += f" {'peak KiB':>10}"
+        lines.append(header + "  counts")
+        for p in self.phases:
+            line = f"{p['name']:<10}"
+            if self.timing:
+                line += f" {1000 * p['wall']:>10.3f} {1000 * p['cpu']:>10.3f}"
+            if self.memory:
+                line += f" {p['peak_memory'] / 1024:>10.1f}"
+            counts = ", ".join(f"{k}={v}" for k, v in p["counts"].items())
+            lines.append(f"{line}  {counts}")
+        if self.timing:
+            total = self.to_dict()["total"]
+            lines.append(f"{'total':<10} {1000 * total['wall']:>10.3f} {1000 * total['cpu']:>10.3f}")
+        return "\n".join(lines)
+
+def write_reports(reports, format="text", path=None):
+    import json
+
+    if format == "text":
+        output = "\n\n".join(r.to_text() for r in reports)
+    elif format == "json":
+        data = [r.to_dict() for r in reports]
+        output = json.dumps(data[0] if len(data) == 1 else data, indent=2)
+    elif format == "chrome":
+        # one trace per run, every file on its own track
+        events = []
+        for tid, r in enumerate(reports):
+            for event in r.to_chrome_trace()["traceEvents"]:
+                event["tid"] = tid
+                events.append(event)
+        output = json.dumps({"traceEvents": events})
+    else:
+        raise ValueError(f"Unknown report format: {format}")
+
+    if path:
+        with open(path, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -1,108 +1,220 @@
 # Scans a C File and return a list of tokens
 
 import re
+import sys
+from array import array
 from .tokentype import TokenType
 
 class Token:
-    def __init__(self, type, value):
+    __slots__ = ("type", "value", "line", "column") # a large file has millions of them
+
+    def __init__(self, type, value, line=0, column=0):
         self.type = type
         self.value = value 
+        self.line = line        # 1-based source position, 0 for tokens made up by the compiler
+        self.column = column
     def __repr__(self):
         return f"Token({self.type}, {self.value})"
 
+class BufferToken(Token):
+    # a token lexed in place from a bytes buffer (e.g. a mapped file): identifiers and
+    # numbers keep their offsets and are only decoded when their value is first read
+    __slots__ = ("buffer", "start")
+
+    def __init__(self, type, buffer, start, line, column):
+        self.type = type
+        self.buffer = buffer
+        self.start = start
+        self.line = line
+        self.column = column
+
+    def __getattr__(self, name):
+        # only called while `value` isn't set yet
+        if name != "value":
+            raise AttributeError(name)
+        # names repeat a lot, every token of one shares the string
+        self.value = sys.intern(bytes(WORD_PATTERN.match(self.buffer, self.start).group()).decode())
+        return self.value
+
+    def __reduce__(self):
+        # pickled and copied as a plain token, a mapped file can't be pickled
+        return (Token, (self.type, self.value, self.line, self.column))
+
+# token types in the order the lexer tries them, each pattern is a group of the combined
+# pattern; keywords come before identifiers
+TOKEN_SPEC = [
+    (TokenType.LEFT_BRACE, r"\{"),
+    (TokenType.RIGHT_BRACE, r"\}"),
+    (TokenType.LEFT_PAREN, r"\("),
+    (TokenType.RIGHT_PAREN, r"\)"),
+    (TokenType.LEFT_BRACKET, r"\["),
+    (TokenType.RIGHT_BRACKET, r"\]"),
+    (TokenType.SEMICOLON, r";"),
+    (TokenType.INT, r"\bint\b"),
+    (TokenType.RETURN, r"\breturn\b"),
+    (TokenType.IF, r"\bif\b"),
+    (TokenType.ELSE, r"\belse\b"),
+    (TokenType.FOR, r"\bfor\b"),
+    (TokenType.WHILE, r"\bwhile\b"),
+    (TokenType.DO, r"\bdo\b"),
+    (TokenType.BREAK, r"\bbreak\b"),
+    (TokenType.CONTINUE, r"\bcontinue\b"),
+    (TokenType.SWITCH, r"\bswitch\b"),
+    (TokenType.CASE, r"\bcase\b"),
+    (TokenType.DEFAULT, r"\bdefault\b"),
+    (TokenType.IDENTIFIER, r"\b[a-zA-Z]\w*\b"),
+    (TokenType.NUMBER, r"\b[0-9]+\b"),
+    (TokenType.WHITESPACE, r"\s+"),
+    (TokenType.MINUS, r"-"),
+    (TokenType.BITWISE_COMPLEMENT, r"~"),
+    (TokenType.PLUS, r"\+"),
+    (TokenType.STAR, r"\*"),
+    (TokenType.SLASH, r"/"),
+    (TokenType.AND, r"&&"),
+    (TokenType.OR, r"\|\|"),
+    (TokenType.EQUAL, r"=="),
+    (TokenType.NOT_EQUAL, r"!="),
+    (TokenType.LESS_THAN_OR_EQUAL, r"<="),
+    (TokenType.GREATER_THAN_OR_EQUAL, r">="),
+    (TokenType.PERCENT, r"%"),
+    (TokenType.BITWISE_AND, r"&"),
+    (TokenType.BITWISE_OR, r"\|"),
+    (TokenType.BITWISE_XOR, r"\^"),
+    (TokenType.BITWISE_SHIFT_LEFT, r"<<"),
+    (TokenType.BITWISE_SHIFT_RIGHT, r">>"),
+    (TokenType.ASSIGN, r"="),
+    (TokenType.LOGICAL_NEGATION, r"!"),
+    (TokenType.LESS_THAN, r"<"),
+    (TokenType.GREATER_THAN, r">"),
+    (TokenType.COLON, r":"),
+    (TokenType.QUESTION, r"\?"),
+    (TokenType.COMMA, r","),
+]
+
+TOKEN_PATTERN = re.compile("|".join(f"({pattern})" for _, pattern in TOKEN_SPEC))
+_bytes_pattern = None
+# the extent of an identifier or number from its start, so BufferTokens don't keep their end
+WORD_PATTERN = re.compile(rb"\w+")
+# token type of every group number (a match's lastindex)
+GROUP_TYPES = [None] + [type for type, _ in TOKEN_SPEC]
+# the text of every token type that always has the same one
+LEXEMES = {type: re.sub(r"\\(.)", r"\1", pattern.replace(r"\b", "")) for type, pattern in TOKEN_SPEC
+           if type not in (TokenType.IDENTIFIER, TokenType.NUMBER, TokenType.WHITESPACE)}
+
+def bytes_pattern():
+    # TOKEN_PATTERN for bytes, compiled on first use; only lexing in place needs it, so a
+    # cold start doesn't pay for it
+    global _bytes_pattern
+    if _bytes_pattern is None:
+        _bytes_pattern = re.compile(TOKEN_PATTERN.pattern.encode())
+    return _bytes_pattern
+
 def tokenize(text):
     tokens = []
-    pattern = "|".join([
-        r"\{", # LEFT_BRACE
-        r"\}", # RIGHT_BRACE
-        r"\(", # LEFT_PAREN 
-        r"\)", # RIGHT_PAREN 
-        r";", # SEMICOLON
-        r"\bint\b", # INT
-        r"\breturn\b", # RETURN
-        r"\b[a-zA-Z]\w*\b", # IDENTIFIER 
-        r"\b[0-9]+\b", # NUMBER
-        r"\s+", # WHITESPACE
-        r"-", # MINUS 
-        r"~", # BITWISE_COMPLEMENT 
-        r"\+", # PLUS 
-        r"\*", # STAR 
-        r"/", # SLASH
-        r"&&", # AND
-        r"\|\|", # OR 
-        r"==", # EQUAL 
-        r"!=", # NOT_EQUAL
-        r"<=", # LESS_THAN_OR_EQUAL
-        r">=", # GREATER_THAN_OR_EQUAL
-        r"%", # PERCENT 
-        r"&", # BITWISE_AND
-        r"\|", # BITWISE_OR
-        r"^", # BITWISE_XOR 
-        r"<<", # BITWISE_SHIFT_LEFT
-        r">>", # BITWISE_SHIFT_RIGHT
-        r"=", # ASSIGN
-        r"!", # LOGICAL_NEGATION
-        r"<", # LESS_THAN 
-        r">", # GREATER_THAN
-        r"\bif\b", # IF 
-        r"\belse\b", # ELSE 
-        r":", # COLON 
-        r"\?", # QUESTION
-        f"\bfor\b", # FOR 
-        f"\bwhile\b", # WHILE 
-        f"\bdo\b", # DO 
-        f"\bbreak\b", # BREAK 
-        f"\bcontinue\b", # CONTINUE
-        f",", # COMMA
-    ])
-    
-    for match in re.finditer(pattern, text):
+    line, line_start = 1, 0
+    for match in TOKEN_PATTERN.finditer(text):
+        type = GROUP_TYPES[match.lastindex]
+        if type != TokenType.WHITESPACE:
+            tokens.append(Token(type, LEXEMES.get(type) or match.group(), line, match.start() - line_start + 1))
+            continue
         value = match.group()
-        if value == "{":            token_type = TokenType.LEFT_BRACE 
-        elif value == "}":          token_type = TokenType.RIGHT_BRACE 
-        elif value == "(":          token_type = TokenType.LEFT_PAREN 
-        elif value == ")":          token_type = TokenType.RIGHT_PAREN 
-        elif value == ";":          token_type = TokenType.SEMICOLON 
-        elif value == "int":        token_type = TokenType.INT 
-        elif value == "return":     token_type = TokenType.RETURN 
-        elif value == "-":          token_type = TokenType.MINUS
-        elif value == "~":          token_type = TokenType.BITWISE_COMPLEMENT 
-        elif value == "!":          token_type = TokenType.LOGICAL_NEGATION 
-        elif value == "+":          token_type = TokenType.PLUS 
-        elif value == "*":          token_type = TokenType.STAR 
-        elif value == "/":          token_type = TokenType.SLASH
-        elif value == "&&":         token_type = TokenType.AND 
-        elif value == "||":         token_type = TokenType.OR 
-        elif value == "==":         token_type = TokenType.EQUAL 
-        elif value == "!=":         token_type = TokenType.NOT_EQUAL 
-        elif value == "<":          token_type = TokenType.LESS_THAN 
-        elif value == "<=":         token_type = TokenType.LESS_THAN_OR_EQUAL 
-        elif value == ">":          token_type = TokenType.GREATER_THAN 
-        elif value == ">=":         token_type = TokenType.GREATER_THAN_OR_EQUAL
-        elif value == "%":          token_type = TokenType.PERCENT 
-        elif value == "&":          token_type = TokenType.BITWISE_AND 
-        elif value == "|":          token_type = TokenType.BITWISE_OR 
-        elif value == "^":          token_type = TokenType.BITWISE_XOR 
-        elif value == "<<":         token_type = TokenType.BITWISE_SHIFT_LEFT 
-        elif value == ">>":         token_type = TokenType.BITWISE_SHIFT_RIGHT
-        elif value == "=":          token_type = TokenType.ASSIGN
-        elif value == "if":         token_type = TokenType.IF 
-        elif value == "else":       token_type = TokenType.ELSE 
-        elif value == ":":          token_type = TokenType.COLON 
-        elif value == "?":          token_type = TokenType.QUESTION
-        elif value == "for":        token_type = TokenType.FOR 
-        elif value == "while":      token_type = TokenType.WHILE 
-        elif value == "do":         token_type = TokenType.DO 
-        elif value == "break":      token_type = TokenType.BREAK 
-        elif value == "continue":   token_type = TokenType.CONTINUE
-        elif value == ",":          token_type = TokenType.COMMA
-        elif value.isdigit():       token_type = TokenType.NUMBER
-        elif value.isspace():       token_type = TokenType.WHITESPACE 
-        elif re.match(r"\b[a-zA-Z]\w*\b", value):       token_type = TokenType.IDENTIFIER 
-        else:                       raise ValueError(f"Unexpected Token: {value}")
-
-        if token_type != TokenType.WHITESPACE:
-            tokens.append(Token(token_type, value))
+        if "\n" in value:
+            line += value.count("\n")
+            line_start = match.start() + value.rindex("\n") + 1
     
-    tokens.append(Token(TokenType.EOF, "EOF"))
+    tokens.append(Token(TokenType.EOF, "EOF", line, len(text) - line_start + 1))
+    return tokens
+
+def tokenize_bytes(buffer):
+    # tokenize() over a bytes-like buffer such as an mmap, without decoding it to a str first;
+    # tokens with a fixed lexeme share one string, the others are BufferTokens
+    tokens = []
+    line, line_start = 1, 0
+    for match in bytes_pattern().finditer(buffer):
+        type = GROUP_TYPES[match.lastindex]
+        start = match.start()
+        if type == TokenType.WHITESPACE:
+            value = match.group()
+            if b"\n" in value:
+                line += value.count(b"\n")
+                line_start = start + value.rindex(b"\n") + 1
+            continue
+        lexeme = LEXEMES.get(type)
+        if lexeme is not None:
+            tokens.append(Token(type, lexeme, line, start - line_start + 1))
+        else:
+            tokens.append(BufferToken(type, buffer, start, line, start - line_start + 1))
+
+    tokens.append(Token(TokenType.EOF, "EOF", line, len(buffer) - line_start + 1))
+    return tokens
+
+# Parallel lexing for huge files. No token contains whitespace, so chunks can be lexed
+# independently as long as every cut falls between tokens; the text is cut right after the
+# newline that follows a `}` when `int` comes next, which is between two functions in any
+# ordinarily formatted file, so every chunk starts a line. Workers send a chunk's tokens back
+# as flat arrays (group numbers, lines, columns and the values of names and numbers joined by
+# spaces) instead of pickled Tokens, and the chunks are stitched together in order.
+SPLIT_PATTERN = re.compile(r"\}[^\S\n]*\n(?=\s*int\b)")
+BYTES_SPLIT_PATTERN = re.compile(SPLIT_PATTERN.pattern.encode())
+LEX_CHUNK_SIZE = 1 << 18 # smallest chunk worth a round trip to a worker
+
+def split_chunks(text, chunks):
+    # offsets where at most `chunks` chunks of about the same size start, the first is 0
+    split = SPLIT_PATTERN if isinstance(text, str) else BYTES_SPLIT_PATTERN
+    size = len(text) // chunks
+    starts = [0]
+    for i in range(1, chunks):
+        match = split.search(text, max(starts[-1], i * size))
+        if match is None:
+            break
+        if match.end() < len(text):
+            starts.append(match.end())
+    return starts
+
+def _lex_chunk(chunk):
+    # lines are counted from 0 at the chunk's start; also returns the chunk's newlines and
+    # where its last line starts
+    pattern, newline = (TOKEN_PATTERN, "\n") if isinstance(chunk, str) else (bytes_pattern(), b"\n")
+    groups, lines, columns, values = bytearray(), array("i"), array("i"), []
+    line, line_start = 0, 0
+    for match in pattern.finditer(chunk):
+        group = match.lastindex
+        type = GROUP_TYPES[group]
+        if type == TokenType.WHITESPACE:
+            value = match.group()
+            if newline in value:
+                line += value.count(newline)
+                line_start = match.start() + value.rindex(newline) + 1
+            continue
+        groups.append(group)
+        lines.append(line)
+        columns.append(match.start() - line_start + 1)
+        if type not in LEXEMES:
+            values.append(match.group())
+    values = " ".join(values) if newline == "\n" else b" ".join(values).decode()
+    return bytes(groups), lines, columns, values, line, line_start
+
+def tokenize_parallel(text, jobs):
+    # tokenize() (or tokenize_bytes() for a buffer) with the text split over `jobs` processes;
+    # small files and files without a place to split are lexed here
+    chunks = min(jobs * 4, len(text) // LEX_CHUNK_SIZE)
+    starts = split_chunks(text, chunks) if jobs > 1 and chunks > 1 else [0]
+    if len(starts) == 1:
+        return tokenize(text) if isinstance(text, str) else tokenize_bytes(text)
+
+    from concurrent.futures import ProcessPoolExecutor
+    tokens = []
+    first_line = 1
+    with ProcessPoolExecutor(max_workers=min(jobs, len(starts))) as pool:
+        # a buffer's chunks are copied out as bytes, mappings and memoryviews don't pickle
+        chunks = [text[start:end] if isinstance(text, str) else bytes(text[start:end]) for start, end in zip(starts, starts[1:] + [len(text)])]
+        for groups, lines, columns, values, newlines, line_start in pool.map(_lex_chunk, chunks):
+            values = iter(values.split(" "))
+            for group, line, column in zip(groups, lines, columns):
+                type = GROUP_TYPES[group]
+                tokens.append(Token(type, LEXEMES.get(type) or next(values), first_line + line, column))
+            first_line += newlines
+
+    # every chunk but the first starts a line
+    tokens.append(Token(TokenType.EOF, "EOF", first_line, len(text) - starts[-1] - line_start + 1))
     return tokens
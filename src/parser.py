@@ -1,7 +1,12 @@
+import io
+
 from .tokentype import TokenType
 
 class ASTNode:
-    pass
+    # source position of the node's first token (of the operator in binary expressions),
+    # 0 for nodes the compiler made up
+    line = 0
+    column = 0
 
 class Program(ASTNode):
     def __init__(self, function_list):
@@ -34,10 +39,17 @@ class BinaryOps(ASTNode):
         self.right = right
 
 class Declaration(ASTNode):
-    def __init__(self, type, name, exp=None):
+    # type is "int", "int*", ...; arrays have a size
+    def __init__(self, type, name, exp=None, size=None):
         self.type = type
         self.name = name 
         self.exp = exp
+        self.size = size
+
+class Parameter(ASTNode):
+    def __init__(self, type, name):
+        self.type = type
+        self.name = name
 
 class Assign(ASTNode):
     def __init__(self, name, exp):
@@ -48,6 +60,25 @@ class Variable(ASTNode):
     def __init__(self, name):
         self.name = name
 
+class Subscript(ASTNode):
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+class AddressOf(ASTNode):
+    def __init__(self, operand):
+        self.operand = operand
+
+class Dereference(ASTNode):
+    def __init__(self, operand):
+        self.operand = operand
+
+class Store(ASTNode):
+    # assignment through a pointer, target is a Subscript or Dereference
+    def __init__(self, target, exp):
+        self.target = target
+        self.exp = exp
+
 class Conditional(ASTNode):
     def __init__(self, condition, if_stmt, else_stmt=None):
         self.condition = condition
@@ -75,6 +106,17 @@ class Do(ASTNode):
         self.stmt = stmt 
         self.exp = exp 
 
+class Switch(ASTNode):
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class Case(ASTNode):
+    # a `case value:` label in front of a statement, value is None for `default:`
+    def __init__(self, value, stmt):
+        self.value = value
+        self.stmt = stmt
+
 class Break(ASTNode): pass 
 class Continue(ASTNode): pass
 
@@ -89,6 +131,33 @@ class FunctionCall(ASTNode):
         self.name = name 
         self.params = params
 
+class DispatchTable(dict):
+    # the methods of a visitor class by node class, looked up by name on the first visit of
+    # a node class only; missing methods map to the fallback
+    def __init__(self, visitor_class, prefix, fallback):
+        super().__init__()
+        self.visitor_class = visitor_class
+        self.prefix = prefix
+        self.fallback = fallback
+
+    def __missing__(self, node_class):
+        method = getattr(self.visitor_class, f"{self.prefix}_{node_class.__name__}", None)
+        if method is None and self.fallback is not None:
+            method = getattr(self.visitor_class, self.fallback)
+        self[node_class] = method
+        return method
+
+_dispatch_tables = {}
+
+def dispatch_table(visitor_class, prefix, fallback=None):
+    # one table per visitor class and prefix, shared by all its instances. The methods are
+    # plain functions, called with the visitor as first argument
+    key = (visitor_class, prefix)
+    table = _dispatch_tables.get(key)
+    if table is None:
+        table = _dispatch_tables[key] = DispatchTable(visitor_class, prefix, fallback)
+    return table
+
 class Parser:
     def __init__(self, tokens):
         self.tokens = tokens 
@@ -96,7 +165,7 @@ class Parser:
 
     def peek(self): return self.tokens[self.current]
     def previous(self): return self.tokens[self.current - 1]
-    def is_at_end(self): return self.peek() == TokenType.EOF
+    def is_at_end(self): return self.peek().type == TokenType.EOF
     
     def advance(self):
         if not self.is_at_end():
@@ -118,7 +187,17 @@ class Parser:
     def consume(self, type, message):
         if self.check(type):
             return self.advance()
-        raise Exception(message)
+        raise self.error(message)
+
+    def error(self, message, token=None):
+        token = token or self.peek()
+        return Exception(f"{token.line}:{token.column}: {message}")
+
+    def at(self, node, token):
+        # gives the node the token's source position
+        if node is not None:
+            node.line, node.column = token.line, token.column
+        return node
 
     def parse(self): return self.program()
     
@@ -126,9 +205,12 @@ class Parser:
         func_list = []
         while self.check(TokenType.INT):
             func_list.append(self.function())
+        if not self.is_at_end():
+            raise self.error("Expected a function definition or declaration.")
         return Program(func_list)
 
     def function(self):
+        start = self.peek()
         type = self.consume(TokenType.INT, "Expected function return type.").value
         name = self.consume(TokenType.IDENTIFIER, "Expected function name.").value
         self.consume(TokenType.LEFT_PAREN, "Expected '(' after function name.")
@@ -136,42 +218,66 @@ class Parser:
         self.consume(TokenType.RIGHT_PAREN, "Expected ')' after parameters.")
         body = None 
         if self.match(TokenType.SEMICOLON):
-            return FunctionDeclaration(type, name, parameters)
+            return self.at(FunctionDeclaration(type, name, parameters), start)
         elif self.check(TokenType.LEFT_BRACE):
             body = self.block()
-            return Function(type, name, parameters, body)
+            return self.at(Function(type, name, parameters, body), start)
         else:
-            raise Exception("Expected ';' or '{' after function name.")
+            raise self.error("Expected ';' or '{' after function name.")
 
     def parameter_list(self):
         params = []
         if self.match(TokenType.INT):
-            self.consume(TokenType.IDENTIFIER, "Expected variable name.")
-            params.append(Variable(self.previous()))
+            params.append(self.parameter())
             while self.match(TokenType.COMMA):
                 self.consume(TokenType.INT, "Expected variable type.")
-                self.consume(TokenType.IDENTIFIER, "Expected variable name.")
-                params.append(Variable(self.previous()))
+                params.append(self.parameter())
         return params
 
+    def parameter(self):
+        type = self.pointer_type(self.previous().value)
+        name = self.consume(TokenType.IDENTIFIER, "Expected variable name.")
+        # `int a[]` is a pointer parameter
+        if self.match(TokenType.LEFT_BRACKET):
+            self.consume(TokenType.RIGHT_BRACKET, "Expected ']' in array parameter.")
+            type += "*"
+        return self.at(Parameter(type, name), name)
+
+    def pointer_type(self, type):
+        while self.match(TokenType.STAR):
+            type += "*"
+        return type
+
     def block(self):
-        self.consume(TokenType.LEFT_BRACE, "Expected '{' before block.")
+        start = self.consume(TokenType.LEFT_BRACE, "Expected '{' before block.")
         statements = []
         while not self.check(TokenType.RIGHT_BRACE) and not self.is_at_end():
             statements.append(self.declaration_or_statement())
         self.consume(TokenType.RIGHT_BRACE, "Expected '}' after block.")
-        return Block(statements) 
+        return self.at(Block(statements), start)
     
     def declaration(self):
-        type = self.previous().value
+        type = self.pointer_type(self.previous().value)
         name = self.consume(TokenType.IDENTIFIER, "Expected variable name.").value
         exp = None 
-        if self.match(TokenType.ASSIGN):
+        size = None
+        if self.match(TokenType.LEFT_BRACKET):
+            token = self.consume(TokenType.NUMBER, "Expected array size.")
+            size = int(token.value)
+            self.consume(TokenType.RIGHT_BRACKET, "Expected ']' after array size.")
+            if size <= 0:
+                raise self.error("Array size has to be positive.", token)
+        elif self.match(TokenType.ASSIGN):
             exp = self.expression()
         self.consume(TokenType.SEMICOLON, "Expected ';' after variable declaration.")
-        return Declaration(type, name, exp)
+        return Declaration(type, name, exp, size)
 
     def statement(self):
+        # statements are located at their first token
+        start = self.peek()
+        return self.at(self.statement_node(), start)
+
+    def statement_node(self):
         if self.match(TokenType.RETURN):
             return self.return_statement()
         elif self.match(TokenType.INT):
@@ -186,6 +292,13 @@ class Parser:
             return self.while_statement()
         elif self.match(TokenType.DO):
             return self.do_while_statement()
+        elif self.match(TokenType.SWITCH):
+            return self.switch_statement()
+        elif self.match(TokenType.CASE):
+            return self.case_statement()
+        elif self.match(TokenType.DEFAULT):
+            self.consume(TokenType.COLON, "Expected ':' after default.")
+            return Case(None, self.labeled_statement())
         elif self.match(TokenType.BREAK):
             self.consume(TokenType.SEMICOLON, "Expected ';' after break.")
             return Break()
@@ -196,8 +309,9 @@ class Parser:
             return self.expression_statement()
     
     def declaration_or_statement(self):
+        start = self.peek()
         if self.match(TokenType.INT):
-            return self.declaration()
+            return self.at(self.declaration(), start)
         return self.statement()
 
     def expression_statement(self):
@@ -275,31 +389,56 @@ class Parser:
         self.consume(TokenType.SEMICOLON, "Expected ';' after while.")
         return Do(stmt, exp)
 
+    def switch_statement(self):
+        self.consume(TokenType.LEFT_PAREN, "Expected '(' after switch.")
+        exp = self.expression()
+        self.consume(TokenType.RIGHT_PAREN, "Expected ')' after switch value.")
+        if self.check(TokenType.LEFT_BRACE):
+            body = self.block()
+        else:
+            body = self.statement()
+        return Switch(exp, body)
+
+    def case_statement(self):
+        value = self.conditional_expression()
+        self.consume(TokenType.COLON, "Expected ':' after case value.")
+        return Case(value, self.labeled_statement())
+
+    def labeled_statement(self):
+        # a label can close a block, e.g. `default: }`
+        if self.check(TokenType.RIGHT_BRACE):
+            return None
+        return self.declaration_or_statement()
+
     def expression(self):
         return self.assignment()
 
     def assignment(self):
         exp = self.conditional_expression()
         if self.match(TokenType.ASSIGN):
+            op = self.previous()
             if isinstance(exp, Variable):
                 name = exp.name 
                 value = self.assignment()
-                return Assign(name, value)
+                return self.at(Assign(name, value), op)
+            elif isinstance(exp, (Subscript, Dereference)):
+                return self.at(Store(exp, self.assignment()), op)
             elif isinstance(exp, BinaryOps) and isinstance(exp.left, Variable):
                 name = exp.left.name 
-                value = Assign(exp.right, self.assignment())
-                return Assign(name, value)
+                value = self.at(Assign(exp.right, self.assignment()), op)
+                return self.at(Assign(name, value), op)
             else:
-                raise Exception("Invalid assignment target.")
+                raise self.error("Invalid assignment target.", op)
         return exp
 
     def conditional_expression(self):
         exp = self.bitwise_or_expression()
         if self.match(TokenType.QUESTION):
+            op = self.previous()
             if_stmt = self.expression()
             self.consume(TokenType.COLON, "Expected ':' after '?' in ternary statement.")
             else_stmt = self.conditional_expression()
-            return Conditional(exp, if_stmt, else_stmt)
+            return self.at(Conditional(exp, if_stmt, else_stmt), op)
         return exp
 
     def bitwise_or_expression(self):
@@ -307,7 +446,7 @@ class Parser:
         while self.match(TokenType.BITWISE_OR):
             op = self.previous()
             right = self.bitwise_xor_expression()
-            exp = BinaryOps(op, exp, right)
+            exp = self.at(BinaryOps(op, exp, right), op)
         return exp 
 
     def bitwise_xor_expression(self):
@@ -315,7 +454,7 @@ class Parser:
         while self.match(TokenType.BITWISE_XOR):
             op = self.previous()
             right = self.bitwise_and_expression()
-            exp = BinaryOps(op, exp, right)
+            exp = self.at(BinaryOps(op, exp, right), op)
         return exp 
 
     def bitwise_and_expression(self):
@@ -323,7 +462,7 @@ class Parser:
         while self.match(TokenType.BITWISE_AND):
             op = self.previous()
             right = self.logical_or_expression()
-            exp = BinaryOps(op, exp, right)
+            exp = self.at(BinaryOps(op, exp, right), op)
         return exp
 
     def logical_or_expression(self):
@@ -331,7 +470,7 @@ class Parser:
         while self.match(TokenType.OR):
             op = self.previous()
             right = self.logical_and_expression()
-            exp = BinaryOps(op, exp, right)
+            exp = self.at(BinaryOps(op, exp, right), op)
         return exp
 
     def logical_and_expression(self):
@@ -339,7 +478,7 @@ class Parser:
         while self.match(TokenType.AND):
             op = self.previous()
             next_eq_exp = self.equality_expression()
-            eq_exp = BinaryOps(op, eq_exp, next_eq_exp)
+            eq_exp = self.at(BinaryOps(op, eq_exp, next_eq_exp), op)
         return eq_exp
 
     def equality_expression(self):
@@ -347,7 +486,7 @@ class Parser:
         while self.match(TokenType.NOT_EQUAL, TokenType.EQUAL):
             op = self.previous()
             next_rel_exp = self.relational_expression()
-            rel_exp = BinaryOps(op, rel_exp, next_rel_exp)
+            rel_exp = self.at(BinaryOps(op, rel_exp, next_rel_exp), op)
         return rel_exp
 
     def relational_expression(self):
@@ -358,7 +497,7 @@ class Parser:
                          TokenType.GREATER_THAN_OR_EQUAL):
             op = self.previous()
             next_add_exp = self.shift_expression()
-            add_exp = BinaryOps(op, add_exp, next_add_exp)
+            add_exp = self.at(BinaryOps(op, add_exp, next_add_exp), op)
         return add_exp
 
     def shift_expression(self):
@@ -366,7 +505,7 @@ class Parser:
         while self.match(TokenType.BITWISE_SHIFT_LEFT, TokenType.BITWISE_SHIFT_RIGHT):
             op = self.previous()
             right = self.additve_expression()
-            exp = BinaryOps(op, exp, right)
+            exp = self.at(BinaryOps(op, exp, right), op)
         return exp
     
     def additve_expression(self):
@@ -374,7 +513,7 @@ class Parser:
         while self.match(TokenType.PLUS, TokenType.MINUS):
             op = self.previous()
             next_term = self.term()
-            term = BinaryOps(op, term, next_term)
+            term = self.at(BinaryOps(op, term, next_term), op)
         return term
 
     def term(self):
@@ -382,33 +521,48 @@ class Parser:
         while self.match(TokenType.STAR, TokenType.SLASH, TokenType.PERCENT):
             op = self.previous()
             next_factor = self.factor()
-            factor = BinaryOps(op, factor, next_factor)
+            factor = self.at(BinaryOps(op, factor, next_factor), op)
         return factor
     
     def factor(self):
         if self.match(TokenType.LEFT_PAREN):
             exp = self.expression()
             self.consume(TokenType.RIGHT_PAREN, "Expected ')' after expression.")
-            return exp 
+            return self.postfix(exp)
         elif self.match(TokenType.LOGICAL_NEGATION, TokenType.BITWISE_COMPLEMENT, TokenType.MINUS):
             op = self.previous()
             factor = self.factor()
-            return UnaryOps(op, factor)
+            return self.at(UnaryOps(op, factor), op)
+        elif self.match(TokenType.BITWISE_AND):
+            op = self.previous()
+            return self.at(AddressOf(self.factor()), op)
+        elif self.match(TokenType.STAR):
+            op = self.previous()
+            return self.at(Dereference(self.factor()), op)
         elif self.match(TokenType.NUMBER):
-            return Number(self.previous())
+            return self.at(Number(self.previous()), self.previous())
         elif self.match(TokenType.IDENTIFIER):
             if self.check(TokenType.LEFT_PAREN):
-                return self.function_call()
+                return self.postfix(self.function_call())
             else:
-                return Variable(self.previous())
+                return self.postfix(self.at(Variable(self.previous()), self.previous()))
         else:
-            return print("Failed!")
+            raise self.error("Expected expression.")
+
+    def postfix(self, exp):
+        # subscripts bind tighter than the prefix operators
+        while self.match(TokenType.LEFT_BRACKET):
+            bracket = self.previous()
+            index = self.expression()
+            self.consume(TokenType.RIGHT_BRACKET, "Expected ']' after subscript.")
+            exp = self.at(Subscript(exp, index), bracket)
+        return exp
     
     def argument_list(self):
         args = [self.expression()]
         while self.match(TokenType.COMMA):
             if len(args) > 255:
-                raise Exception("Cannot have more than 255 arguments.")
+                raise self.error("Cannot have more than 255 arguments.", self.previous())
             args.append(self.expression())
         return args
 
@@ -419,7 +573,7 @@ class Parser:
         if not self.check(TokenType.RIGHT_PAREN):
             args = self.argument_list()
         self.consume(TokenType.RIGHT_PAREN, "Expected ')' after parameters.")
-        return FunctionCall(name, args)
+        return self.at(FunctionCall(name, args), name)
 
     def unary(self):
         if self.match(TokenType.MINUS, TokenType.LOGICAL_NEGATION, TokenType.BITWISE_COMPLEMENT):
@@ -437,189 +591,210 @@ class Parser:
             expr = self.expression()
             self.consume(TokenType.RIGHT_PAREN, "Expected ')' after expression.")
             return expr
-        raise Exception("Expected expression.")
+        raise self.error("Expected expression.")
 
 class ASTPrinter:
-    def __init__(self):
+    # writes the tree as indented lines (or as JSON) to `stream`, one line at a time, so the
+    # output of a large file never has to be held as a single string
+    def __init__(self, stream=None):
+        self.stream = stream
         self.indent_level = 0
+        self.printers = dispatch_table(type(self), "print", "generic_print")
 
     def print(self, node):
-        method_name = f"print_{type(node).__name__}"
-        printer = getattr(self, method_name, self.generic_print)
-        return printer(node)
-
-    def indented(self, string):
-        return "  " * self.indent_level + string
+        # without a stream the lines come back as a string
+        if self.stream is None:
+            stream = self.stream = io.StringIO()
+            try:
+                self.print(node)
+            finally:
+                self.stream = None
+            return stream.getvalue()
+        self.printers[type(node)](self, node)
+
+    def print_json(self, node):
+        # one JSON object per node: its class as "node", its position and its constructor
+        # fields, with tokens as their text
+        import json
+        if self.stream is None:
+            return json.dumps(node_json(node))
+        if not isinstance(node, Program):
+            self.stream.write(json.dumps(node_json(node)) + "\n")
+            return
+        # function by function, so only one function's objects exist at a time
+        self.stream.write('{"node": "Program", "function_list": [')
+        for i, function in enumerate(node.function_list):
+            self.stream.write(",\n" if i else "\n")
+            self.stream.write(json.dumps(node_json(function)))
+        self.stream.write("\n]}\n")
+
+    def write(self, string):
+        self.stream.write("  " * self.indent_level + string + "\n")
+
+    def block(self, title, nodes):
+        # a titled list of children, or a single one
+        self.write(title)
+        self.indent_level += 1
+        for child in nodes if isinstance(nodes, list) else [nodes]:
+            if child is not None:
+                self.print(child)
+        self.indent_level -= 1
 
     def generic_print(self, node):
-        return self.indented(f"{type(node).__name__}")
+        self.write(type(node).__name__)
 
     def print_Program(self, node):
-        result = self.indented("Program\n")
-        self.indent_level += 1
-        for function in node.function_list:
-            result += self.print(function)
-        self.indent_level -= 1
-        return result 
+        self.block("Program", node.function_list)
 
-    def print_Function(self, node):        
-        result = self.indented(f"Function: {node.return_type} {node.name}\n")    
+    def print_Function(self, node):
+        self.write(f"Function: {node.return_type} {node.name}")
         self.indent_level += 1
         if node.parameters:
-            result += self.indented("Parameters: \n")
-            self.indent_level += 1
-            for param in node.parameters:
-                result += self.print(param) + "\n"
-            self.indent_level -= 1
+            self.block("Parameters: ", node.parameters)
         if node.body:
-            result += self.indented("Body:\n")
-            self.indent_level += 1
-            for statement in node.body.statements:
-                result += self.print(statement) + "\n"
-            self.indent_level -= 1
+            self.block("Body:", node.body.statements)
         self.indent_level -= 1
-        return result 
 
     def print_FunctionDeclaration(self, node):
-        result = self.indented(f"Function Declaration: {node.type} {node.name}\n")
-        return result
+        self.write(f"Function Declaration: {node.type} {node.name}")
 
     def print_FunctionCall(self, node):
-        result = self.indented(f"FunctionCall: {node.name.value}\n")
-        self.indent_level += 1 
+        self.write(f"FunctionCall: {node.name.value}")
         if node.params:
-            result += self.indented(f"Arguments: \n")
             self.indent_level += 1
-            for p in node.params:
-                result += self.print(p) + "\n"
+            self.block("Arguments: ", node.params)
             self.indent_level -= 1
-        self.indent_level -= 1
-        return result
 
     def print_ReturnStatement(self, node):
-        result = self.indented("Return:\n")
-        self.indent_level += 1
-        result += self.print(node.expression) + "\n"
-        self.indent_level -= 1
-        return result 
+        self.block("Return:", node.expression)
 
     def print_Number(self, node):
-        return self.indented(f"Number: {node.value.value}")
+        self.write(f"Number: {node.value.value}")
 
     def print_UnaryOps(self, node):
-        result = self.indented(f"UnaryOps: {node.op.type.name}") + "\n"
-        result += self.print(node.right)
-        return result
+        self.write(f"UnaryOps: {node.op.type.name}")
+        self.print(node.right)
 
     def print_BinaryOps(self, node):
-        result = self.indented(f"BinaryOps: {node.op.type.name}") + "\n"
-        result += self.print(node.left) + "\n"
-        result += self.print(node.right) 
-        return result
+        self.write(f"BinaryOps: {node.op.type.name}")
+        self.print(node.left)
+        self.print(node.right)
+
+    def print_Parameter(self, node):
+        self.write(f"Parameter: {node.type} {node.name.value}")
 
     def print_Declaration(self, node):
-        result = self.indented(f"Declaration: {node.name}\n")
+        size = f"[{node.size}]" if node.size is not None else ""
+        self.write(f"Declaration: {node.type} {node.name}{size}")
         if node.exp:
             self.indent_level += 1
-            result += self.indented("Initializer: \n")
-            self.indent_level += 1
-            result += self.print(node.exp) + "\n"
-            self.indent_level -= 2
-        return result
+            self.block("Initializer: ", node.exp)
+            self.indent_level -= 1
 
     def print_Variable(self, node):
-        return self.indented(f"Variable: {node.name.value}")
+        self.write(f"Variable: {node.name.value}")
 
-    def print_Assign(self, node):
-        print(node.name)
-        result = self.indented(f"Assign: {node.name.value}\n")
-        self.indent_level += 1
-        result += self.indented("Value:\n")
-        self.indent_level += 1
-        result += self.print(node.exp)
-        self.indent_level -= 2
-        return result
+    def print_Subscript(self, node):
+        self.block("Subscript:", [node.array, node.index])
 
-    def print_Conditional(self, node):
-        result = self.indented(f"Conditional: \n")
-        self.indent_level += 1
-        result += self.indented(f"If: \n")
+    def print_AddressOf(self, node):
+        self.block("AddressOf:", node.operand)
+
+    def print_Dereference(self, node):
+        self.block("Dereference:", node.operand)
+
+    def print_Store(self, node):
+        self.write("Store:")
         self.indent_level += 1
-        result += self.print(node.condition) + "\n"
+        self.print(node.target)
+        self.block("Value:", node.exp)
         self.indent_level -= 1
-        result += self.indented(f"Then: \n")
+
+    def print_Assign(self, node):
+        self.write(f"Assign: {node.name.value}")
         self.indent_level += 1
-        if isinstance(node.if_stmt, list):
-            for stmt in node.if_stmt:
-                result += self.print(stmt) + "\n"
-        else:
-            result += self.print(node.if_stmt) + "\n"
+        self.block("Value:", node.exp)
         self.indent_level -= 1
-        result += self.indented(f"Else: \n")
-        self.indent_level += 1
-        if isinstance(node.else_stmt, list):
-            for stmt in node.else_stmt:
-                result += self.print(stmt) + "\n"
-        else:
-            result += self.print(node.else_stmt)
-        self.indent_level -= 2
-        return result
 
-    def print_Block(self, node):
-        result = self.indented("Block: \n")
+    def print_Conditional(self, node):
+        self.write("Conditional: ")
         self.indent_level += 1
-        if isinstance(node.statements, list):
-            for stmt in node.statements:
-                result += self.print(stmt)
-        else:
-            result += self.print(node.statements)
+        self.block("If: ", node.condition)
+        self.block("Then: ", node.if_stmt)
+        if node.else_stmt is not None:
+            self.block("Else: ", node.else_stmt)
         self.indent_level -= 1
-        return result 
+
+    def print_Block(self, node):
+        self.block("Block: ", node.statements)
 
     def print_For(self, node):
-        result = self.indented("For: \n")
-        self.indent_level += 1
-        result += self.indented("Init: \n")
+        self.write("For: ")
         self.indent_level += 1
-        result += self.print(node.init)
+        self.block("Init: ", node.init)
+        self.block("Condition: ", node.condition)
+        self.block("Update: ", node.update)
+        self.print(node.stmt)
         self.indent_level -= 1
-        result += self.indented("Condition: \n")
-        self.indent_level += 1
-        result += self.print(node.condition) + "\n"
-        self.indent_level -= 1 
-        result += self.indented("Update: \n")
-        self.indent_level += 1
-        result += self.print(node.update) + "\n"
-        self.indent_level -= 1
-        result += self.print(node.stmt)
-        self.indent_level -= 1 
-        return result
 
     def print_While(self, node):
-        result = self.indented("While:\n")
-        self.indent_level += 1 
-        result += self.indented("Condition:\n")
-        self.indent_level += 1 
-        result += self.print(node.condition) + "\n"
-        self.indent_level -= 1 
-        result += self.print(node.stmt)
+        self.write("While:")
+        self.indent_level += 1
+        self.block("Condition:", node.condition)
+        self.print(node.stmt)
         self.indent_level -= 1
-        return result
 
     def print_Do(self, node):
-        result = self.indented("Do:\n")
-        self.indent_level += 1 
-        result += self.print(node.stmt) + "\n"
-        result += self.indented("While:\n")
+        self.write("Do:")
         self.indent_level += 1
-        result += self.print(node.exp) + "\n"
-        self.indent_level -= 2
-        return result
-    
+        self.print(node.stmt)
+        self.block("While:", node.exp)
+        self.indent_level -= 1
+
+    def print_Switch(self, node):
+        self.write("Switch:")
+        self.indent_level += 1
+        self.block("Value:", node.condition)
+        self.print(node.body)
+        self.indent_level -= 1
+
+    def print_Case(self, node):
+        if node.value is None:
+            self.write("Default:")
+        else:
+            self.block("Case:", node.value)
+        if node.stmt is not None:
+            self.indent_level += 1
+            self.print(node.stmt)
+            self.indent_level -= 1
+
     def print_Break(self, node):
-        result = self.indented("Break\n")
-        return result 
+        self.write("Break")
 
     def print_Continue(self, node):
-        result = self.indented("Continue\n")
+        self.write("Continue")
+
+_node_fields = {}
+
+def node_fields(cls):
+    # the constructor parameters of a node class, in order
+    fields = _node_fields.get(cls)
+    if fields is None:
+        init = vars(cls).get("__init__")
+        fields = _node_fields[cls] = init.__code__.co_varnames[1:init.__code__.co_argcount] if init else ()
+    return fields
+
+def node_json(value):
+    # a node as plain dicts, lists and strings for json
+    if isinstance(value, ASTNode):
+        result = {"node": type(value).__name__}
+        if value.line:
+            result["line"], result["column"] = value.line, value.column
+        for field in node_fields(type(value)):
+            result[field] = node_json(getattr(value, field))
         return result
+    if isinstance(value, list):
+        return [node_json(item) for item in value]
+    if isinstance(value, (str, int)) or value is None:
+        return value
+    return value.value  # a token
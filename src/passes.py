@@ -0,0 +1,597 @@
+# Optimization passes and the pass manager behind -O0/-O1/-O2
+#
+# AST passes rewrite (or, like Vectorize, annotate) a Function before code generation and
+# report how many nodes they removed; assembly passes rewrite the function's Instruction/Label records and report
+# how many instructions they saved.
+
+import re
+import time
+
+from .asm import Instruction, Label, Directive, DWORD_REGISTERS
+from .lexer import Token
+from .parser import *
+from .resolve import INT_MIN, wrap
+from .tokentype import TokenType
+
+def count_nodes(node):
+    from .instrument import count_nodes
+    return count_nodes(node)
+
+def transform(node, fn):
+    # rebuild the tree bottom up, fn returns the replacement for every node
+    if isinstance(node, list):
+        return [transform(item, fn) for item in node]
+    if not isinstance(node, ASTNode):
+        return node
+    for key, value in vars(node).items():
+        if isinstance(value, (ASTNode, list)):
+            setattr(node, key, transform(value, fn))
+    return fn(node)
+
+def number(value):
+    return Number(Token(TokenType.NUMBER, str(value)))
+
+def constant(node):
+    if isinstance(node, Number):
+        return int(node.value.value)
+    return None
+
+def has_side_effects(node):
+    # whether evaluating the node assigns, stores or calls (a call can write anything)
+    if isinstance(node, list):
+        return any(has_side_effects(item) for item in node)
+    if not isinstance(node, ASTNode):
+        return False
+    if isinstance(node, (Assign, Store, FunctionCall)):
+        return True
+    return any(has_side_effects(value) for value in vars(node).values() if isinstance(value, (ASTNode, list)))
+
+class Pass:
+    name = None
+    kind = "ast"    # "ast" passes see the Function, "asm" passes its instruction records
+    level = 1       # lowest -O level that enables the pass
+
+    def run(self, target):
+        raise NotImplementedError(f"Pass {self.name} does not implement run()")
+
+class ConstantFold(Pass):
+    name = "constant-fold"
+
+    binary = {
+        TokenType.PLUS: lambda a, b: a + b,
+        TokenType.MINUS: lambda a, b: a - b,
+        TokenType.STAR: lambda a, b: a * b,
+        TokenType.BITWISE_AND: lambda a, b: a & b,
+        TokenType.BITWISE_OR: lambda a, b: a | b,
+        TokenType.BITWISE_XOR: lambda a, b: a ^ b,
+        TokenType.BITWISE_SHIFT_LEFT: lambda a, b: a << (b & 31),
+        TokenType.BITWISE_SHIFT_RIGHT: lambda a, b: a >> (b & 31),
+        TokenType.EQUAL: lambda a, b: int(a == b),
+        TokenType.NOT_EQUAL: lambda a, b: int(a != b),
+        TokenType.LESS_THAN: lambda a, b: int(a < b),
+        TokenType.LESS_THAN_OR_EQUAL: lambda a, b: int(a <= b),
+        TokenType.GREATER_THAN: lambda a, b: int(a > b),
+        TokenType.GREATER_THAN_OR_EQUAL: lambda a, b: int(a >= b),
+        TokenType.AND: lambda a, b: int(bool(a) and bool(b)),
+        TokenType.OR: lambda a, b: int(bool(a) or bool(b)),
+    }
+
+    unary = {
+        TokenType.MINUS: lambda a: -a,
+        TokenType.BITWISE_COMPLEMENT: lambda a: ~a,
+        TokenType.LOGICAL_NEGATION: lambda a: int(not a),
+    }
+
+    def fold(self, node):
+        if isinstance(node, BinaryOps):
+            a, b = constant(node.left), constant(node.right)
+            if a is None or b is None:
+                return node
+            if node.op.type in (TokenType.SLASH, TokenType.PERCENT):
+                if b == 0 or (a == INT_MIN and b == -1):
+                    return node # leave the trap to run time
+                # C division truncates toward zero
+                q = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)
+                return number(wrap(q if node.op.type == TokenType.SLASH else a - b * q))
+            if node.op.type in self.binary:
+                return number(wrap(self.binary[node.op.type](a, b)))
+        elif isinstance(node, UnaryOps):
+            a = constant(node.right)
+            if a is not None and node.op.type in self.unary:
+                return number(wrap(self.unary[node.op.type](a)))
+        return node
+
+    def run(self, function):
+        return transform(function, self.fold)
+
+class DeadCode(Pass):
+    name = "dead-code"
+
+    def prune(self, node):
+        if isinstance(node, Conditional):
+            # branches on constants, including folded ternaries
+            value = constant(node.condition)
+            if value is not None:
+                if value:
+                    return node.if_stmt
+                return node.else_stmt if node.else_stmt is not None else Block([])
+        elif isinstance(node, While) and constant(node.condition) == 0:
+            return Block([])
+        elif isinstance(node, Block) and isinstance(node.statements, list):
+            node.statements = self.reachable(node.statements)
+        return node
+
+    def reachable(self, statements):
+        # nothing after a return, break or continue in the same block runs, up to the next
+        # case label; declarations stay as later cases can still use the variable
+        labels = any(isinstance(stmt, Case) for stmt in statements)
+        out = []
+        skipping = False
+        for stmt in statements:
+            if isinstance(stmt, Case):
+                skipping = False
+            if not skipping or (labels and isinstance(stmt, Declaration)):
+                out.append(stmt)
+            while isinstance(stmt, Case):
+                stmt = stmt.stmt
+            if isinstance(stmt, (ReturnStatement, Break, Continue)):
+                skipping = True
+        return out
+
+    def run(self, function):
+        return transform(function, self.prune)
+
+class VectorLoop:
+    # what Vectorize found in a counted loop; the code generator checks it against the
+    # resolved symbols and emits the SSE2 loop in front of the scalar one
+    def __init__(self, index, limit, kind, target, op, expression, statement):
+        self.index = index              # name of the loop counter
+        self.limit = limit              # Number or Variable the counter runs up to
+        self.kind = kind                # "map" stores target[i], "reduce" folds into target
+        self.target = target            # Variable of the array or the accumulator
+        self.op = op                    # reduction operator: a TokenType, "min" or "max"
+        self.expression = expression    # elementwise expression evaluated for every i
+        self.statement = statement      # the loop body, its Assign binds the accumulator
+
+class Vectorize(Pass):
+    name = "vectorize"
+    level = 2
+
+    # elementwise operators with an SSE2 equivalent; reductions need them to be associative
+    elementwise = (TokenType.PLUS, TokenType.MINUS, TokenType.BITWISE_XOR, TokenType.BITWISE_AND, TokenType.BITWISE_OR)
+    reductions = (TokenType.PLUS, TokenType.BITWISE_XOR, TokenType.BITWISE_AND, TokenType.BITWISE_OR)
+
+    def run(self, function):
+        return transform(function, self.annotate)
+
+    def annotate(self, node):
+        if isinstance(node, For):
+            plan = self.match(node)
+            if plan is not None:
+                node.vector = plan
+        return node
+
+    def match(self, node):
+        # for (int i = A; i < N; i = i + 1) <one statement>
+        if isinstance(node.init, Declaration) and node.init.size is None and node.init.exp is not None:
+            index = node.init.name
+        elif isinstance(node.init, Assign) and isinstance(node.init.name, Token):
+            index = node.init.name.value
+        else:
+            return None
+        condition = node.condition
+        if not (isinstance(condition, BinaryOps) and condition.op.type == TokenType.LESS_THAN
+                and self.is_variable(condition.left, index) and self.invariant(condition.right, index)):
+            return None
+        update = node.update
+        if not (isinstance(update, Assign) and isinstance(update.name, Token) and update.name.value == index
+                and isinstance(update.exp, BinaryOps) and update.exp.op.type == TokenType.PLUS
+                and {self.describe(update.exp.left), self.describe(update.exp.right)} == {("var", index), ("num", 1)}):
+            return None
+
+        stmt = node.stmt
+        if isinstance(stmt, Block) and isinstance(stmt.statements, list) and len(stmt.statements) == 1:
+            stmt = stmt.statements[0]
+
+        # a[i] = <elementwise expression>
+        if isinstance(stmt, Store) and isinstance(stmt.target, Subscript) \
+                and isinstance(stmt.target.array, Variable) and stmt.target.array.name.value != index \
+                and self.is_variable(stmt.target.index, index) and self.elementwise_expression(stmt.exp, index):
+            return VectorLoop(index, condition.right, "map", stmt.target.array, None, stmt.exp, stmt)
+
+        # s = s <op> <elementwise expression>, or s = min/max(s, <elementwise expression>)
+        if isinstance(stmt, Assign) and isinstance(stmt.name, Token):
+            accumulator = stmt.name.value
+            if accumulator == index or self.is_variable(condition.right, accumulator):
+                return None
+            exp = stmt.exp
+            if isinstance(exp, BinaryOps) and exp.op.type in self.reductions:
+                for own, other in ((exp.left, exp.right), (exp.right, exp.left)):
+                    if self.is_variable(own, accumulator) and self.elementwise_expression(other, index, accumulator):
+                        return VectorLoop(index, condition.right, "reduce", Variable(stmt.name), exp.op.type, other, stmt)
+            selection = self.min_max(exp)
+            if selection is not None:
+                kind, a, b = selection
+                for own, other in ((a, b), (b, a)):
+                    if self.is_variable(own, accumulator) and self.elementwise_expression(other, index, accumulator):
+                        return VectorLoop(index, condition.right, "reduce", Variable(stmt.name), kind, other, stmt)
+        return None
+
+    def elementwise_expression(self, node, index, accumulator=None):
+        # loads of x[i], loop invariants and the elementwise operators on them
+        if isinstance(node, Subscript):
+            return isinstance(node.array, Variable) and node.array.name.value not in (index, accumulator) \
+                and self.is_variable(node.index, index)
+        if isinstance(node, BinaryOps):
+            return node.op.type in self.elementwise and self.elementwise_expression(node.left, index, accumulator) \
+                and self.elementwise_expression(node.right, index, accumulator)
+        selection = self.min_max(node)
+        if selection is not None and self.elementwise_expression(selection[1], index, accumulator) \
+                and self.elementwise_expression(selection[2], index, accumulator):
+            node.selection = selection[0]
+            return True
+        return self.invariant(node, index, accumulator)
+
+    def min_max(self, node):
+        # x < y ? x : y is ("min", x, y), x < y ? y : x is ("max", x, y), likewise for >, <= and >=
+        if not (isinstance(node, Conditional) and isinstance(node.condition, BinaryOps)):
+            return None
+        less = (TokenType.LESS_THAN, TokenType.LESS_THAN_OR_EQUAL)
+        greater = (TokenType.GREATER_THAN, TokenType.GREATER_THAN_OR_EQUAL)
+        op = node.condition.op.type
+        if op not in less + greater:
+            return None
+        x, y = node.condition.left, node.condition.right
+        picks = (self.describe(node.if_stmt), self.describe(node.else_stmt))
+        if picks == (self.describe(x), self.describe(y)):
+            kind = "min" if op in less else "max"
+        elif picks == (self.describe(y), self.describe(x)):
+            kind = "max" if op in less else "min"
+        else:
+            return None
+        if None in picks:
+            return None
+        return kind, x, y
+
+    def invariant(self, node, index, accumulator=None):
+        description = self.describe(node)
+        return description is not None and description[0] in ("num", "var") \
+            and description not in (("var", index), ("var", accumulator))
+
+    def is_variable(self, node, name):
+        return isinstance(node, Variable) and node.name.value == name
+
+    def describe(self, node):
+        # a comparable description of the leaves the matcher deals with
+        if isinstance(node, Number):
+            return ("num", int(node.value.value))
+        if isinstance(node, Variable):
+            return ("var", node.name.value)
+        if isinstance(node, Subscript) and isinstance(node.array, Variable) and isinstance(node.index, Variable):
+            return ("load", node.array.name.value, node.index.name.value)
+        return None
+
+# if-conversion cost model, in instructions: computing both arms and picking one with cmov
+# costs both arms plus SELECT_OVERHEAD, a branch costs one arm on average plus a compare and
+# jump and SELECT_MISPREDICT for every misprediction. A profile gives the misprediction rate
+# as the share of the rarer side (the best a predictor does on a branch it can't learn);
+# without one, branches are taken to mispredict SELECT_UNKNOWN_MISSES of the time
+SELECT_OVERHEAD = 2
+SELECT_MISPREDICT = 15
+SELECT_UNKNOWN_MISSES = 0.25
+
+class Select:
+    # what IfConvert found in a conditional; the code generator checks the types against
+    # the resolved symbols, computes both values and picks one with cmov
+    def __init__(self, target, then, other):
+        self.target = target            # Assign both arms store to, None for a ternary's value
+        self.then = then                # value when the condition holds
+        self.other = other              # value otherwise, None keeps the target's value
+
+class IfConvert(Pass):
+    name = "if-convert"
+    level = 2
+
+    # operators that can't fault and don't branch; / and % trap on 0, && and || branch
+    operators = (TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.BITWISE_AND, TokenType.BITWISE_OR,
+                 TokenType.BITWISE_XOR, TokenType.BITWISE_SHIFT_LEFT, TokenType.BITWISE_SHIFT_RIGHT)
+    comparisons = (TokenType.EQUAL, TokenType.NOT_EQUAL, TokenType.LESS_THAN, TokenType.LESS_THAN_OR_EQUAL,
+                   TokenType.GREATER_THAN, TokenType.GREATER_THAN_OR_EQUAL)
+
+    def run(self, function):
+        return transform(function, self.annotate)
+
+    def annotate(self, node):
+        if isinstance(node, Conditional):
+            node.select = self.match(node)
+        return node
+
+    def match(self, node):
+        # c ? a : b, or if (c) x = a; [else x = b;] with both values cheap to compute. The
+        # values are computed before the condition, so the condition can't change them
+        if has_side_effects(node.condition):
+            return None
+        then, other = self.single(node.if_stmt), self.single(node.else_stmt)
+        target = None
+        if isinstance(then, Assign) and isinstance(then.name, Token):
+            if other is None:
+                pass
+            elif isinstance(other, Assign) and isinstance(other.name, Token) and other.name.value == then.name.value:
+                other = other.exp
+            else:
+                return None
+            target, then = then, then.exp
+        elif other is None:
+            return None
+        a = self.cost(then)
+        b = self.cost(other) if other is not None else 1
+        if a is None or b is None or not self.profitable(node, a + b):
+            return None
+        return Select(target, then, other)
+
+    def single(self, stmt):
+        # the only statement of a block
+        while isinstance(stmt, Block) and isinstance(stmt.statements, list) and len(stmt.statements) == 1:
+            stmt = stmt.statements[0]
+        return stmt
+
+    def cost(self, node):
+        # instructions computing a value that can be computed speculatively, None if it can't:
+        # it has no side effects, doesn't branch and doesn't load (a branch can guard a load)
+        if isinstance(node, (Number, Variable)):
+            return 1
+        if isinstance(node, UnaryOps):
+            right = self.cost(node.right)
+            return None if right is None else right + (1 if node.op.type != TokenType.LOGICAL_NEGATION else 3)
+        if isinstance(node, BinaryOps) and node.op.type in self.operators + self.comparisons:
+            left, right = self.cost(node.left), self.cost(node.right)
+            if left is None or right is None:
+                return None
+            return left + right + (2 if node.op.type in self.operators else 4)
+        return None
+
+    def profitable(self, node, cost):
+        taken, skipped = getattr(node, "profile", (None, None))
+        if taken is None:
+            misses = SELECT_UNKNOWN_MISSES
+        elif taken + skipped:
+            misses = min(taken, skipped) / (taken + skipped)
+        else:
+            return False # never ran, its layout doesn't matter
+        return cost + SELECT_OVERHEAD <= cost / 2 + 1 + misses * SELECT_MISPREDICT
+
+def op(record):
+    # opcode of an instruction record, None for labels and directives
+    return record.opcode if isinstance(record, Instruction) else None
+
+class Peephole(Pass):
+    name = "peephole"
+    kind = "asm"
+
+    def rewrite(self, records):
+        out = []
+        for record in records:
+            prev = out[-1] if out else None
+            if op(record) == "pop" and op(prev) == "push":
+                # push rax / pop rax cancel out
+                if record.operands == prev.operands:
+                    out.pop()
+                    continue
+                # push rax / pop rbx is a register move
+                out[-1] = Instruction("mov", record.operands[0], prev.operands[0])
+                continue
+            # push rax / <instr> / pop rbx, when <instr> leaves rbx and the stack alone
+            if op(record) == "pop" and len(out) >= 2 and op(prev) in ("mov", "lea"):
+                push, target = out[-2], record.operands[0]
+                if op(push) == "push" and push.operands[0] != target and not prev.mentions(target) \
+                        and not prev.mentions(DWORD_REGISTERS.get(target, target)) and not prev.mentions("rsp"):
+                    out[-2] = Instruction("mov", target, push.operands[0])
+                    continue
+            if op(record) == "mov" and len(record.operands) == 2:
+                dst, src = record.operands
+                # a load right after a store to the same slot is already in the register
+                if op(prev) == "mov" and prev.operands == (src, dst) and src.startswith("["):
+                    continue
+                # mov x, x
+                if dst == src:
+                    continue
+            out.append(record)
+        return out
+
+    def jumps(self, records):
+        # a jump to the very next label falls through anyway
+        out = []
+        for i, record in enumerate(records):
+            if op(record) == "jmp" and i + 1 < len(records) and records[i + 1] == Label(record.operands[0]):
+                continue
+            out.append(record)
+        return out
+
+    def run(self, records):
+        return self.jumps(self.rewrite(records))
+
+class Unreachable(Pass):
+    name = "unreachable"
+    kind = "asm"
+
+    def run(self, records):
+        # dropping code can orphan more labels, so repeat until nothing changes
+        while True:
+            out = self.sweep(records)
+            if len(out) == len(records):
+                return out
+            records = out
+
+    def sweep(self, records):
+        # local labels nothing refers to (in a jump, a lea or a jump table) don't make the
+        # code after them reachable
+        targets = set()
+        for record in records:
+            if isinstance(record, Instruction):
+                for operand in record.operands:
+                    targets.update(re.findall(r"\.\w+", operand))
+            elif isinstance(record, Directive):
+                targets.update(re.findall(r"\.\w+", record.text))
+
+        out = []
+        reachable = True
+        for record in records:
+            if isinstance(record, Label) and (not record.name.startswith(".") or record.name in targets):
+                reachable = True
+            # directives, e.g. section switches around jump tables, aren't code
+            if reachable or isinstance(record, Directive):
+                out.append(record)
+            if op(record) in ("jmp", "ret"):
+                reachable = False
+        return out
+
+class ImmediateOperands(Pass):
+    name = "immediate-operands"
+    kind = "asm"
+    level = 2
+
+    # mov rbx, rax / mov eax, IMM / <op using ebx> -> <op with IMM>; rbx is scratch in pycc's
+    # lowering, so it doesn't need to hold the left operand afterwards
+    def run(self, records):
+        out = []
+        i = 0
+        while i < len(records):
+            window = records[i:i + 4]
+            if len(window) >= 3 and window[0] == Instruction("mov", "rbx", "rax") and op(window[1]) == "mov" \
+                    and window[1].operands[0] == "eax" and self.immediate(window[1].operands[1]):
+                imm = window[1].operands[1]
+                third = window[2]
+                if op(third) in ("add", "and", "or", "xor") and third.operands == ("eax", "ebx"):
+                    out.append(Instruction(third.opcode, "eax", imm))
+                    i += 3
+                    continue
+                if third == Instruction("imul", "eax", "ebx"):
+                    out.append(Instruction("imul", "eax", "eax", imm))
+                    i += 3
+                    continue
+                if third == Instruction("cmp", "ebx", "eax"):
+                    out.append(Instruction("cmp", "eax", imm))
+                    i += 3
+                    continue
+                if third == Instruction("sub", "ebx", "eax") and len(window) == 4 and window[3] == Instruction("mov", "eax", "ebx"):
+                    out.append(Instruction("sub", "eax", imm))
+                    i += 4
+                    continue
+            out.append(records[i])
+            i += 1
+        return out
+
+    def immediate(self, operand):
+        try:
+            # ALU instructions take at most 32-bit immediates
+            return -(1 << 31) <= int(operand) < (1 << 31)
+        except ValueError:
+            return False
+
+class PassStats:
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.seconds = 0.0
+        self.nodes_removed = 0
+        self.instructions_saved = 0
+
+    def add(self, other):
+        self.runs += other.runs
+        self.seconds += other.seconds
+        self.nodes_removed += other.nodes_removed
+        self.instructions_saved += other.instructions_saved
+
+class PassManager:
+    def __init__(self, level=0, disabled=()):
+        self.passes = []
+        self.level = level
+        self.disabled = set(disabled)
+        self.enabled = set()
+        self.stats = {}
+
+    def register(self, pass_, before=None, after=None):
+        names = [p.name for p in self.passes]
+        if before is not None:
+            self.passes.insert(names.index(before), pass_)
+        elif after is not None:
+            self.passes.insert(names.index(after) + 1, pass_)
+        else:
+            self.passes.append(pass_)
+        self.stats[pass_.name] = PassStats(pass_.name)
+        return pass_
+
+    def enable(self, name):
+        self.enabled.add(name)
+        self.disabled.discard(name)
+
+    def disable(self, name):
+        self.disabled.add(name)
+        self.enabled.discard(name)
+
+    def is_active(self, pass_):
+        if pass_.name in self.disabled:
+            return False
+        return pass_.name in self.enabled or self.level >= pass_.level
+
+    def active(self, kind):
+        return [p for p in self.passes if p.kind == kind and self.is_active(p)]
+
+    def signature(self):
+        # identifies the optimized output, e.g. for caches
+        return ",".join(p.name for p in self.passes if self.is_active(p))
+
+    def run_ast(self, function):
+        for pass_ in self.active("ast"):
+            stats = self.stats[pass_.name]
+            before = count_nodes(function)
+            start = time.perf_counter()
+            function = pass_.run(function)
+            stats.seconds += time.perf_counter() - start
+            stats.runs += 1
+            stats.nodes_removed += before - count_nodes(function)
+        return function
+
+    def run_asm(self, records):
+        for pass_ in self.active("asm"):
+            stats = self.stats[pass_.name]
+            before = len(records)
+            start = time.perf_counter()
+            records = pass_.run(records)
+            stats.seconds += time.perf_counter() - start
+            stats.runs += 1
+            stats.instructions_saved += before - len(records)
+        return records
+
+    def take_stats(self):
+        # hands over the stats gathered so far and starts counting from zero, e.g. in a worker
+        stats = self.stats
+        self.stats = {name: PassStats(name) for name in stats}
+        return stats
+
+    def merge_stats(self, stats):
+        for name, s in stats.items():
+            self.stats[name].add(s)
+
+    def report(self):
+        lines = [f"{'pass':<20} {'on':>3} {'ms':>9} {'nodes removed':>14} {'instrs saved':>13}"]
+        for pass_ in self.passes:
+            s = self.stats[pass_.name]
+            lines.append(f"{s.name:<20} {'yes' if self.is_active(pass_) else 'no':>3} {1000 * s.seconds:>9.3f} "
+                         f"{s.nodes_removed:>14} {s.instructions_saved:>13}")
+        return "\n".join(lines)
+
+def default_pass_manager(level=0, disabled=(), enabled=()):
+    manager = PassManager(level, disabled)
+    manager.register(ConstantFold())
+    manager.register(DeadCode())
+    manager.register(Vectorize())
+    manager.register(IfConvert())
+    manager.register(Unreachable())
+    manager.register(Peephole())
+    manager.register(ImmediateOperands())
+    for name in enabled:
+        manager.enable(name)
+    return manager
+
+PASS_NAMES = [p.name for p in default_pass_manager().passes]
@@ -0,0 +1,98 @@
+# Profile-guided optimization (`--profile-generate`, `--profile-use`)
+#
+# Counters are numbered by walking the resolved program in source order, so the
+# instrumented build and the build that uses the profile agree on them as long as the
+# source is the same. Functions count their calls and memo table hits, conditionals their
+# two branches, loops how often they are entered and how often their body runs, and call
+# sites how often they call. The instrumented program writes a header and all counters to the
+# profile file when `main` returns.
+
+import os
+import struct
+
+from .parser import *
+
+PROFILE_MAGIC = 0x464F525043435950 # "PYCCPROF"
+
+# counters of every instrumented node type
+COUNTERS = {
+    Function: 2,        # calls, memo hits (see purity.py)
+    Conditional: 2,     # then branch, else branch
+    For: 2,             # entries, iterations
+    While: 2,
+    Do: 2,
+    FunctionCall: 1,    # calls from this site
+}
+
+def number_counters(program):
+    # gives every instrumented node its `counters` (indexes), returns the number of counters
+    total = 0
+    seen = set()
+    stack = [program]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ASTNode):
+            if id(item) in seen:
+                continue # switches also list their cases
+            seen.add(id(item))
+            count = COUNTERS.get(type(item))
+            if count:
+                item.counters = tuple(range(total, total + count))
+                total += count
+            stack.extend(reversed([v for v in vars(item).values() if isinstance(v, (ASTNode, list))]))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+    return total
+
+def program_fingerprint(program):
+    # 64 bits of the program's AST hash, before counters are attached
+    from .incremental import fingerprint
+    return int(fingerprint(program)[:16], 16)
+
+class Instrumentation:
+    # what --profile-generate needs to emit: the counters and where to dump them
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.fingerprint = 0
+        self.counters = 0
+
+    def prepare(self, program):
+        self.fingerprint = program_fingerprint(program)
+        self.counters = number_counters(program)
+
+class Profile:
+    def __init__(self, path, fingerprint, counts):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.counts = counts
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            raise Exception(f"Profile `{path}` not found, run a --profile-generate build first")
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < 24:
+            raise Exception(f"Profile `{path}` is truncated")
+        magic, fingerprint, count = struct.unpack_from("<QQQ", data)
+        if magic != PROFILE_MAGIC or len(data) != 24 + 8 * count:
+            raise Exception(f"`{path}` is not a pycc profile")
+        return cls(path, fingerprint, struct.unpack_from(f"<{count}Q", data, 24))
+
+    def annotate(self, program):
+        # attaches the counts to the nodes as `profile`; a profile of another program
+        # is ignored, like gcc does on a coverage mismatch
+        if program_fingerprint(program) != self.fingerprint or number_counters(program) != len(self.counts):
+            print(f"[WARNING]: profile `{self.path}` was recorded for a different program, ignoring it")
+            return False
+        stack = [program]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, ASTNode):
+                counters = getattr(item, "counters", None)
+                if counters is not None:
+                    item.profile = tuple(self.counts[i] for i in counters)
+                stack.extend(v for v in vars(item).values() if isinstance(v, (ASTNode, list)))
+            elif isinstance(item, list):
+                stack.extend(item)
+        return True
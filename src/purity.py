@@ -0,0 +1,126 @@
+# Interprocedural purity analysis and memoization of pure recursive functions (`--memoize`)
+#
+# A function is pure when its result only depends on its int arguments and calling it does
+# nothing else: it takes no pointers, touches no memory but its own local arrays (no `*`, no
+# `&`, no pointer variables) and only calls pure functions. Functions that are only declared
+# come from other units and count as impure. The analysis starts out with every defined
+# function pure and drops the ones that break a rule until nothing changes, so mutually
+# recursive functions can be pure as well.
+#
+# A memoized function gets a direct-mapped table of `entries` slots in .bss. A call hashes
+# its arguments to a slot and returns the slot's result if the slot holds the same arguments;
+# otherwise it runs the body and overwrites the slot, evicting whatever was there. The table
+# never grows, and a key only ever costs one slot.
+
+from .parser import *
+from .resolve import is_pointer
+
+MEMO_ENTRIES = 4096
+MEMO_MAX_PARAMS = 6             # arguments in registers only
+MEMO_HASH = -1640531535         # 0x9E3779B1, 2^32 divided by the golden ratio
+
+def memo_slot_bytes(params):
+    # the arguments, the result and the used flag, rounded up to a power of two
+    size = 4 * (params + 2)
+    return 1 << (size - 1).bit_length()
+
+def walk(node):
+    # every node below `node`, itself included
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ASTNode):
+            yield item
+            stack.extend(v for v in vars(item).values() if isinstance(v, (ASTNode, list)))
+        elif isinstance(item, list):
+            stack.extend(item)
+
+def local_array(node):
+    symbol = getattr(node, "symbol", None)
+    return isinstance(node, Variable) and symbol is not None and symbol.size is not None
+
+def touches_memory(function):
+    # whether the function reads or writes memory that isn't one of its local arrays
+    if any(is_pointer(param.type) for param in function.parameters):
+        return True
+    arrays = set()
+    for node in walk(function.body):
+        if isinstance(node, (Dereference, AddressOf)):
+            return True
+        if isinstance(node, Declaration) and is_pointer(node.type):
+            return True
+        if isinstance(node, Subscript):
+            if not local_array(node.array):
+                return True
+            arrays.add(id(node.array))
+        elif isinstance(node, Variable) and is_pointer(getattr(node, "ctype", None)) and id(node) not in arrays:
+            # an array used as a pointer anywhere but in its own subscript; parents come
+            # first, so subscripts have marked their arrays already
+            return True
+    return False
+
+def calls(function):
+    return {node.name.value for node in walk(function.body) if isinstance(node, FunctionCall)}
+
+def call_graph(program):
+    return {f.name: calls(f) for f in program.function_list if isinstance(f, Function) and f.body}
+
+def pure_functions(program):
+    # names of the pure functions of a resolved program
+    functions = {f.name: f for f in program.function_list if isinstance(f, Function) and f.body}
+    graph = call_graph(program)
+    pure = {name for name, f in functions.items() if not touches_memory(f)}
+    while True:
+        impure = {name for name in pure if not graph[name] <= pure}
+        if not impure:
+            return pure
+        pure -= impure
+
+def recursive_functions(program):
+    # functions that can reach themselves through calls
+    graph = call_graph(program)
+    recursive = set()
+    for name in graph:
+        seen, stack = set(), list(graph[name])
+        while stack:
+            callee = stack.pop()
+            if callee == name:
+                recursive.add(name)
+                break
+            if callee not in seen and callee in graph:
+                seen.add(callee)
+                stack.extend(graph[callee])
+    return recursive
+
+class Memoization:
+    # which functions --memoize wraps in a memo table, decided once for the whole program
+    def __init__(self, entries=MEMO_ENTRIES):
+        if entries < 1 or entries & (entries - 1):
+            raise Exception(f"Memo tables need a power of two entries, not {entries}")
+        self.entries = entries
+        self.pure = set()
+        self.functions = []
+
+    def prepare(self, program):
+        # needs the resolved program
+        self.pure = pure_functions(program)
+        recursive = recursive_functions(program)
+        self.functions = [f.name for f in program.function_list
+                          if f.name in self.pure and f.name in recursive and f.name != "main"
+                          and isinstance(f, Function) and 1 <= len(f.parameters) <= MEMO_MAX_PARAMS]
+
+    def report(self, program):
+        # the memoized functions, with their hit rates when the program has a profile
+        if not self.functions:
+            return "Memoized no functions (none is pure and recursive)."
+        lines = [f"Memoized {len(self.functions)} function(s) with {self.entries} entries each:"]
+        nodes = {f.name: f for f in program.function_list if isinstance(f, Function)}
+        for name in self.functions:
+            profile = getattr(nodes[name], "profile", None)
+            if profile is None:
+                lines.append(f"  {name}")
+            else:
+                total, hits = profile
+                rate = f"{100 * hits / total:.1f}%" if total else "-"
+                lines.append(f"  {name}: {hits} of {total} calls hit ({rate})")
+        return "\n".join(lines)
@@ -0,0 +1,358 @@
+# Name resolution: binds every identifier to a Symbol once, before code generation
+#
+# Variables get the frame slot the code generator will give them (slots are 4 bytes, slot
+# n lives at [rbp - 4*n]; an int takes one, a pointer two, aligned to 8 bytes, and an array
+# starts at its highest slot), calls are checked against the
+# functions the program declares, and every Variable, Assign, Declaration, parameter
+# and call is annotated with its `symbol`, so the code generator never searches
+# scopes. Expressions get their `ctype` ("int", "int*", ...) and switches their
+# constant-folded, checked case labels.
+
+from .lexer import Token
+from .parser import *
+from .tokentype import TokenType
+
+SLOT_BYTES = 4
+INT_MIN, INT_MAX = -(1 << 31), (1 << 31) - 1
+
+class Symbol:
+    def __init__(self, name, kind, slot=None, arity=None, type="int", size=None):
+        self.name = name
+        self.kind = kind                # "local", "param" or "function"
+        self.slot = slot                # frame slot of locals and params
+        self.arity = arity              # parameter count of functions
+        self.type = type                # "int", "int*", ...; the element type of arrays
+        self.size = size                # element count of arrays
+        self.uses = 0
+        # locals and params whose address is never taken could live in a register
+        self.register_candidate = kind != "function" and size is None
+
+    def __repr__(self):
+        # deterministic, AST fingerprints include it
+        return f"Symbol({self.name!r}, {self.kind!r}, {self.slot}, {self.arity}, {self.type!r}, {self.size})"
+
+    def value_type(self):
+        # arrays decay to a pointer to their first element
+        return self.type + "*" if self.size is not None else self.type
+
+def is_pointer(ctype):
+    return ctype is not None and ctype.endswith("*")
+
+def sizeof(ctype):
+    # int is 32 bits, pointers 64
+    return 8 if is_pointer(ctype) else 4
+
+def wrap(value):
+    # int arithmetic wraps around at 32 bits, as the code generator's instructions do
+    return (value - INT_MIN) % (1 << 32) + INT_MIN
+
+def allocate(depth, type, size=None):
+    # the slot of a variable declared when `depth` slots are in use; objects are aligned to
+    # their element size, which rbp (16-byte aligned) keeps for the addresses
+    width = sizeof(type) // SLOT_BYTES
+    end = depth + width * (size if size is not None else 1)
+    return -(-end // width) * width
+
+class Resolver:
+    def __init__(self):
+        self.functions = {}
+        self.defined = set()
+        self.resolved = set()
+        self.errors = []
+        self.scopes = []
+        self.depths = []
+        self.depth = 0
+        self.max_depth = 0
+        self.function = None
+        self.node = None                # innermost node with a source position being resolved
+        self.resolvers = dispatch_table(type(self), "resolve", "generic_resolve")
+
+    def error(self, message, node=None):
+        node = node or self.node
+        if self.function:
+            message = f"{message} in function `{self.function}`"
+        if node is not None and node.line:
+            message = f"{node.line}:{node.column}: {message}"
+        self.errors.append(message)
+
+    def declare_functions(self, program):
+        for function in program.function_list:
+            params = function.parameters if isinstance(function, Function) else function.params
+            symbol = self.functions.get(function.name)
+            if symbol is None:
+                self.functions[function.name] = Symbol(function.name, "function", arity=len(params))
+            elif symbol.arity != len(params):
+                self.error(f"Conflicting declarations of `{function.name}` with {symbol.arity} and {len(params)} parameters", function)
+            if isinstance(function, Function):
+                if function.name in self.defined:
+                    self.error(f"Redefinition of function `{function.name}`", function)
+                self.defined.add(function.name)
+            function.symbol = self.functions[function.name]
+
+    def resolve_program(self, program):
+        self.declare_functions(program)
+        self.resolve_functions(program)
+
+    def resolve_functions(self, program):
+        for function in program.function_list:
+            if isinstance(function, Function) and function.body:
+                self.resolve_function(function)
+        self.check()
+
+    def resolve_function(self, node):
+        self.function = node.name
+        self.scopes, self.depths = [{}], []
+        self.depth = self.max_depth = 0
+        for param in node.parameters:
+            self.node = param
+            param.symbol = self.declare(param.name.value, "param", type=param.type)
+        self.node = None
+        # the body shares the parameters' scope, as in C
+        body = node.body.statements if isinstance(node.body, Block) else node.body
+        self.resolve_statements(body)
+        node.frame_slots = self.max_depth
+        self.scopes = []
+        self.function = None
+        self.resolved.add(node.name)
+
+    def check(self):
+        # report every problem at once, before anything is emitted
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise Exception("\n".join(errors))
+
+    def declare(self, name, kind, slot=None, type="int", size=None):
+        scope = self.scopes[-1]
+        if name in scope:
+            self.error(f"Redeclaration of `{name}`")
+        if slot is None:
+            slot = self.depth = allocate(self.depth, type, size)
+            self.max_depth = max(self.max_depth, self.depth)
+        scope[name] = Symbol(name, kind, slot=slot, type=type, size=size)
+        return scope[name]
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                symbol = scope[name]
+                symbol.uses += 1
+                return symbol
+        if name in self.functions:
+            self.error(f"Function `{name}` used as a variable")
+        else:
+            self.error(f"Undefined variable `{name}`")
+        return None
+
+    def enter_scope(self):
+        self.scopes.append({})
+        self.depths.append(self.depth)
+
+    def exit_scope(self):
+        # the slots of the scope's variables are free again
+        self.scopes.pop()
+        self.depth = self.depths.pop()
+
+    def resolve(self, node):
+        # returns the ctype of expressions, None for statements
+        resolver = self.resolvers[type(node)]
+        outer = self.node
+        if getattr(node, "line", 0):
+            self.node = node
+        ctype = resolver(self, node)
+        self.node = outer
+        if ctype is not None:
+            node.ctype = ctype
+        return ctype
+
+    def generic_resolve(self, node):
+        # visit children of nodes that don't bind or use names
+        if isinstance(node, list):
+            self.resolve_statements(node)
+        elif isinstance(node, ASTNode):
+            for value in vars(node).values():
+                if isinstance(value, (ASTNode, list)):
+                    self.resolve(value)
+
+    def resolve_statements(self, statements):
+        if isinstance(statements, list):
+            for stmt in statements:
+                self.resolve(stmt)
+        elif statements is not None:
+            self.resolve(statements)
+
+    def resolve_Block(self, node):
+        self.enter_scope()
+        self.resolve_statements(node.statements)
+        self.exit_scope()
+
+    def resolve_For(self, node):
+        # a declaration in the initializer is scoped to the loop
+        self.enter_scope()
+        for part in (node.init, node.condition, node.update, node.stmt):
+            if part is not None:
+                self.resolve(part)
+        self.exit_scope()
+
+    def resolve_Switch(self, node):
+        self.resolve(node.condition)
+        entries = switch_statements(node)
+
+        # a jump to a case can skip declarations, so the body's slots are all reserved up front
+        self.enter_scope()
+        reserved = {}
+        for _, stmt in entries:
+            if isinstance(stmt, Declaration):
+                self.depth = reserved[id(stmt)] = allocate(self.depth, stmt.type, stmt.size)
+        self.max_depth = max(self.max_depth, self.depth)
+
+        node.cases, node.default = [], None
+        values = set()
+        for labels, stmt in entries:
+            for case in labels:
+                self.resolve_label(node, case, values)
+            if isinstance(stmt, Declaration):
+                self.declare_local(stmt, reserved[id(stmt)])
+            elif stmt is not None:
+                self.resolve(stmt)
+        self.exit_scope()
+
+    def resolve_label(self, switch, case, values):
+        # only programs with a switch need the folder
+        from .passes import ConstantFold, constant, transform
+
+        if case.value is None:
+            if switch.default is not None:
+                self.error("Multiple default labels in one switch", case)
+            switch.default = case
+            return
+        case.value = transform(case.value, ConstantFold().fold)
+        case.constant = constant(case.value)
+        if case.constant is not None:
+            case.constant = wrap(case.constant)
+        if case.constant is None:
+            self.error("Case value is not an integer constant", case)
+        elif case.constant in values:
+            self.error(f"Duplicate case value {case.constant}", case)
+        else:
+            values.add(case.constant)
+            switch.cases.append(case)
+
+    def resolve_Case(self, node):
+        # labels nested deeper than the switch body would jump into the middle of a scope
+        self.error("`case` and `default` labels have to be directly inside a switch body")
+        self.resolve_statements(node.stmt)
+
+    def resolve_Declaration(self, node):
+        self.declare_local(node)
+
+    def declare_local(self, node, slot=None):
+        # the variable is in scope in its own initializer, as in C
+        node.symbol = self.declare(node.name, "local", slot, node.type, node.size)
+        if node.exp is not None:
+            self.resolve(node.exp)
+
+    def resolve_Assign(self, node):
+        ctype = self.resolve(node.exp)
+        if not isinstance(node.name, Token):
+            self.error("Invalid assignment target")
+            return ctype
+        node.symbol = self.lookup(node.name.value)
+        if node.symbol is not None and node.symbol.size is not None:
+            self.error(f"Cannot assign to array `{node.name.value}`")
+        return node.symbol.type if node.symbol is not None else ctype
+
+    def resolve_Store(self, node):
+        self.resolve(node.exp)
+        return self.resolve(node.target)
+
+    def resolve_Variable(self, node):
+        node.symbol = self.lookup(node.name.value)
+        return node.symbol.value_type() if node.symbol is not None else "int"
+
+    def resolve_Number(self, node):
+        return "int"
+
+    def resolve_UnaryOps(self, node):
+        if is_pointer(self.resolve(node.right)):
+            self.error(f"Invalid pointer operand to unary {node.op.value}")
+        return "int"
+
+    def resolve_BinaryOps(self, node):
+        left, right = self.resolve(node.left), self.resolve(node.right)
+        op = node.op.type
+        if not (is_pointer(left) or is_pointer(right)):
+            return "int"
+        # pointer arithmetic, comparisons and logic on pointers
+        if op == TokenType.PLUS and is_pointer(left) != is_pointer(right):
+            return left if is_pointer(left) else right
+        if op == TokenType.MINUS and is_pointer(left):
+            return "int" if is_pointer(right) else left
+        if op in (TokenType.EQUAL, TokenType.NOT_EQUAL, TokenType.LESS_THAN, TokenType.LESS_THAN_OR_EQUAL,
+                  TokenType.GREATER_THAN, TokenType.GREATER_THAN_OR_EQUAL, TokenType.AND, TokenType.OR):
+            return "int"
+        self.error(f"Invalid operands {left} and {right} to binary {node.op.value}")
+        return "int"
+
+    def resolve_Conditional(self, node):
+        # a ternary has the type of its branches, an if statement has none
+        self.resolve(node.condition)
+        ctype = self.resolve(node.if_stmt)
+        if node.else_stmt is not None:
+            self.resolve(node.else_stmt)
+        return ctype
+
+    def resolve_Subscript(self, node):
+        array, index = self.resolve(node.array), self.resolve(node.index)
+        if not is_pointer(array) or is_pointer(index):
+            self.error("Subscript needs an array or pointer and an int index")
+            return "int"
+        return array[:-1]
+
+    def resolve_AddressOf(self, node):
+        if isinstance(node.operand, Variable):
+            ctype = self.resolve(node.operand)
+            if node.operand.symbol is None:
+                return "int*"
+            node.operand.symbol.register_candidate = False
+            # &array is the address of its first element
+            return ctype if node.operand.symbol.size is not None else ctype + "*"
+        if isinstance(node.operand, (Subscript, Dereference)):
+            return self.resolve(node.operand) + "*"
+        self.error("Cannot take the address of a value")
+        return "int*"
+
+    def resolve_Dereference(self, node):
+        ctype = self.resolve(node.operand)
+        if not is_pointer(ctype):
+            self.error("Dereference of a non-pointer")
+            return "int"
+        return ctype[:-1]
+
+    def resolve_FunctionCall(self, node):
+        for arg in node.params:
+            self.resolve(arg)
+        name = node.name.value
+        symbol = self.functions.get(name)
+        if symbol is None:
+            self.error(f"Call to undeclared function `{name}`")
+        elif symbol.arity != len(node.params):
+            self.error(f"Function `{name}` takes {symbol.arity} argument(s), {len(node.params)} given")
+        node.symbol = symbol
+        return "int"
+
+def switch_statements(switch):
+    # the statements of a switch body with the case labels in front of each of them
+    body = switch.body.statements if isinstance(switch.body, Block) else [switch.body]
+    entries = []
+    for stmt in body:
+        labels = []
+        while isinstance(stmt, Case):
+            labels.append(stmt)
+            stmt = stmt.stmt
+        entries.append((labels, stmt))
+    return entries
+
+def resolve(program):
+    resolver = Resolver()
+    resolver.resolve_program(program)
+    return resolver
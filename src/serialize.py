@@ -0,0 +1,222 @@
+# Compact binary serialization of parsed ASTs, for AST caches and for handing a Program to
+# another process without pickling its object graph
+#
+# A blob is the header (magic and a checksum of the node schema), the string table and the
+# tree. A node is one byte, its kind, followed by its constructor fields in order and its
+# line and column. Every other value starts with a tag byte: None, an int, a string, a list
+# or a token. Integers are varints (LEB128, zigzag for the signed ones), and names, types and
+# token values are stored once in the string table and referred to by their index.
+#
+# Only what the parser builds is stored; annotations of later phases (symbols, ctypes,
+# profile counters) are not, so serialize a tree before resolving or optimizing it.
+
+import gc
+import hashlib
+import os
+import struct
+import sys
+import zlib
+from itertools import islice
+
+from .lexer import Token
+from .parser import *
+from .tokentype import TokenType
+
+MAGIC = b"PYCCAST\0"
+
+# the kind byte of every node class
+NODE_CLASSES = [
+    Program, Function, ReturnStatement, Number, UnaryOps, BinaryOps, Declaration, Parameter,
+    Assign, Variable, Subscript, AddressOf, Dereference, Store, Conditional, Block, For, While,
+    Do, Switch, Case, Break, Continue, FunctionDeclaration, FunctionCall,
+]
+NODE_KINDS = {cls: kind for kind, cls in enumerate(NODE_CLASSES)}
+# constructor parameters, in order
+NODE_FIELDS = [cls.__init__.__code__.co_varnames[1:cls.__init__.__code__.co_argcount] if "__init__" in vars(cls) else ()
+               for cls in NODE_CLASSES]
+TOKEN_TYPES = list(TokenType)
+TOKEN_INDEXES = {type: index for index, type in enumerate(TOKEN_TYPES)}
+
+# tags of values that aren't nodes, node kinds are below them
+TAG_NONE, TAG_INT, TAG_STRING, TAG_LIST, TAG_TOKEN = range(0xF0, 0xF5)
+
+# blobs of another schema are rejected instead of misread
+SCHEMA = zlib.crc32(repr([(cls.__name__, fields) for cls, fields in zip(NODE_CLASSES, NODE_FIELDS)]
+                         + [type.name for type in TOKEN_TYPES]).encode())
+
+def dumps(node):
+    out = bytearray()
+    strings = {}
+    last_line = 0
+
+    def varint(n):
+        while n >= 0x80:
+            out.append(n & 0x7F | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def position(line, column):
+        # the line as the distance to the last one written, 0 for no position
+        nonlocal last_line
+        if line:
+            delta = line - last_line
+            varint((delta << 1 if delta >= 0 else (-delta << 1) - 1) + 1)
+            varint(column)
+            last_line = line
+        else:
+            out.append(0)
+
+    def string(s):
+        index = strings.get(s)
+        if index is None:
+            index = strings[s] = len(strings)
+        varint(index)
+
+    def value(v):
+        kind = NODE_KINDS.get(type(v))
+        if kind is not None:
+            out.append(kind)
+            for field in NODE_FIELDS[kind]:
+                value(getattr(v, field))
+            position(v.line, v.column)
+        elif v is None:
+            out.append(TAG_NONE)
+        elif isinstance(v, Token):
+            out.append(TAG_TOKEN)
+            out.append(TOKEN_INDEXES[v.type])
+            string(v.value)
+            position(v.line, v.column)
+        elif isinstance(v, str):
+            out.append(TAG_STRING)
+            string(v)
+        elif type(v) is int:
+            out.append(TAG_INT)
+            varint(v << 1 if v >= 0 else (-v << 1) - 1)
+        elif isinstance(v, list):
+            out.append(TAG_LIST)
+            varint(len(v))
+            for item in v:
+                value(item)
+        else:
+            raise Exception(f"Can't serialize a {type(v).__name__} in an AST")
+
+    value(node)
+    tree = out
+    out = bytearray(MAGIC + struct.pack("<I", SCHEMA))
+    varint(len(strings))
+    for s in strings:
+        encoded = s.encode()
+        varint(len(encoded))
+        out += encoded
+    return bytes(out + tree)
+
+def loads(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise Exception("Not a serialized AST")
+    if struct.unpack_from("<I", data, len(MAGIC))[0] != SCHEMA:
+        raise Exception("Serialized AST of another pycc version")
+    rest = iter(data[len(MAGIC) + 4:])
+    read = rest.__next__
+    last_line = 0
+
+    def varint(byte=None):
+        # continues a varint whose first byte was already read
+        if byte is None:
+            byte = read()
+        if byte < 0x80:
+            return byte
+        n, shift = byte & 0x7F, 7
+        while True:
+            byte = read()
+            n |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    def value():
+        # positions are inlined, they're read for almost every node and token
+        nonlocal last_line
+        tag = read()
+        if tag < TAG_NONE:
+            cls = NODE_CLASSES[tag]
+            node = cls.__new__(cls)
+            fields = node.__dict__
+            for field in NODE_FIELDS[tag]:
+                fields[field] = value()
+            n = read()
+            if n:
+                n = (n if n < 0x80 else varint(n)) - 1
+                last_line += n >> 1 if not n & 1 else -((n + 1) >> 1)
+                column = read()
+                fields["line"] = last_line
+                fields["column"] = column if column < 0x80 else varint(column)
+            return node
+        if tag == TAG_TOKEN:
+            type, lexeme = TOKEN_TYPES[read()], strings[varint()]
+            n = read()
+            if not n:
+                return Token(type, lexeme)
+            n = (n if n < 0x80 else varint(n)) - 1
+            last_line += n >> 1 if not n & 1 else -((n + 1) >> 1)
+            column = read()
+            return Token(type, lexeme, last_line, column if column < 0x80 else varint(column))
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_LIST:
+            return [value() for _ in range(varint())]
+        if tag == TAG_STRING:
+            return strings[varint()]
+        if tag == TAG_INT:
+            n = varint()
+            return n >> 1 if not n & 1 else -((n + 1) >> 1)
+        raise Exception(f"Serialized AST has an unknown tag {tag:#x}")
+
+    # the tree has no cycles, collecting while it's built only costs time
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        strings = []
+        for _ in range(varint()):
+            length = varint()
+            encoded = bytes(islice(rest, length))
+            if len(encoded) < length:
+                raise StopIteration
+            strings.append(sys.intern(encoded.decode()))
+        node = value()
+        if next(rest, None) is not None:
+            raise Exception("Serialized AST has trailing data")
+    except StopIteration:
+        raise Exception("Serialized AST is truncated")
+    finally:
+        if collecting:
+            gc.enable()
+    return node
+
+class ASTCache:
+    # parsed programs keyed by a hash of their source, so an unchanged file isn't lexed and
+    # parsed again
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, text):
+        h = hashlib.sha256(text.encode() if isinstance(text, str) else text)
+        return os.path.join(self.directory, f"ast-{h.hexdigest()[:32]}.bin")
+
+    def load(self, text):
+        # the cached Program of `text`, or None
+        try:
+            with open(self.path(text), "rb") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception:
+            return None # written by another version or cut short, parse again
+
+    def store(self, text, program):
+        os.makedirs(self.directory, exist_ok=True)
+        # written under a temporary name, so a concurrent build never reads half a file
+        path = self.path(text)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(dumps(program))
+        os.replace(temp, path)
@@ -0,0 +1,127 @@
+# Persistent compile server: keeps the compiler imported and warm behind a Unix socket
+#
+# Protocol: the client sends one JSON request per connection
+#   {"files": [...], "output_dir": "...", "output": null, "assemble": true, "optimize": [0, [], []]}
+# and the server streams back one JSON line per compiled unit followed by
+#   {"done": true, "summary": "..."}
+
+import json
+import os
+import socket
+import socketserver
+import time
+
+from .batch import compile_unit, link_objects
+
+def default_socket_path():
+    return f"/tmp/pycc-{os.getuid()}.sock"
+
+def request_error(request):
+    # what's wrong with the fields of a request, None if they have the types the handler expects
+    def is_str_list(value):
+        return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+    if not is_str_list(request.get("files", [])):
+        return "`files` must be a list of paths"
+    if not isinstance(request.get("output_dir", "./bin"), str):
+        return "`output_dir` must be a string"
+    if not isinstance(request.get("output"), (str, type(None))):
+        return "`output` must be a string or null"
+    for field in ("assemble", "debug"):
+        if not isinstance(request.get(field, False), bool):
+            return f"`{field}` must be true or false"
+    optimize = request.get("optimize", [0, [], []])
+    if not (isinstance(optimize, list) and len(optimize) == 3 and type(optimize[0]) is int
+            and is_str_list(optimize[1]) and is_str_list(optimize[2])):
+        return "`optimize` must be [level, [disabled passes], [enabled passes]]"
+    return None
+
+class CompileHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return # connected and closed without a request, e.g. another server checking the socket
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            self.send({"done": True, "error": f"Invalid request: {e}"})
+            return
+        if not isinstance(request, dict):
+            self.send({"done": True, "error": f"Invalid request: expected a JSON object, got {type(request).__name__}"})
+            return
+        error = request_error(request)
+        if error is not None:
+            self.send({"done": True, "error": f"Invalid request: {error}"})
+            return
+
+        if request.get("shutdown"):
+            self.send({"done": True, "summary": "Server stopped."})
+            # handlers run on their own threads, so this can wait for serve_forever to return
+            self.server.shutdown()
+            return
+
+        output_dir = request.get("output_dir", "./bin")
+        output_exe = request.get("output")
+        assemble = request.get("assemble", True)
+        level, disabled, enabled = request.get("optimize", [0, [], []])
+        debug = request.get("debug", False)
+        os.makedirs(output_dir, exist_ok=True)
+
+        start = time.perf_counter()
+        results = []
+        for file_path in request.get("files", []):
+            result = compile_unit(file_path, output_dir, link=output_exe is None and assemble, assemble=assemble,
+                                  optimize=(level, tuple(disabled), tuple(enabled)), debug=debug)
+            results.append(result)
+            self.send({
+                "file": result.file_path,
+                "asm": result.asm_file,
+                "object": result.object_file,
+                "exe": result.output_exe,
+                "error": result.error,
+                "seconds": result.seconds,
+            })
+
+        failed = [r for r in results if r.error]
+        reply = {"done": True}
+        if output_exe is not None and assemble and results and not failed:
+            try:
+                reply["exe"] = link_objects([r.object_file for r in results], os.path.join(output_dir, output_exe))
+            except Exception as e:
+                reply["error"] = f"Linking failed: {e}"
+        reply["summary"] = (f"Compiled {len(results) - len(failed)}/{len(results)} unit(s) "
+                            f"in {time.perf_counter() - start:.3f}s")
+        self.send(reply)
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        if os.path.exists(socket_path):
+            # a socket left behind by a server that died is replaced, a live one is not
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(socket_path)
+                except OSError:
+                    os.unlink(socket_path)
+                else:
+                    raise Exception(f"Another pycc server is already listening on {socket_path}")
+        super().__init__(socket_path, CompileHandler)
+        self.socket_path = socket_path
+
+def serve(socket_path=None):
+    socket_path = socket_path or default_socket_path()
+    server = CompileServer(socket_path)
+    print(f"pycc server listening on {socket_path}")
+    try:
+        server.serve_forever(poll_interval=0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
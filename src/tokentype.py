@@ -43,3 +43,8 @@ class TokenType(Enum):
     BREAK = auto()
     CONTINUE = auto()
     COMMA = auto()
+    SWITCH = auto()
+    CASE = auto()
+    DEFAULT = auto()
+    LEFT_BRACKET = auto()
+    RIGHT_BRACKET = auto()
@@ -0,0 +1,746 @@
+# Bytecode backend: compiles the resolved AST to register bytecode and runs it, so a
+# program's result is available without nasm, gcc or a new process (`--run`)
+#
+# Every function becomes a flat array of ints: an opcode followed by its operands, which are
+# register numbers, immediates or code offsets to jump to. Locals and temporaries live in the
+# frame's registers; arrays and variables whose address is taken live in the VM's memory, a
+# list of cells shared by all frames, and pointers are indexes into it. Every int and every
+# pointer takes one cell, so pointer arithmetic counts cells. Arithmetic wraps around at 32
+# bits like the native code. Calls push the caller's state on a list instead of recursing in
+# Python, so deep recursion only costs memory.
+
+from array import array
+
+from .parser import *
+from .resolve import Resolver, switch_statements, is_pointer, wrap
+from .tokentype import TokenType
+
+# opcodes, with their operands: d(estination), a, b (registers), i(mmediate), t(arget)
+MOVE = 0        # d a
+CONST = 1       # d i
+ADD = 2         # d a b
+ADDI = 3        # d a i
+SUB = 4         # d a b
+MUL = 5         # d a b
+DIV = 6         # d a b
+MOD = 7         # d a b
+AND = 8         # d a b
+OR = 9          # d a b
+XOR = 10        # d a b
+SHL = 11        # d a b
+SHR = 12        # d a b
+NEG = 13        # d a
+NOT = 14        # d a
+LNOT = 15       # d a
+EQ = 16         # d a b, and so on to GE: 1 if the comparison holds, else 0
+NE = 17
+LT = 18
+LE = 19
+GT = 20
+GE = 21
+JUMP = 22       # t
+JZ = 23         # a t
+JNZ = 24        # a t
+JEQ = 25        # a b t, and so on to JGE: jump if the comparison holds
+JNE = 26
+JLT = 27
+JLE = 28
+JGT = 29
+JGE = 30
+JEQI = 31       # a i t, and so on to JGEI: comparison with an immediate
+JNEI = 32
+JLTI = 33
+JLEI = 34
+JGTI = 35
+JGEI = 36
+PADD = 37       # d a b, pointer arithmetic doesn't wrap
+PSUB = 38       # d a b
+ADDR = 39       # d i: address of the frame's memory cell i
+LOAD = 40       # d a: the cell a points to
+STORE = 41      # a b: b into the cell a points to
+LOADL = 42      # d i: the frame's memory cell i
+STOREL = 43     # i a
+CALL = 44       # d i(function) a(first argument) i(argument count)
+RET = 45        # a
+SWITCH = 46     # a i(table)
+
+OPCODE_NAMES = {value: name for name, value in globals().items() if name.isupper() and isinstance(value, int)}
+# operand counts of the opcodes that don't have three
+OPERANDS = {MOVE: 2, CONST: 2, NEG: 2, NOT: 2, LNOT: 2, JUMP: 1, JZ: 2, JNZ: 2, ADDR: 2, LOAD: 2,
+            STORE: 2, LOADL: 2, STOREL: 2, CALL: 4, RET: 1, SWITCH: 2}
+
+BINARY_OPS = {
+    TokenType.PLUS: ADD, TokenType.MINUS: SUB, TokenType.STAR: MUL, TokenType.SLASH: DIV,
+    TokenType.PERCENT: MOD, TokenType.BITWISE_AND: AND, TokenType.BITWISE_OR: OR,
+    TokenType.BITWISE_XOR: XOR, TokenType.BITWISE_SHIFT_LEFT: SHL, TokenType.BITWISE_SHIFT_RIGHT: SHR,
+    TokenType.EQUAL: EQ, TokenType.NOT_EQUAL: NE, TokenType.LESS_THAN: LT,
+    TokenType.LESS_THAN_OR_EQUAL: LE, TokenType.GREATER_THAN: GT, TokenType.GREATER_THAN_OR_EQUAL: GE,
+}
+UNARY_OPS = {TokenType.MINUS: NEG, TokenType.BITWISE_COMPLEMENT: NOT, TokenType.LOGICAL_NEGATION: LNOT}
+# conditional jump of every comparison, its negation and the version with an immediate
+BRANCHES = {EQ: JEQ, NE: JNE, LT: JLT, LE: JLE, GT: JGT, GE: JGE}
+NEGATED = {EQ: NE, NE: EQ, LT: GE, LE: GT, GT: LE, GE: LT}
+IMMEDIATE = {JEQ: JEQI, JNE: JNEI, JLT: JLTI, JLE: JLEI, JGT: JGTI, JGE: JGEI}
+
+MAX_FRAMES = 1 << 20 # calls deeper than this are a stack overflow
+# exit statuses of faults, those of a native build killed by SIGSEGV and SIGFPE
+FAULT_SEGV = 128 + 11
+FAULT_ARITHMETIC = 128 + 8
+
+class RuntimeFault(Exception):
+    # the program faulted while running, as opposed to failing to compile
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+class CodeObject:
+    # one compiled function
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.code = array("i")
+        self.registers = params     # parameters come first
+        self.memory = 0             # cells of arrays and variables whose address is taken
+        self.tables = []            # of SWITCH: ({value: target}, default target)
+
+    def disassemble(self):
+        lines, pc = [], 0
+        while pc < len(self.code):
+            op = self.code[pc]
+            n = OPERANDS.get(op, 3)
+            lines.append(f"{pc:>5}  {OPCODE_NAMES[op]:<7}" + " ".join(str(x) for x in self.code[pc + 1:pc + 1 + n]))
+            pc += 1 + n
+        return "\n".join(lines)
+
+class Label:
+    def __init__(self):
+        self.target = None
+        self.uses = []              # code offsets to patch with the target
+
+class BytecodeCompiler:
+    def __init__(self, passes=None):
+        self.passes = passes
+        self.functions = {}         # name -> index in self.code_objects
+        self.code_objects = []
+        self.statements = dispatch_table(type(self), "statement")
+        self.expressions = dispatch_table(type(self), "expression")
+
+    def compile_program(self, program):
+        resolver = Resolver()
+        resolver.resolve_program(program)
+        functions = [f for f in program.function_list if isinstance(f, Function) and f.body]
+        for function in functions:
+            self.functions[function.name] = len(self.code_objects)
+            self.code_objects.append(CodeObject(function.name, len(function.parameters)))
+        for function in functions:
+            if self.passes:
+                function = self.passes.run_ast(function)
+                # passes can drop declarations, bind the names again
+                resolver.resolve_function(function)
+                resolver.check()
+            self.compile_function(function)
+        return self.code_objects
+
+    def compile_function(self, node):
+        self.code = self.code_objects[self.functions[node.name]]
+        self.out = self.code.code
+        self.places = {}            # Symbol -> ("register", n) or ("memory", cell)
+        self.loops = []             # (continue label, break label) of the enclosing loops and switches
+        self.side_effects = {}
+
+        for i, param in enumerate(node.parameters):
+            self.places[param.symbol] = ("register", i)
+        self.allocate(node.body)
+        self.variables = self.next_register = self.code.registers
+        for i, param in enumerate(node.parameters):
+            kind, place = self.places[param.symbol]
+            if kind == "memory":
+                self.emit(STOREL, place, i)
+
+        self.statement(node.body.statements if isinstance(node.body, Block) else node.body)
+        # falling off the end returns 0
+        register = self.temporary()
+        self.emit(CONST, register, 0)
+        self.emit(RET, register)
+
+    def allocate(self, body):
+        # a register or memory cells for every variable of the function, before any code;
+        # address-taken parameters get their cell and are copied there on entry
+        params = list(self.places)
+        for symbol in params:
+            if not symbol.register_candidate:
+                self.places[symbol] = ("memory", self.code.memory)
+                self.code.memory += 1
+        stack = [body]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Declaration):
+                symbol = item.symbol
+                if symbol not in self.places:
+                    if symbol.register_candidate:
+                        self.places[symbol] = ("register", self.code.registers)
+                        self.code.registers += 1
+                    else:
+                        self.places[symbol] = ("memory", self.code.memory)
+                        self.code.memory += symbol.size if symbol.size is not None else 1
+            if isinstance(item, ASTNode):
+                stack.extend(v for v in vars(item).values() if isinstance(v, (ASTNode, list)))
+            elif isinstance(item, list):
+                stack.extend(item)
+
+    # code output
+
+    def emit(self, *words):
+        self.out.extend(words)
+
+    def jump(self, label, *words):
+        # a jump instruction whose last operand is the label's target
+        self.out.extend(words)
+        self.out.append(0)
+        if label.target is None:
+            label.uses.append(len(self.out) - 1)
+        else:
+            self.out[-1] = label.target
+
+    def bind(self, label):
+        label.target = len(self.out)
+        for use in label.uses:
+            self.out[use] = label.target
+
+    def temporary(self):
+        register = self.next_register
+        self.next_register += 1
+        self.code.registers = max(self.code.registers, self.next_register)
+        return register
+
+    def has_side_effects(self, node):
+        # whether evaluating the node can change a variable
+        key = id(node)
+        if key not in self.side_effects:
+            if isinstance(node, (Assign, Store, FunctionCall)):
+                result = True
+            elif isinstance(node, ASTNode):
+                result = any(self.has_side_effects(v) for v in vars(node).values() if isinstance(v, (ASTNode, list)))
+            elif isinstance(node, list):
+                result = any(self.has_side_effects(v) for v in node)
+            else:
+                result = False
+            self.side_effects[key] = result
+        return self.side_effects[key]
+
+    # statements
+
+    def statement(self, node):
+        # temporaries of one statement are free again after it
+        mark = self.next_register
+        if isinstance(node, list):
+            for stmt in node:
+                self.statement(stmt)
+        elif node is not None:
+            method = self.statements[type(node)]
+            if method is not None:
+                method(self, node)
+            else:
+                self.expression(node)
+        self.next_register = mark
+
+    def statement_Block(self, node):
+        self.statement(node.statements)
+
+    def statement_FunctionDeclaration(self, node):
+        pass
+
+    def statement_Declaration(self, node):
+        kind, place = self.places[node.symbol]
+        if node.size is not None:
+            return # arrays start out uninitialized, as in C
+        if kind == "register":
+            if node.exp is not None:
+                self.expression(node.exp, place)
+            else:
+                self.emit(CONST, place, 0)
+        else:
+            register = self.expression(node.exp) if node.exp is not None else self.constant(0)
+            self.emit(STOREL, place, register)
+
+    def statement_ReturnStatement(self, node):
+        register = self.expression(node.expression) if node.expression else self.constant(0)
+        self.emit(RET, register)
+
+    def statement_Conditional(self, node):
+        otherwise, end = Label(), Label()
+        self.branch(node.condition, otherwise, False)
+        self.statement(node.if_stmt)
+        if node.else_stmt is not None:
+            self.jump(end, JUMP)
+        self.bind(otherwise)
+        if node.else_stmt is not None:
+            self.statement(node.else_stmt)
+        self.bind(end)
+
+    def loop(self, body, condition, update=None):
+        # the body, then the update, then the condition, which jumps back to the body
+        start, step, test, end = Label(), Label(), Label(), Label()
+        if condition is not None:
+            self.jump(test, JUMP)
+        self.bind(start)
+        self.loops.append((step, end))
+        self.statement(body)
+        self.loops.pop()
+        self.bind(step)
+        self.statement(update)
+        self.bind(test)
+        if condition is not None:
+            self.branch(condition, start, True)
+        else:
+            self.jump(start, JUMP)
+        self.bind(end)
+
+    def statement_For(self, node):
+        self.statement(node.init)
+        self.loop(node.stmt, node.condition, node.update)
+
+    def statement_While(self, node):
+        self.loop(node.stmt, node.condition)
+
+    def statement_Do(self, node):
+        start, step, end = Label(), Label(), Label()
+        self.bind(start)
+        self.loops.append((step, end))
+        self.statement(node.stmt)
+        self.loops.pop()
+        self.bind(step)
+        self.branch(node.exp, start, True)
+        self.bind(end)
+
+    def statement_Break(self, node):
+        self.jump(self.loops[-1][1], JUMP)
+
+    def statement_Continue(self, node):
+        # switches don't catch continue, the enclosing loop does
+        for step, _ in reversed(self.loops):
+            if step is not None:
+                self.jump(step, JUMP)
+                return
+        raise Exception("`continue` outside of a loop")
+
+    def statement_Switch(self, node):
+        register = self.expression(node.condition)
+        end = Label()
+        labels = {id(case): Label() for case in node.cases}
+        if node.default is not None:
+            labels[id(node.default)] = Label()
+        table = len(self.code.tables)
+        self.code.tables.append(None)
+        self.emit(SWITCH, register, table)
+
+        self.loops.append((None, end))
+        for case_labels, stmt in switch_statements(node):
+            for case in case_labels:
+                if id(case) in labels:
+                    self.bind(labels[id(case)])
+            self.statement(stmt)
+        self.loops.pop()
+        self.bind(end)
+        default = labels[id(node.default)].target if node.default is not None else end.target
+        self.code.tables[table] = ({case.constant: labels[id(case)].target for case in node.cases}, default)
+
+    # conditions
+
+    def branch(self, node, label, when):
+        # jumps to the label if the node's truth is `when`
+        if isinstance(node, BinaryOps) and node.op.type in (TokenType.AND, TokenType.OR):
+            if (node.op.type == TokenType.AND) != when:
+                # either operand decides on its own
+                self.branch(node.left, label, when)
+                self.branch(node.right, label, when)
+            else:
+                skip = Label()
+                self.branch(node.left, skip, not when)
+                self.branch(node.right, label, when)
+                self.bind(skip)
+            return
+        if isinstance(node, UnaryOps) and node.op.type == TokenType.LOGICAL_NEGATION:
+            self.branch(node.right, label, not when)
+            return
+        if isinstance(node, Number):
+            if (wrap(int(node.value.value)) != 0) == when:
+                self.jump(label, JUMP)
+            return
+        if isinstance(node, BinaryOps) and BINARY_OPS.get(node.op.type) in BRANCHES:
+            compare = BINARY_OPS[node.op.type]
+            if not when:
+                compare = NEGATED[compare]
+            mark = self.next_register
+            left = self.operand(node.left, node.right)
+            if isinstance(node.right, Number):
+                self.jump(label, IMMEDIATE[BRANCHES[compare]], left, wrap(int(node.right.value.value)))
+            else:
+                self.jump(label, BRANCHES[compare], left, self.expression(node.right))
+            self.next_register = mark
+            return
+        self.jump(label, JNZ if when else JZ, self.expression(node))
+
+    # expressions
+
+    def constant(self, value, target=None):
+        register = self.temporary() if target is None else target
+        self.emit(CONST, register, value)
+        return register
+
+    def operand(self, node, later):
+        # the register of an operand evaluated first; a variable's register is copied when
+        # evaluating `later` could assign to it
+        register = self.expression(node)
+        if register < self.variables and self.has_side_effects(later):
+            copy = self.temporary()
+            self.emit(MOVE, copy, register)
+            return copy
+        return register
+
+    def expression(self, node, target=None):
+        # evaluates the node, into `target` if given; returns the register of the value
+        method = self.expressions[type(node)]
+        if method is None:
+            raise Exception(f"The bytecode VM can't evaluate a {type(node).__name__}")
+        register = method(self, node, target)
+        if target is not None and register != target:
+            self.emit(MOVE, target, register)
+            return target
+        return register
+
+    def expression_Number(self, node, target):
+        return self.constant(wrap(int(node.value.value)), target)
+
+    def expression_Variable(self, node, target):
+        kind, place = self.places[node.symbol]
+        if kind == "register":
+            return place
+        register = self.temporary() if target is None else target
+        # an array evaluates to the address of its first element
+        self.emit(ADDR if node.symbol.size is not None else LOADL, register, place)
+        return register
+
+    def expression_Assign(self, node, target):
+        kind, place = self.places[node.symbol]
+        if kind == "register":
+            return self.expression(node.exp, place)
+        register = self.expression(node.exp, target)
+        self.emit(STOREL, place, register)
+        return register
+
+    def expression_UnaryOps(self, node, target):
+        operand = self.expression(node.right)
+        register = self.temporary() if target is None else target
+        self.emit(UNARY_OPS[node.op.type], register, operand)
+        return register
+
+    def expression_BinaryOps(self, node, target):
+        op = node.op.type
+        if op in (TokenType.AND, TokenType.OR):
+            register = self.temporary() if target is None else target
+            false, end = Label(), Label()
+            self.branch(node, false, False)
+            self.emit(CONST, register, 1)
+            self.jump(end, JUMP)
+            self.bind(false)
+            self.emit(CONST, register, 0)
+            self.bind(end)
+            return register
+
+        code = BINARY_OPS.get(op)
+        if code is None:
+            raise Exception(f"The bytecode VM can't evaluate binary {node.op.value}")
+        if is_pointer(getattr(node.left, "ctype", None)) or is_pointer(getattr(node.right, "ctype", None)):
+            # cells are the elements, pointer arithmetic doesn't scale
+            code = {ADD: PADD, SUB: PSUB}.get(code, code)
+        mark = self.next_register
+        left = self.operand(node.left, node.right)
+        if code in (ADD, SUB) and isinstance(node.right, Number):
+            value = wrap(int(node.right.value.value))
+            self.next_register = mark
+            register = self.temporary() if target is None else target
+            self.emit(ADDI, register, left, value if code == ADD else wrap(-value))
+            return register
+        right = self.expression(node.right)
+        self.next_register = mark
+        register = self.temporary() if target is None else target
+        self.emit(code, register, left, right)
+        return register
+
+    def expression_Conditional(self, node, target):
+        # a ternary: both branches leave their value in the same register
+        register = self.temporary() if target is None else target
+        otherwise, end = Label(), Label()
+        self.branch(node.condition, otherwise, False)
+        self.expression(node.if_stmt, register)
+        self.jump(end, JUMP)
+        self.bind(otherwise)
+        self.expression(node.else_stmt, register)
+        self.bind(end)
+        return register
+
+    def expression_FunctionCall(self, node, target):
+        name = node.name.value
+        if name not in self.functions:
+            raise Exception(f"Function `{name}` is declared but not defined, the bytecode VM can't call it")
+        # the arguments go to consecutive registers
+        first = self.next_register
+        for _ in node.params:
+            self.temporary()
+        for i, arg in enumerate(node.params):
+            self.expression(arg, first + i)
+        self.next_register = first
+        register = self.temporary() if target is None else target
+        self.emit(CALL, register, self.functions[name], first, len(node.params))
+        return register
+
+    def address(self, node):
+        # register with the address of an lvalue
+        if isinstance(node, Variable):
+            kind, place = self.places[node.symbol]
+            if kind != "memory":
+                raise Exception(f"Address of register variable `{node.name.value}`")
+            register = self.temporary()
+            self.emit(ADDR, register, place)
+            return register
+        if isinstance(node, Subscript):
+            mark = self.next_register
+            index = self.operand(node.index, node.array)
+            array = self.expression(node.array)
+            self.next_register = mark
+            register = self.temporary()
+            self.emit(PADD, register, array, index)
+            return register
+        if isinstance(node, Dereference):
+            return self.expression(node.operand)
+        raise Exception(f"Cannot take the address of {type(node).__name__}")
+
+    def expression_Subscript(self, node, target):
+        address = self.address(node)
+        register = self.temporary() if target is None else target
+        self.emit(LOAD, register, address)
+        return register
+
+    def expression_Dereference(self, node, target):
+        address = self.expression(node.operand)
+        register = self.temporary() if target is None else target
+        self.emit(LOAD, register, address)
+        return register
+
+    def expression_AddressOf(self, node, target):
+        return self.address(node.operand)
+
+    def expression_Store(self, node, target):
+        address = self.address(node.target)
+        value = self.expression(node.exp, target)
+        self.emit(STORE, address, value)
+        return value
+
+class VM:
+    def __init__(self, code_objects):
+        self.code_objects = code_objects
+        self.memory = []
+        self.calls = 0              # made by the last run
+
+    def run(self, name="main", args=()):
+        # runs a function to its return and gives its value
+        names = [c.name for c in self.code_objects]
+        if name not in names:
+            raise Exception(f"No function `{name}` to run")
+        return self.execute(names.index(name), list(args))
+
+    def execute(self, index, args):
+        functions = [(c.code.tolist(), c.registers, c.memory, c.tables) for c in self.code_objects]
+        memory = self.memory
+        frames = []
+        calls = 0
+
+        code, size, cells, tables = functions[index]
+        regs = [0] * size
+        regs[:len(args)] = args
+        base = 0
+        top = cells
+        if top > len(memory):
+            memory.extend([0] * (top - len(memory)))
+        pc = 0
+        while True:
+            op = code[pc]
+            if op == ADDI:
+                v = regs[code[pc + 2]] + code[pc + 3]
+                if not -0x80000000 <= v <= 0x7FFFFFFF:
+                    v = ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                regs[code[pc + 1]] = v
+                pc += 4
+            elif op == MOVE:
+                regs[code[pc + 1]] = regs[code[pc + 2]]
+                pc += 3
+            elif op == JLT:
+                pc = code[pc + 3] if regs[code[pc + 1]] < regs[code[pc + 2]] else pc + 4
+            elif op == JGE:
+                pc = code[pc + 3] if regs[code[pc + 1]] >= regs[code[pc + 2]] else pc + 4
+            elif op == JLTI:
+                pc = code[pc + 3] if regs[code[pc + 1]] < code[pc + 2] else pc + 4
+            elif op == JGEI:
+                pc = code[pc + 3] if regs[code[pc + 1]] >= code[pc + 2] else pc + 4
+            elif op == JEQI:
+                pc = code[pc + 3] if regs[code[pc + 1]] == code[pc + 2] else pc + 4
+            elif op == JNEI:
+                pc = code[pc + 3] if regs[code[pc + 1]] != code[pc + 2] else pc + 4
+            elif op == ADD:
+                v = regs[code[pc + 2]] + regs[code[pc + 3]]
+                if not -0x80000000 <= v <= 0x7FFFFFFF:
+                    v = ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                regs[code[pc + 1]] = v
+                pc += 4
+            elif op == CONST:
+                regs[code[pc + 1]] = code[pc + 2]
+                pc += 3
+            elif op == JUMP:
+                pc = code[pc + 1]
+            elif op == CALL:
+                calls += 1
+                if len(frames) >= MAX_FRAMES:
+                    raise RuntimeFault("Stack overflow in the bytecode VM", FAULT_SEGV)
+                first, count = code[pc + 3], code[pc + 4]
+                frames.append((code, pc + 5, regs, base, top, tables, code[pc + 1]))
+                code, size, cells, tables = functions[code[pc + 2]]
+                callee = [0] * size
+                callee[:count] = regs[first:first + count]
+                regs = callee
+                base = top
+                top += cells
+                if top > len(memory):
+                    memory.extend([0] * (top - len(memory) + 1024))
+                pc = 0
+            elif op == RET:
+                v = regs[code[pc + 1]]
+                if not frames:
+                    self.calls = calls
+                    return v
+                code, pc, regs, base, top, tables, d = frames.pop()
+                regs[d] = v
+            elif op == LOAD:
+                address = regs[code[pc + 2]]
+                if not 0 <= address < len(memory):
+                    raise RuntimeFault(f"Read outside of memory at address {address}", FAULT_SEGV)
+                regs[code[pc + 1]] = memory[address]
+                pc += 3
+            elif op == STORE:
+                address = regs[code[pc + 1]]
+                if not 0 <= address < len(memory):
+                    raise RuntimeFault(f"Write outside of memory at address {address}", FAULT_SEGV)
+                memory[address] = regs[code[pc + 2]]
+                pc += 3
+            elif op == PADD:
+                regs[code[pc + 1]] = regs[code[pc + 2]] + regs[code[pc + 3]]
+                pc += 4
+            elif op == LOADL:
+                regs[code[pc + 1]] = memory[base + code[pc + 2]]
+                pc += 3
+            elif op == STOREL:
+                memory[base + code[pc + 1]] = regs[code[pc + 2]]
+                pc += 3
+            elif op == ADDR:
+                regs[code[pc + 1]] = base + code[pc + 2]
+                pc += 3
+            elif op == JZ:
+                pc = code[pc + 2] if not regs[code[pc + 1]] else pc + 3
+            elif op == JNZ:
+                pc = code[pc + 2] if regs[code[pc + 1]] else pc + 3
+            elif op == JEQ:
+                pc = code[pc + 3] if regs[code[pc + 1]] == regs[code[pc + 2]] else pc + 4
+            elif op == JNE:
+                pc = code[pc + 3] if regs[code[pc + 1]] != regs[code[pc + 2]] else pc + 4
+            elif op == JLE:
+                pc = code[pc + 3] if regs[code[pc + 1]] <= regs[code[pc + 2]] else pc + 4
+            elif op == JGT:
+                pc = code[pc + 3] if regs[code[pc + 1]] > regs[code[pc + 2]] else pc + 4
+            elif op == JLEI:
+                pc = code[pc + 3] if regs[code[pc + 1]] <= code[pc + 2] else pc + 4
+            elif op == JGTI:
+                pc = code[pc + 3] if regs[code[pc + 1]] > code[pc + 2] else pc + 4
+            elif op == SUB:
+                v = regs[code[pc + 2]] - regs[code[pc + 3]]
+                if not -0x80000000 <= v <= 0x7FFFFFFF:
+                    v = ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                regs[code[pc + 1]] = v
+                pc += 4
+            elif op == MUL:
+                v = regs[code[pc + 2]] * regs[code[pc + 3]]
+                if not -0x80000000 <= v <= 0x7FFFFFFF:
+                    v = ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                regs[code[pc + 1]] = v
+                pc += 4
+            elif op == DIV or op == MOD:
+                a, b = regs[code[pc + 2]], regs[code[pc + 3]]
+                if b == 0:
+                    raise RuntimeFault("Division by zero", FAULT_ARITHMETIC)
+                # C division truncates toward zero
+                q = abs(a) // abs(b)
+                if (a < 0) != (b < 0):
+                    q = -q
+                v = q if op == DIV else a - q * b
+                if not -0x80000000 <= v <= 0x7FFFFFFF:
+                    raise RuntimeFault("Division overflow", FAULT_ARITHMETIC)
+                regs[code[pc + 1]] = v
+                pc += 4
+            elif op == AND:
+                regs[code[pc + 1]] = regs[code[pc + 2]] & regs[code[pc + 3]]
+                pc += 4
+            elif op == OR:
+                regs[code[pc + 1]] = regs[code[pc + 2]] | regs[code[pc + 3]]
+                pc += 4
+            elif op == XOR:
+                regs[code[pc + 1]] = regs[code[pc + 2]] ^ regs[code[pc + 3]]
+                pc += 4
+            elif op == SHL:
+                v = regs[code[pc + 2]] << (regs[code[pc + 3]] & 31)
+                regs[code[pc + 1]] = ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                pc += 4
+            elif op == SHR:
+                regs[code[pc + 1]] = regs[code[pc + 2]] >> (regs[code[pc + 3]] & 31)
+                pc += 4
+            elif op == NEG:
+                v = -regs[code[pc + 2]]
+                regs[code[pc + 1]] = v if v != 0x80000000 else -0x80000000
+                pc += 3
+            elif op == NOT:
+                regs[code[pc + 1]] = ~regs[code[pc + 2]]
+                pc += 3
+            elif op == LNOT:
+                regs[code[pc + 1]] = 0 if regs[code[pc + 2]] else 1
+                pc += 3
+            elif op == EQ:
+                regs[code[pc + 1]] = 1 if regs[code[pc + 2]] == regs[code[pc + 3]] else 0
+                pc += 4
+            elif op == NE:
+                regs[code[pc + 1]] = 1 if regs[code[pc + 2]] != regs[code[pc + 3]] else 0
+                pc += 4
+            elif op == LT:
+                regs[code[pc + 1]] = 1 if regs[code[pc + 2]] < regs[code[pc + 3]] else 0
+                pc += 4
+            elif op == LE:
+                regs[code[pc + 1]] = 1 if regs[code[pc + 2]] <= regs[code[pc + 3]] else 0
+                pc += 4
+            elif op == GT:
+                regs[code[pc + 1]] = 1 if regs[code[pc + 2]] > regs[code[pc + 3]] else 0
+                pc += 4
+            elif op == GE:
+                regs[code[pc + 1]] = 1 if regs[code[pc + 2]] >= regs[code[pc + 3]] else 0
+                pc += 4
+            elif op == PSUB:
+                regs[code[pc + 1]] = regs[code[pc + 2]] - regs[code[pc + 3]]
+                pc += 4
+            elif op == SWITCH:
+                targets, default = tables[code[pc + 2]]
+                pc = targets.get(regs[code[pc + 1]], default)
+            else:
+                raise Exception(f"Bad opcode {op} at {pc}")
+
+def compile_program(program, passes=None):
+    return BytecodeCompiler(passes).compile_program(program)
+
+def run_program(program, passes=None, entry="main"):
+    # compiles the program and returns what `entry` returns
+    return VM(compile_program(program, passes)).run(entry)